@@ -0,0 +1,115 @@
+from typing import Iterable, Optional
+
+import numpy as np
+
+from framing import AudioFrame, Codec, FrameError
+from resampler import StreamingResampler
+
+try:
+    import opuslib
+except ImportError:  # optional: without it clients fall back to PCM16
+    opuslib = None
+
+TARGET_RATE = 16000
+# Longest Opus packet (120 ms) at the decoder's output rate.
+OPUS_MAX_FRAME = TARGET_RATE * 120 // 1000
+# Lost packets concealed per gap; longer gaps are left silent rather than
+# filled with synthesized audio.
+MAX_CONCEALED_PACKETS = 5
+
+CODEC_NAMES = {"pcm16": Codec.PCM16, "opus": Codec.OPUS}
+
+
+def available_codecs() -> list[Codec]:
+    """Codecs this server can decode, preferred first."""
+    codecs = [Codec.PCM16]
+    if opuslib is not None:
+        codecs.insert(0, Codec.OPUS)
+    return codecs
+
+
+def negotiate(offered: Optional[Iterable[str]]) -> Codec:
+    """
+    Pick the codec for a connection from the client's offer.
+
+    Args:
+        offered: Codec names in the client's order of preference, e.g. from
+            a ``?codecs=opus,pcm16`` query string. If None, the client
+            predates negotiation and sends PCM16
+
+    Returns:
+        The client's first choice this server supports, or PCM16
+    """
+    supported = available_codecs()
+    for name in offered or ():
+        codec = CODEC_NAMES.get(name.strip().lower())
+        if codec in supported:
+            return codec
+    return Codec.PCM16
+
+
+class OpusDecoder:
+    """Stateful Opus decoder producing 16 kHz mono int16.
+
+    Opus decodes natively at 16 kHz whatever rate the client encoded at, so
+    no resampling is needed afterwards.
+    """
+
+    def __init__(self):
+        if opuslib is None:
+            raise FrameError("Opus frames received but opuslib is not installed")
+        self._decoder = opuslib.Decoder(TARGET_RATE, 1)
+        self._last_frame = TARGET_RATE * 20 // 1000
+
+    def decode(self, packet: memoryview) -> np.ndarray:
+        pcm = self._decoder.decode(bytes(packet), OPUS_MAX_FRAME)
+        samples = np.frombuffer(pcm, dtype="<i2")
+        self._last_frame = len(samples) or self._last_frame
+        return samples
+
+    def conceal(self, packets: int) -> np.ndarray:
+        """Synthesize audio for lost packets from the decoder's state."""
+        out = [
+            np.frombuffer(self._decoder.decode(b"", self._last_frame), dtype="<i2")
+            for _ in range(min(packets, MAX_CONCEALED_PACKETS))
+        ]
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.int16)
+
+    def reset(self) -> None:
+        self._decoder.reset_state()
+
+
+class StreamDecoder:
+    """Turns one client's frames into 16 kHz int16, whatever their codec.
+
+    Keeps the per-stream state of every decoder (Opus state, resampler
+    history), so it must not be shared between streams.
+    """
+
+    def __init__(self):
+        self.resampler: Optional[StreamingResampler] = None
+        self.opus: Optional[OpusDecoder] = None
+
+    def decode(self, frame: AudioFrame, lost: int = 0) -> np.ndarray:
+        """
+        Decode a frame to 16 kHz.
+
+        Args:
+            frame: Parsed frame
+            lost: Frames missing right before this one, concealed for Opus
+        """
+        if frame.codec == Codec.OPUS:
+            if self.opus is None:
+                self.opus = OpusDecoder()
+            samples = self.opus.decode(frame.payload)
+            if lost:
+                samples = np.concatenate((self.opus.conceal(lost), samples))
+            return samples
+        return self.resample(frame.samples(), frame.sample_rate)
+
+    def resample(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        if sample_rate == TARGET_RATE:
+            return samples
+        if self.resampler is None or self.resampler.src_rate != sample_rate:
+            self.resampler = StreamingResampler(sample_rate, TARGET_RATE)
+        return np.frombuffer(self.resampler.process(samples), dtype=np.int16)
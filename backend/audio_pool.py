@@ -0,0 +1,325 @@
+"""Resampling in worker processes, fed through shared-memory ring buffers.
+
+Resampling runs in every session's feeder thread (and, on a gateway, on the
+event loop), and the sparse products of :class:`StreamingResampler` hold the
+GIL: with many 44.1/48 kHz streams, the socket process spends its time
+resampling instead of serving sockets, on one core however many the host has.
+
+:class:`AudioProcessPool` moves that work to worker processes. Each stream is
+pinned to one worker, which keeps its resampler state, and gets two
+:class:`SharedRing` buffers in shared memory: samples go in through one and
+come back at 16 kHz through the other, so no audio is pickled. Only a short
+control message crosses the worker's pipe per chunk; the pipe's system calls
+also order the ring writes between processes.
+
+Enabled with ``RESAMPLE_PROCESSES`` (see server/app.py); bench_audio_pool.py
+measures how many streams a host sustains with and without it.
+"""
+
+import itertools
+import multiprocessing
+import os
+import threading
+from multiprocessing.connection import Connection
+from multiprocessing.shared_memory import SharedMemory
+from typing import Optional
+
+import numpy as np
+
+from audio_codecs import TARGET_RATE
+from resampler import StreamingResampler
+
+# Capacity of each ring; a feed is at most FEED_SECONDS (see sessions.py),
+# larger inputs go through in several rounds.
+RING_SECONDS = 2
+# Client rates whose filters the workers design before the first stream.
+COMMON_RATES = (44100, 48000, 22050, 8000)
+
+
+class SharedRing:
+    """Single-producer, single-consumer ring of int16 samples in shared memory.
+
+    Two int64 counters (samples ever written, ever read) head the block; each
+    is only advanced by its own side.
+    """
+
+    HEADER_BYTES = 16
+
+    def __init__(self, capacity: int, name: Optional[str] = None):
+        """
+        Create a ring, or attach to the ring ``name`` created by another process.
+
+        Args:
+            capacity: Samples the ring holds; must match the creator's
+            name: Shared memory block to attach to. If None, a new one is
+                created and unlinked by :meth:`close`
+        """
+        self.capacity = capacity
+        self.owner = name is None
+        size = self.HEADER_BYTES + 2 * capacity
+        self.shm = SharedMemory(create=True, size=size) if self.owner else SharedMemory(name=name)
+        self._counters = np.ndarray(2, dtype=np.int64, buffer=self.shm.buf)
+        self._data = np.ndarray(
+            capacity, dtype=np.int16, buffer=self.shm.buf, offset=self.HEADER_BYTES
+        )
+        if self.owner:
+            self._counters[:] = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __len__(self) -> int:
+        return int(self._counters[0] - self._counters[1])
+
+    def write(self, samples: np.ndarray) -> int:
+        """
+        Append as many of ``samples`` as fit.
+
+        Returns:
+            Number of samples written
+        """
+        written, read = self._counters
+        count = min(len(samples), self.capacity - int(written - read))
+        start = int(written % self.capacity)
+        first = min(count, self.capacity - start)
+        self._data[start : start + first] = samples[:first]
+        self._data[: count - first] = samples[first:count]
+        self._counters[0] = written + count
+        return count
+
+    def read(self, max_samples: Optional[int] = None) -> np.ndarray:
+        """Take up to ``max_samples`` (default: all) queued samples."""
+        written, read = self._counters
+        count = int(written - read)
+        if max_samples is not None:
+            count = min(count, max_samples)
+        start = int(read % self.capacity)
+        first = min(count, self.capacity - start)
+        samples = np.concatenate((self._data[start : start + first], self._data[: count - first]))
+        self._counters[1] = read + count
+        return samples
+
+    def close(self) -> None:
+        # Views into the block must go before it can be closed.
+        self._counters = self._data = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _serve(conn: Connection, ring_capacity: int) -> None:
+    """Worker process: resample the rings of its streams when told to."""
+    for rate in COMMON_RATES:
+        StreamingResampler(rate, TARGET_RATE)
+    streams: dict[int, tuple[SharedRing, SharedRing, StreamingResampler]] = {}
+    while True:
+        message = conn.recv()
+        if message is None:
+            break
+        command, stream_id, *args = message
+        if command == "process":
+            # Replies name the round they answer, so a late one is told apart.
+            round_id = args[0]
+            try:
+                ring_in, ring_out, resampler = streams[stream_id]
+                output = np.frombuffer(resampler.process(ring_in.read()), dtype=np.int16)
+                conn.send(("done", stream_id, round_id, ring_out.write(output)))
+            except Exception as e:
+                conn.send(("error", stream_id, round_id, str(e)))
+        elif command == "open":
+            # Acknowledged on its own path, so the stream fails at creation.
+            in_name, out_name, src_rate, dst_rate = args
+            try:
+                streams[stream_id] = (
+                    SharedRing(ring_capacity, in_name),
+                    SharedRing(ring_capacity, out_name),
+                    StreamingResampler(src_rate, dst_rate),
+                )
+            except Exception as e:
+                conn.send(("opened", stream_id, 0, str(e)))
+            else:
+                conn.send(("opened", stream_id, 0, None))
+        elif command == "close" and stream_id in streams:
+            for ring in streams.pop(stream_id)[:2]:
+                ring.close()
+    for ring_in, ring_out, _ in streams.values():
+        ring_in.close()
+        ring_out.close()
+
+
+class _Worker:
+    """Parent side of one worker process: its pipe and the streams waiting on it."""
+
+    def __init__(self, context, ring_capacity: int, index: int):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve, args=(child, ring_capacity), name=f"audio-pool-{index}", daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.streams: dict[int, "PooledResampler"] = {}
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(
+            target=self._read, name=f"audio-pool-{index}-reader", daemon=True
+        )
+        self._reader.start()
+
+    def send(self, message: Optional[tuple]) -> None:
+        with self._send_lock:
+            self.conn.send(message)
+
+    def _read(self) -> None:
+        while True:
+            try:
+                kind, stream_id, round_id, value = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            stream = self.streams.get(stream_id)
+            if stream is None:
+                continue
+            if kind == "opened":
+                stream._open_error = RuntimeError(value) if value is not None else None
+                stream._opened.set()
+            # Answers to a round the stream gave up on are dropped.
+            elif round_id == stream._round:
+                stream._result = value if kind == "done" else RuntimeError(value)
+                stream._ready.release()
+        # The worker is gone: wake every stream still waiting.
+        for stream in list(self.streams.values()):
+            stream._open_error = stream._result = RuntimeError("Audio worker process exited")
+            stream._opened.set()
+            stream._ready.release()
+
+
+class PooledResampler:
+    """A stream resampled by a pool worker, at a fixed source rate.
+
+    Stands in for ``StreamDecoder.resample``; :meth:`process` blocks the
+    calling thread until the worker answers. A stream that fails or times
+    out is closed: its rings and resampler state can no longer be trusted,
+    so callers resample locally from then on.
+
+    Raises:
+        RuntimeError: If the worker cannot open the stream or does not
+            acknowledge it in time
+    """
+
+    def __init__(
+        self, pool: "AudioProcessPool", worker: _Worker, stream_id: int, src_rate: int
+    ):
+        self.pool = pool
+        self.worker = worker
+        self.stream_id = stream_id
+        self.src_rate = src_rate
+        self._in = SharedRing(pool.ring_capacity)
+        self._out = SharedRing(pool.ring_capacity)
+        # Input per round, so that the output fits its ring too when upsampling.
+        self._step = self._in.capacity * min(src_rate, TARGET_RATE) // (2 * TARGET_RATE)
+        self._ready = threading.Semaphore(0)
+        self._result: object = None
+        self._round = 0
+        self._lock = threading.Lock()
+        self._opened = threading.Event()
+        self._open_error: Optional[Exception] = None
+        worker.streams[stream_id] = self
+        worker.send(("open", stream_id, self._in.name, self._out.name, src_rate, TARGET_RATE))
+        if not self._opened.wait(pool.timeout):
+            self._open_error = RuntimeError(
+                f"Audio worker did not open the stream in {pool.timeout}s"
+            )
+        if self._open_error is not None:
+            self.close()
+            raise self._open_error
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resample the next chunk of the stream to 16 kHz.
+
+        Raises:
+            RuntimeError: If the stream is closed, or the worker failed or did
+                not answer in time, which closes it
+        """
+        parts = []
+        error: Optional[Exception] = None
+        with self._lock:
+            if self.stream_id not in self.worker.streams:
+                raise RuntimeError("Resampling stream is closed")
+            for start in range(0, len(samples), self._step):
+                self._round += 1
+                self._in.write(samples[start : start + self._step])
+                self.worker.send(("process", self.stream_id, self._round))
+                if not self._ready.acquire(timeout=self.pool.timeout):
+                    error = RuntimeError(f"Audio worker did not answer in {self.pool.timeout}s")
+                    break
+                result, self._result = self._result, None
+                if isinstance(result, Exception):
+                    error = result
+                    break
+                parts.append(self._out.read(result))
+        if error is not None:
+            self.close()
+            raise error
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.int16)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.worker.streams.pop(self.stream_id, None) is None:
+                return
+            try:
+                self.worker.send(("close", self.stream_id))
+            except OSError:
+                pass
+            self._in.close()
+            self._out.close()
+
+
+class AudioProcessPool:
+    """Worker processes resampling audio streams out of the socket process."""
+
+    def __init__(
+        self,
+        processes: Optional[int] = None,
+        *,
+        ring_seconds: float = RING_SECONDS,
+        max_rate: int = 48000,
+        timeout: float = 5.0,
+    ):
+        """
+        Start the workers.
+
+        Args:
+            processes: Worker processes; defaults to the number of CPUs
+            ring_seconds: Capacity of each stream's rings, at ``max_rate``
+            max_rate: Highest client sample rate expected
+            timeout: Seconds a chunk may take before the stream gives up
+        """
+        self.processes = processes or os.cpu_count() or 1
+        self.ring_capacity = int(ring_seconds * max_rate)
+        self.timeout = timeout
+        # Forking a process that runs threads is unsafe; spawn clean workers.
+        context = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(context, self.ring_capacity, i) for i in range(self.processes)]
+        self._ids = itertools.count()
+
+    def __len__(self) -> int:
+        return sum(len(worker.streams) for worker in self._workers)
+
+    def open(self, src_rate: int) -> PooledResampler:
+        """A new stream from ``src_rate`` to 16 kHz, on the least busy worker."""
+        worker = min(self._workers, key=lambda w: len(w.streams))
+        return PooledResampler(self, worker, next(self._ids), src_rate)
+
+    def shutdown(self) -> None:
+        for worker in self._workers:
+            for stream in list(worker.streams.values()):
+                stream.close()
+            try:
+                worker.send(None)
+            except OSError:
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.conn.close()
@@ -0,0 +1,264 @@
+"""Bounded audio queue between a socket handler and a recorder thread.
+
+The socket side puts chunks as they arrive; a feeder thread drains them into
+the recorder. When transcription falls behind, the queue stays bounded:
+
+- silence (by chunk energy) beyond ``keep_silence`` in a row is coalesced
+  away as it arrives, so a backlog never grows on pauses;
+- past ``capacity``, the policy decides what goes: ``DROP_SILENCE`` drops
+  the oldest silent chunks and keeps speech up to ``hard_capacity``;
+  ``DROP_OLDEST`` drops the oldest audio whatever it is.
+
+Crossing ``high_water`` and falling back under ``low_water`` are reported by
+``put`` and ``get`` so the server can ask the client to send less often.
+"""
+
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Optional
+
+import numpy as np
+
+# RMS of int16 samples under which a chunk counts as silence, about -50 dBFS.
+SILENCE_RMS = 100.0
+
+
+class DropPolicy(str, Enum):
+    DROP_SILENCE = "drop_silence"
+    DROP_OLDEST = "drop_oldest"
+
+
+class Flow(str, Enum):
+    """Flow-control transition reported by the queue."""
+
+    SLOW_DOWN = "slow_down"
+    RESUME = "resume"
+
+
+@dataclass
+class QueueStats:
+    """Counters shared by all queues of a server; audio is in seconds."""
+
+    coalesced: float = 0.0
+    dropped_silence: float = 0.0
+    dropped_speech: float = 0.0
+    slow_downs: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, **counts: float) -> None:
+        with self._lock:
+            for name, n in counts.items():
+                setattr(self, name, getattr(self, name) + n)
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "coalesced": self.coalesced,
+            "dropped_silence": self.dropped_silence,
+            "dropped_speech": self.dropped_speech,
+            "slow_downs": self.slow_downs,
+        }
+
+
+@dataclass
+class _Chunk:
+    samples: np.ndarray
+    speech: bool
+
+
+class AudioQueue:
+    """Bounded FIFO of int16 chunks with silence-aware dropping.
+
+    Sizes are in samples at ``sample_rate``. Safe for one producer and one
+    consumer thread.
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        *,
+        sample_rate: int = 16000,
+        policy: DropPolicy = DropPolicy.DROP_SILENCE,
+        hard_capacity: Optional[int] = None,
+        high_water: Optional[int] = None,
+        low_water: Optional[int] = None,
+        keep_silence: int = 0,
+        silence_rms: float = SILENCE_RMS,
+        stats: Optional[QueueStats] = None,
+    ):
+        """
+        Initialize the queue.
+
+        Args:
+            capacity: Samples queued before anything is dropped
+            sample_rate: Rate of the queued audio, for the stats
+            policy: What to drop past ``capacity``
+            hard_capacity: With DROP_SILENCE, samples of speech kept past
+                ``capacity`` before the oldest speech is dropped too; this
+                bounds memory. Defaults to twice ``capacity``
+            high_water: Depth at which ``put`` reports SLOW_DOWN. Defaults
+                to half of ``capacity``
+            low_water: Depth at which ``get`` reports RESUME. Defaults to a
+                quarter of ``capacity``
+            keep_silence: Consecutive silent samples kept while behind; must
+                exceed the VAD's end-of-speech silence so utterances still
+                split. 0 disables coalescing
+            silence_rms: RMS under which a chunk is silence
+            stats: Counters to update, e.g. shared between sessions
+        """
+        if capacity < 1:
+            raise ValueError("Audio queue capacity must be at least 1")
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        self.policy = DropPolicy(policy)
+        self.hard_capacity = max(hard_capacity or 2 * capacity, capacity)
+        self.high_water = high_water if high_water is not None else capacity // 2
+        self.low_water = low_water if low_water is not None else capacity // 4
+        self.keep_silence = keep_silence
+        self.silence_rms = silence_rms
+        self.stats = stats or QueueStats()
+        self._chunks: deque[_Chunk] = deque()
+        self._size = 0
+        # Silent samples at the tail, to coalesce long pauses.
+        self._tail_silence = 0
+        self._lock = threading.Lock()
+        self._readable = threading.Condition(self._lock)
+        self.paused = False
+        self.closed = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def depth(self) -> float:
+        """Seconds of audio queued."""
+        return self._size / self.sample_rate
+
+    def is_speech(self, samples: np.ndarray) -> bool:
+        return float(np.sqrt(np.mean(np.square(samples, dtype=np.float64)))) >= self.silence_rms
+
+    def put(self, samples: np.ndarray) -> Optional[Flow]:
+        """
+        Queue a chunk, copying it.
+
+        Returns:
+            SLOW_DOWN if the queue just crossed its high-water mark, else None
+        """
+        n = len(samples)
+        if n == 0 or self.closed:
+            return None
+        speech = self.is_speech(samples)
+        with self._lock:
+            if speech:
+                self._tail_silence = 0
+            else:
+                if (
+                    self.keep_silence
+                    and self._size > self.low_water
+                    and self._tail_silence >= self.keep_silence
+                ):
+                    # Behind, and the pause is already long enough to end the
+                    # utterance: more of it would only add to the backlog.
+                    self.stats.add(coalesced=n / self.sample_rate)
+                    return None
+                self._tail_silence += n
+            self._chunks.append(_Chunk(np.array(samples, dtype=np.int16), speech))
+            self._size += n
+            self._shrink()
+            self._readable.notify()
+            if not self.paused and self._size >= self.high_water:
+                self.paused = True
+                self.stats.add(slow_downs=1)
+                return Flow.SLOW_DOWN
+        return None
+
+    def _shrink(self) -> None:
+        if self._size <= self.capacity:
+            return
+        if self.policy == DropPolicy.DROP_SILENCE:
+            # Oldest silence first, scanning past the speech in front of it.
+            kept: deque[_Chunk] = deque()
+            while self._size > self.capacity and self._chunks:
+                chunk = self._chunks.popleft()
+                if chunk.speech:
+                    kept.append(chunk)
+                else:
+                    self._size -= len(chunk.samples)
+                    self.stats.add(dropped_silence=len(chunk.samples) / self.sample_rate)
+            self._chunks.extendleft(reversed(kept))
+            limit = self.hard_capacity
+        else:
+            limit = self.capacity
+        while self._size > limit:
+            chunk = self._chunks[0]
+            excess = self._size - limit
+            if len(chunk.samples) <= excess:
+                self._chunks.popleft()
+                dropped = len(chunk.samples)
+            else:
+                chunk.samples = chunk.samples[excess:]
+                dropped = excess
+            self._size -= dropped
+            kind = "dropped_speech" if chunk.speech else "dropped_silence"
+            self.stats.add(**{kind: dropped / self.sample_rate})
+        self._tail_silence = min(self._tail_silence, self._size)
+
+    def get(
+        self, timeout: Optional[float] = None, max_samples: Optional[int] = None
+    ) -> tuple[Optional[np.ndarray], Optional[Flow]]:
+        """
+        Take queued samples from the front, waiting up to ``timeout`` for some.
+
+        Args:
+            timeout: Seconds to wait if the queue is empty
+            max_samples: Take at most this many; by default everything
+
+        Returns:
+            The samples (None if none arrived in time or the queue was
+            closed) and RESUME if the queue just fell under its low-water mark
+        """
+        with self._lock:
+            if not self._size and not self.closed:
+                self._readable.wait(timeout)
+            if not self._size:
+                return None, None
+            budget = self._size if max_samples is None else max(max_samples, 1)
+            taken = []
+            while self._chunks and budget > 0:
+                chunk = self._chunks[0]
+                if len(chunk.samples) <= budget:
+                    self._chunks.popleft()
+                    taken.append(chunk.samples)
+                else:
+                    taken.append(chunk.samples[:budget])
+                    chunk.samples = chunk.samples[budget:]
+                budget -= len(taken[-1])
+                self._size -= len(taken[-1])
+            self._tail_silence = min(self._tail_silence, self._size)
+            flow = None
+            if self.paused and self._size <= self.low_water:
+                self.paused = False
+                flow = Flow.RESUME
+        samples = taken[0] if len(taken) == 1 else np.concatenate(taken)
+        return samples, flow
+
+    def clear(self) -> None:
+        with self._lock:
+            self._chunks.clear()
+            self._size = 0
+            self._tail_silence = 0
+
+    def close(self) -> None:
+        """Wake up a waiting reader for good."""
+        with self._lock:
+            self.closed = True
+            self._readable.notify_all()
+
+
+def recorder_backlog(recorder) -> int:
+    """Chunks waiting in a RealtimeSTT recorder's own (unbounded) queue."""
+    try:
+        return recorder.audio_queue.qsize()
+    except (AttributeError, NotImplementedError):
+        return 0
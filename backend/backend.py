@@ -1,36 +1,11 @@
-from flask import Flask, request, jsonify
-import os
+"""Upload de fichiers WAV (POST /upload), port 5000.
 
-app = Flask(__name__)
+Ancien point d'entrée, conservé pour compatibilité : tout est désormais servi
+par le serveur unifié (voir server/), lancé ici sur le port historique.
+Équivalent à ``python -m server --port 5000``.
+"""
 
-print('ok')
-# Dossier pour stocker les fichiers téléchargés
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+from server.__main__ import main
 
-@app.route('/upload', methods=['POST'])
-def upload_file():
-    print('dans la route')
-    # Vérifie si un fichier est présent dans la requête
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file part'}), 400
-
-    file = request.files['file']
-
-    # Vérifie si le fichier a un nom
-    if file.filename == '':
-        return jsonify({'error': 'No selected file'}), 400
-
-    # Vérifie si le fichier est au format WAV
-    if file and file.filename.endswith('.wav'):
-        # Enregistre le fichier dans le dossier de téléchargement
-        file_path = os.path.join(UPLOAD_FOLDER, file.filename)
-        file.save(file_path)
-        return jsonify({'message': 'File uploaded successfully', 'file_path': file_path}), 200
-    else:
-        return jsonify({'error': 'Invalid file format. Only WAV files are allowed.'}), 400
-
-
-
-app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+if __name__ == "__main__":
+    main(["--port", "5000"])
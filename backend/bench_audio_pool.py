@@ -0,0 +1,164 @@
+"""Concurrent 44.1 kHz streams one host sustains, by where resampling runs.
+
+Each stream sends a 20 ms chunk every 20 ms to an asyncio loop standing in
+for the socket process, and every chunk is resampled to 16 kHz:
+
+    inline   on the event loop, as the former socket handlers did
+    threads  in a feeder thread per stream, as sessions.Session does
+    pool     in a feeder thread per stream, through audio_pool.AudioProcessPool
+
+A stream count is sustained if chunks are resampled within ``--max-latency``
+(p99, from arrival) and the loop keeps ticking on time (p99 lag under
+``--max-lag``), i.e. other clients' I/O is not stalled. Stream counts double
+until one is not sustained.
+
+Usage: python bench_audio_pool.py [--modes inline threads pool] [--processes N]
+"""
+
+import argparse
+import asyncio
+import os
+import queue
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from audio_pool import AudioProcessPool
+from resampler import StreamingResampler
+
+RATE = 44100
+CHUNK_MS = 20
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Feeder:
+    """A stream's feeder thread: resamples whatever chunks are queued, in one go."""
+
+    def __init__(self, resample, latencies: list[float]):
+        self.resample = resample
+        self.latencies = latencies
+        self.queue: queue.Queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            items = [item]
+            while not self.queue.empty():
+                items.append(self.queue.get())
+            stop = items[-1] is None
+            items = [i for i in items if i is not None]
+            if items:
+                self.resample(np.concatenate([chunk for chunk, _ in items]))
+                done = time.perf_counter()
+                self.latencies.extend(done - arrived for _, arrived in items)
+            if stop:
+                return
+
+
+async def run(mode: str, streams: int, seconds: float, pool: Optional[AudioProcessPool]) -> dict:
+    rng = np.random.default_rng(0)
+    chunk_samples = RATE * CHUNK_MS // 1000
+    chunk = (3000 * rng.standard_normal(chunk_samples)).astype(np.int16)
+    latencies: list[float] = []
+    lags: list[float] = []
+    resamplers = []
+    feeders: list[Feeder] = []
+    for _ in range(streams):
+        if mode == "inline":
+            resamplers.append(StreamingResampler(RATE))
+        elif mode == "threads":
+            feeders.append(Feeder(StreamingResampler(RATE).process, latencies))
+        else:
+            feeders.append(Feeder(pool.open(RATE).process, latencies))
+
+    stop_at = time.perf_counter() + seconds
+
+    async def stream(i: int) -> None:
+        # Staggered, like independent clients.
+        await asyncio.sleep(i * CHUNK_MS / 1000 / streams)
+        next_at = time.perf_counter()
+        while next_at < stop_at:
+            arrived = time.perf_counter()
+            if mode == "inline":
+                resamplers[i].process(chunk)
+                latencies.append(time.perf_counter() - arrived)
+            else:
+                feeders[i].queue.put((chunk, arrived))
+            next_at += CHUNK_MS / 1000
+            await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+
+    async def ticker() -> None:
+        while time.perf_counter() < stop_at:
+            expected = time.perf_counter() + 0.01
+            await asyncio.sleep(0.01)
+            lags.append(max(time.perf_counter() - expected, 0.0))
+
+    await asyncio.gather(ticker(), *(stream(i) for i in range(streams)))
+    sent = streams * int(seconds * 1000 / CHUNK_MS)
+    for feeder in feeders:
+        feeder.queue.put(None)
+    deadline = time.perf_counter() + 5
+    for feeder in feeders:
+        feeder.thread.join(timeout=max(deadline - time.perf_counter(), 0))
+        close = getattr(feeder.resample, "__self__", None)
+        if hasattr(close, "close"):
+            close.close()
+    return {
+        "p50_ms": 1e3 * percentile(latencies, 0.5),
+        "p99_ms": 1e3 * percentile(latencies, 0.99),
+        "lag_p99_ms": 1e3 * percentile(lags, 0.99),
+        "done": len(latencies) / max(sent, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["inline", "threads", "pool"])
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--start", type=int, default=8, help="First stream count")
+    parser.add_argument("--max-streams", type=int, default=1024)
+    parser.add_argument("--max-latency", type=float, default=100.0, help="p99 chunk latency, ms")
+    parser.add_argument("--max-lag", type=float, default=20.0, help="p99 event loop lag, ms")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs, {args.processes} pool processes, {CHUNK_MS} ms chunks at {RATE} Hz")
+    pool = AudioProcessPool(args.processes) if "pool" in args.modes else None
+    try:
+        for mode in args.modes:
+            sustained = 0
+            streams = args.start
+            while streams <= args.max_streams:
+                result = asyncio.run(run(mode, streams, args.seconds, pool))
+                ok = (
+                    result["p99_ms"] <= args.max_latency
+                    and result["lag_p99_ms"] <= args.max_lag
+                    and result["done"] >= 0.99
+                )
+                print(
+                    f"{mode:>7} {streams:5d} streams: latency p50 {result['p50_ms']:6.2f} ms, "
+                    f"p99 {result['p99_ms']:7.2f} ms | loop lag p99 {result['lag_p99_ms']:6.2f} ms"
+                    f" | {result['done']:.0%} resampled {'ok' if ok else 'NOT SUSTAINED'}"
+                )
+                if not ok:
+                    break
+                sustained = streams
+                streams *= 2
+            print(f"{mode}: sustains {sustained} concurrent streams")
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Bandwidth and server CPU per stream for each ingest codec.
+
+Encodes the same speech-band test signal the way a client would (20 ms
+frames), then times StreamDecoder turning it into 16 kHz int16 on the server.
+Opus rows need opuslib (and libopus); they are skipped without it.
+
+Usage: python bench_codecs.py [--seconds 30] [--bitrates 16000 24000 32000]
+"""
+
+import argparse
+import base64
+import json
+import time
+
+import numpy as np
+
+from audio_codecs import StreamDecoder, opuslib
+from bench_resample import make_signal
+from framing import Codec, encode_frame, parse_frame
+
+FRAME_MS = 20
+
+
+def pcm_frames(signal: np.ndarray, rate: int) -> list[bytes]:
+    step = rate * FRAME_MS // 1000
+    return [
+        encode_frame(signal[i : i + step].tobytes(), session=1, seq=n, sample_rate=rate)
+        for n, i in enumerate(range(0, len(signal) - step + 1, step))
+    ]
+
+
+def opus_frames(signal: np.ndarray, rate: int, bitrate: int) -> list[bytes]:
+    encoder = opuslib.Encoder(rate, 1, opuslib.APPLICATION_VOIP)
+    encoder.bitrate = bitrate
+    step = rate * FRAME_MS // 1000
+    return [
+        encode_frame(
+            encoder.encode(signal[i : i + step].tobytes(), step),
+            session=1,
+            seq=n,
+            sample_rate=rate,
+            codec=Codec.OPUS,
+        )
+        for n, i in enumerate(range(0, len(signal) - step + 1, step))
+    ]
+
+
+def report(name: str, frames: list[bytes], seconds: float) -> None:
+    decoder = StreamDecoder()
+    start = time.perf_counter()
+    for message in frames:
+        decoder.decode(parse_frame(message))
+    cpu = (time.perf_counter() - start) / seconds
+    kbps = sum(len(m) for m in frames) * 8 / seconds / 1000
+    print(
+        f"{name:<24} {kbps:8.1f} kbit/s | {cpu * 1e3:6.2f} ms CPU per s of audio "
+        f"(~{1 / cpu:5.0f} streams/core)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--bitrates", type=int, nargs="+", default=[16000, 24000, 32000])
+    args = parser.parse_args()
+
+    for rate in (44100, 48000):
+        signal = make_signal(rate, args.seconds)
+        chunk = signal[: rate * FRAME_MS // 1000].tobytes()
+        legacy = json.dumps(
+            {"data": base64.b64encode(chunk).decode("ascii"), "metadata": {"sampleRate": rate}}
+        )
+        print(
+            f"{'base64 PCM ' + str(rate):<24} "
+            f"{len(legacy) * 8 * 1000 / FRAME_MS / 1000:8.1f} kbit/s | (previous format)"
+        )
+        report(f"PCM16 frames {rate}", pcm_frames(signal, rate), args.seconds)
+
+    if opuslib is None:
+        print("opuslib not installed: Opus rows skipped")
+        return
+    for rate in (16000, 48000):
+        signal = make_signal(rate, args.seconds)
+        for bitrate in args.bitrates:
+            report(
+                f"Opus {bitrate // 1000} kbit/s @ {rate}",
+                opus_frames(signal, rate, bitrate),
+                args.seconds,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Throughput benchmark: binary frames vs. the previous audio message formats.
+
+Each path parses one message and copies its samples into an AudioQueue,
+which is what the servers do per chunk. "copied" is the peak memory the parse
+allocates per frame (intermediate copies of the payload), measured with
+tracemalloc; the queue put itself is one copy in every path.
+
+Usage: python bench_framing.py [--frames 20000] [--chunk-ms 20 100]
+"""
+
+import argparse
+import base64
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from audio_queue import AudioQueue
+from framing import encode_frame, parse_frame
+
+SAMPLE_RATE = 48000
+
+
+def make_messages(chunk: bytes) -> dict[str, object]:
+    metadata = json.dumps({"sampleRate": SAMPLE_RATE}).encode("utf-8")
+    return {
+        "base64 + JSON": json.dumps(
+            {"data": base64.b64encode(chunk).decode("ascii"), "metadata": {"sampleRate": SAMPLE_RATE}}
+        ),
+        "length + JSON header": len(metadata).to_bytes(4, "little") + metadata + chunk,
+        "binary frame": encode_frame(chunk, session=1, seq=0, sample_rate=SAMPLE_RATE),
+    }
+
+
+def parse_base64_json(message: str) -> tuple[np.ndarray, int]:
+    data = json.loads(message)
+    audio = base64.b64decode(data["data"])
+    return np.frombuffer(audio, dtype=np.int16), data.get("metadata", {}).get("sampleRate", 44100)
+
+
+def parse_length_header(message: bytes) -> tuple[np.ndarray, int]:
+    metadata_length = int.from_bytes(message[:4], byteorder="little")
+    metadata = json.loads(message[4 : 4 + metadata_length].decode("utf-8"))
+    chunk = message[4 + metadata_length :]
+    return np.frombuffer(chunk, dtype=np.int16), metadata["sampleRate"]
+
+
+def parse_binary_frame(message: bytes) -> tuple[np.ndarray, int]:
+    frame = parse_frame(message)
+    return frame.samples(), frame.sample_rate
+
+
+PARSERS = {
+    "base64 + JSON": parse_base64_json,
+    "length + JSON header": parse_length_header,
+    "binary frame": parse_binary_frame,
+}
+
+
+def copied_bytes(parse, message) -> int:
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    parse(message)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak - before
+
+
+def run(chunk_ms: int, frames: int) -> None:
+    samples = int(SAMPLE_RATE * chunk_ms / 1000)
+    chunk = np.random.default_rng(0).integers(-3000, 3000, samples, dtype=np.int16).tobytes()
+    messages = make_messages(chunk)
+    queue = AudioQueue(10 * SAMPLE_RATE, sample_rate=SAMPLE_RATE)
+
+    print(f"{chunk_ms} ms chunks ({len(chunk)} payload bytes)")
+    for name, parse in PARSERS.items():
+        message = messages[name]
+        start = time.perf_counter()
+        for _ in range(frames):
+            audio, _ = parse(message)
+            queue.put(audio)
+            if len(queue) > queue.capacity // 2:
+                queue.clear()
+        elapsed = time.perf_counter() - start
+        print(
+            f"  {name:<21} {frames / elapsed:9.0f} frames/s | "
+            f"{len(message):7d} bytes on the wire | "
+            f"{copied_bytes(parse, message):7d} bytes copied"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--chunk-ms", type=int, nargs="+", default=[20, 100])
+    args = parser.parse_args()
+
+    for chunk_ms in args.chunk_ms:
+        run(chunk_ms, args.frames)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Realtime transcript traffic of long utterances, by how partials are sent.
+
+A recorder thread reports the realtime text of each session's utterance
+every ``--interval`` ms, growing a few characters at a time as a caller
+speaking at ~15 characters a second would, and the messages are sent from
+an asyncio loop:
+
+    legacy     one message with the whole text per update, as before
+    coalesced  transcript_diff.PartialTranscript, whole text (``realtime``)
+    delta      transcript_diff.PartialTranscript, deltas (``realtime_delta``)
+
+Reports messages and JSON bytes per session, and how long each update took
+to reach the client (the first message sent after it), which must stay well
+under 100 ms to read as live.
+
+Usage: python bench_partials.py [--sessions 20] [--seconds 20] [--interval 25]
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+from typing import Any
+
+from transcript_diff import DEFAULT_WINDOW, PartialStats, PartialTranscript, apply
+
+TEXT = (
+    "hello I am calling because my father fell down the stairs a few minutes ago and he is "
+    "not answering me anymore he is breathing but very slowly and there is some blood on his "
+    "head I tried to wake him up but he does not react at all we are at the second floor of "
+    "the building on the left when you come from the main street and the door is open "
+)
+CHARS_PER_SECOND = 15
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+class Client:
+    """What one session's client receives: message sizes, times and its text."""
+
+    def __init__(self):
+        self.sent: list[tuple[float, int]] = []
+        self.bytes = 0
+        self.text = ""
+
+    def receive(self, message: dict[str, Any]) -> None:
+        update = message.pop("update")
+        self.sent.append((time.perf_counter(), update))
+        self.bytes += len(json.dumps(message))
+        if message["type"] == "realtime_delta":
+            self.text = apply(self.text, message["keep"], message["text"])
+        else:
+            self.text = message["text"]
+
+
+async def run(mode: str, sessions: int, seconds: float, interval: float) -> dict[str, float]:
+    loop = asyncio.get_running_loop()
+    clients = [Client() for _ in range(sessions)]
+    stats = PartialStats()
+    if mode == "legacy":
+        updaters = [
+            lambda text, fields, c=c: loop.call_soon_threadsafe(
+                c.receive, {"type": "realtime", "text": text, **fields}
+            )
+            for c in clients
+        ]
+    else:
+        partials = [
+            PartialTranscript(loop, c.receive, incremental=mode == "delta", stats=stats)
+            for c in clients
+        ]
+        updaters = [p.update for p in partials]
+    updated: list[float] = []
+    texts: list[str] = []
+
+    def recorder() -> None:
+        start = time.perf_counter()
+        for i in range(int(seconds * 1000 / interval)):
+            text = (TEXT * 4)[: int((i + 1) * interval / 1000 * CHARS_PER_SECOND) + 1]
+            updated.append(time.perf_counter())
+            texts.append(text)
+            for update in updaters:
+                update(text, {"update": i})
+            time.sleep(max(start + (i + 1) * interval / 1000 - time.perf_counter(), 0))
+
+    thread = threading.Thread(target=recorder)
+    thread.start()
+    while thread.is_alive():
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(2 * DEFAULT_WINDOW)
+
+    latencies = []
+    for client in clients:
+        assert client.text == texts[-1], "client text diverged"
+        sent = iter(client.sent)
+        at, last = next(sent)
+        for i, when in enumerate(updated):
+            # Shown by the first message built from this update or a later one.
+            while last < i:
+                at, last = next(sent)
+            latencies.append(at - when)
+    return {
+        "messages": sum(len(c.sent) for c in clients) / sessions,
+        "kbytes": sum(c.bytes for c in clients) / sessions / 1e3,
+        "p50_ms": 1e3 * percentile(latencies, 0.5),
+        "max_ms": 1e3 * max(latencies),
+        "updates": len(updated),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modes", nargs="+", default=["legacy", "coalesced", "delta"])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=20.0, help="Length of the utterance")
+    parser.add_argument("--interval", type=float, default=25.0, help="Ms between updates")
+    args = parser.parse_args()
+
+    print(
+        f"{args.sessions} sessions, one {args.seconds:.0f} s utterance each, "
+        f"an update every {args.interval:.0f} ms, {1000 * DEFAULT_WINDOW:.0f} ms window"
+    )
+    for mode in args.modes:
+        r = asyncio.run(run(mode, args.sessions, args.seconds, args.interval))
+        print(
+            f"{mode:>9}: {r['messages']:5.0f} messages, {r['kbytes']:7.1f} kB per session "
+            f"({r['updates']} updates) | update to client p50 {r['p50_ms']:5.1f} ms, "
+            f"max {r['max_ms']:5.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
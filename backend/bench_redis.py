@@ -0,0 +1,95 @@
+"""Benchmark: HistoryStore vs. the previous per-command RedisClient access pattern.
+
+Both run against MemoryBackend with a simulated network round trip, so no
+Redis server is needed; --latency sets the round trip time. Each simulated
+turn reads the history and stores the caller's message and the answer: the
+legacy pattern re-reads the whole list and pushes each message on its own,
+the store only fetches messages it has not seen and writes the exchange in one
+pipeline.
+
+Usage: python bench_redis.py [--users 50] [--turns 40] [--latency 0.0005]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from redis_store import HistoryStore, MemoryBackend
+
+MESSAGE = "Mon père s'est effondré, il ne respire plus, qu'est-ce que je dois faire ? " * 3
+
+
+class LegacyClient:
+    """The command pattern of the former redis.py RedisClient."""
+
+    def __init__(self, client: MemoryBackend):
+        self.client = client
+
+    async def get_history(self, user_id):
+        messages = await self.client.lrange(f"chat:{user_id}", 0, -1)
+        return [json.loads(msg) for msg in messages]
+
+    async def save_message(self, user_id, role, content):
+        message = json.dumps({"role": role, "content": content})
+        await self.client.rpush(f"chat:{user_id}", message)
+
+    async def clear_all_data(self, user_id):
+        await self.client.delete(f"chat:{user_id}")
+        await self.client.delete(f"user:{user_id}")
+
+
+async def legacy_turn(store: LegacyClient, user_id: int, state: dict) -> None:
+    await store.save_message(user_id, "user", MESSAGE)
+    state["history"] = await store.get_history(user_id)
+    await store.save_message(user_id, "assistant", MESSAGE)
+
+
+async def store_turn(store: HistoryStore, user_id: int, state: dict) -> None:
+    new, _ = await store.get_history(user_id, state.get("next", 0))
+    state.setdefault("history", []).extend(new)
+    state["next"] = await store.save_messages(
+        user_id, [{"role": "user", "content": MESSAGE}, {"role": "assistant", "content": MESSAGE}]
+    )
+
+
+async def run(name: str, store, turn, users: int, turns: int, backend: MemoryBackend) -> None:
+    latencies: list[float] = []
+
+    async def conversation(user_id: int) -> None:
+        state: dict = {}
+        for _ in range(turns):
+            start = time.perf_counter()
+            await turn(store, user_id, state)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(u) for u in range(users)))
+    elapsed = time.perf_counter() - start
+
+    await asyncio.gather(*(store.clear_all_data(u) for u in range(users)))
+    messages = 2 * users * turns
+    lat = np.array(latencies) * 1e3
+    print(
+        f"{name:<13} {messages / elapsed:9.0f} msg/s | turn p50 {np.percentile(lat, 50):6.2f} ms, "
+        f"p99 {np.percentile(lat, 99):6.2f} ms | {backend.round_trips / (users * turns):.1f} round trips/turn"
+    )
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--latency", type=float, default=0.0005)
+    args = parser.parse_args()
+
+    backend = MemoryBackend(latency=args.latency)
+    await run("RedisClient", LegacyClient(backend), legacy_turn, args.users, args.turns, backend)
+    backend = MemoryBackend(latency=args.latency)
+    await run("HistoryStore", HistoryStore(backend), store_turn, args.users, args.turns, backend)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,92 @@
+"""Micro-benchmark: StreamingResampler vs. per-chunk scipy.signal.resample.
+
+Usage: python bench_resample.py [--seconds 30] [--chunk-ms 20 100 1000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+from scipy.signal import resample, resample_poly
+
+from resampler import StreamingResampler
+
+TARGET_RATE = 16000
+
+
+def decode_and_resample(audio_data, original_sample_rate, target_sample_rate):
+    """The per-chunk FFT resampler previously copied into each server."""
+    audio_np = np.frombuffer(audio_data, dtype=np.int16)
+    num_target_samples = int(len(audio_np) * target_sample_rate / original_sample_rate)
+    resampled_audio = resample(audio_np, num_target_samples)
+    return resampled_audio.astype(np.int16).tobytes()
+
+
+def make_signal(rate: int, seconds: float) -> np.ndarray:
+    """Speech-band test tone mix with a little noise."""
+    t = np.arange(int(rate * seconds)) / rate
+    rng = np.random.default_rng(0)
+    signal = (
+        6000 * np.sin(2 * np.pi * 220 * t)
+        + 3000 * np.sin(2 * np.pi * 1700 * t)
+        + 500 * rng.standard_normal(len(t))
+    )
+    return signal.astype(np.int16)
+
+
+def chunks(data: bytes, chunk_bytes: int):
+    for i in range(0, len(data), chunk_bytes):
+        yield data[i : i + chunk_bytes]
+
+
+def snr_db(estimate: np.ndarray, reference: np.ndarray) -> float:
+    n = min(len(estimate), len(reference))
+    error = estimate[:n].astype(np.float64) - reference[:n]
+    return 10 * np.log10(np.sum(reference[:n] ** 2) / max(np.sum(error**2), 1e-12))
+
+
+def run(rate: int, seconds: float, chunk_ms: int) -> None:
+    signal = make_signal(rate, seconds)
+    data = signal.tobytes()
+    chunk_bytes = int(rate * chunk_ms / 1000) * 2
+    reference = resample_poly(signal.astype(np.float64), TARGET_RATE, rate)
+
+    start = time.perf_counter()
+    legacy = b"".join(
+        decode_and_resample(c, rate, TARGET_RATE) for c in chunks(data, chunk_bytes)
+    )
+    legacy_time = time.perf_counter() - start
+
+    resampler = StreamingResampler(rate, TARGET_RATE)
+    start = time.perf_counter()
+    streamed = b"".join(resampler.process(c) for c in chunks(data, chunk_bytes))
+    streaming_time = time.perf_counter() - start
+
+    # The polyphase filter delays its output by a fixed number of samples;
+    # align before comparing against the whole-signal reference.
+    streamed_np = np.frombuffer(streamed, dtype=np.int16)[resampler.delay :]
+    legacy_np = np.frombuffer(legacy, dtype=np.int16)
+
+    print(
+        f"{rate:>6} Hz  {chunk_ms:>5} ms chunks | "
+        f"fft/chunk {legacy_time / seconds * 1e3:7.3f} ms/s audio, "
+        f"SNR {snr_db(legacy_np, reference):5.1f} dB | "
+        f"polyphase {streaming_time / seconds * 1e3:7.3f} ms/s audio, "
+        f"SNR {snr_db(streamed_np, reference):5.1f} dB | "
+        f"speedup x{legacy_time / streaming_time:.1f}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--chunk-ms", type=int, nargs="+", default=[20, 100, 1000])
+    args = parser.parse_args()
+
+    for rate in (44100, 48000):
+        for chunk_ms in args.chunk_ms:
+            run(rate, args.seconds, chunk_ms)
+
+
+if __name__ == "__main__":
+    main()
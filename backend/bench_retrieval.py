@@ -0,0 +1,98 @@
+"""Recall benchmark for the guide retrieval index.
+
+Each caller utterance (in the style of first-aid-prompt/user-example.txt) is
+mapped to the function of functions.json it should trigger; retrieval counts
+as a hit when a top-k passage comes from the chapter documenting it.
+
+Usage: python bench_retrieval.py [--top-k 1 2 4 6] [--passage-tokens 400]
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from prompt import count_tokens, load_system_prompt
+from retrieval import FUNCTION_CHAPTERS, GuideIndex
+
+BASE_PATH = Path(__file__).parent / "first-aid-prompt"
+
+EXAMPLES = [
+    ("HELP!! My dad is choking on food! He's holding his throat and can't talk!!!", "assistance_obstruction_voies_respiratoires"),
+    ("Mon fils de 4 ans a avalé un bonbon, il s'étouffe et n'arrive plus à respirer", "assistance_obstruction_voies_respiratoires"),
+    ("My baby swallowed something and can't breathe or cough", "assistance_obstruction_voies_respiratoires"),
+    ("Il s'étouffe avec un morceau de viande, il ne peut plus parler", "assistance_obstruction_voies_respiratoires"),
+    ("There's so much blood, he cut his arm with a knife and it won't stop bleeding", "assistance_hemorragie_externe"),
+    ("Elle saigne énormément de la jambe, le sang coule sans arrêt", "assistance_hemorragie_externe"),
+    ("My friend is bleeding heavily from the head after a fall", "assistance_hemorragie_externe"),
+    ("He's unconscious but he's still breathing, what do I do?", "assistance_perte_connaissance"),
+    ("Ma grand-mère ne répond plus mais elle respire", "assistance_perte_connaissance"),
+    ("She passed out and won't wake up, her breathing looks normal", "assistance_perte_connaissance"),
+    ("He collapsed and he's not breathing, no pulse!", "assistance_arret_cardiaque"),
+    ("Mon père ne respire plus et ne répond pas, son coeur s'est arrêté", "assistance_arret_cardiaque"),
+    ("How do I do CPR on a 50 year old man?", "assistance_arret_cardiaque"),
+    ("She feels dizzy and has chest pain", "assistance_malaise"),
+    ("Je me sens pas bien, j'ai des vertiges et une douleur dans la poitrine", "assistance_malaise"),
+    ("My colleague feels unwell and is sweating a lot", "assistance_malaise"),
+    ("I have a deep cut on my hand, it's a wound about 3 cm", "assistance_plaie"),
+    ("Il s'est fait une plaie au genou en tombant, c'est profond", "assistance_plaie"),
+    ("My son burned his hand on the stove", "assistance_brule"),
+    ("Elle s'est brûlée avec de l'eau bouillante sur le bras", "assistance_brule"),
+    ("Chemical burn on his face from a cleaning product", "assistance_brule"),
+    ("I think my leg is broken, I fell down the stairs", "assistance_traumatisme_os_articulations"),
+    ("Il s'est fait une entorse à la cheville en courant", "assistance_traumatisme_os_articulations"),
+    ("Fracture du bras après une chute de vélo", "assistance_traumatisme_os_articulations"),
+    ("How do I put someone in the recovery position? He's unconscious and breathing", "assistance_position_laterale_securite"),
+    ("Comment mettre une victime en position latérale de sécurité ?", "assistance_position_laterale_securite"),
+    ("There's a defibrillator here, how do I use the AED?", "assistance_utilisation_defibrillateur"),
+    ("Comment utiliser le défibrillateur automatisé externe ?", "assistance_utilisation_defibrillateur"),
+]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 2, 4, 6])
+    parser.add_argument("--passage-tokens", type=int, default=400)
+    args = parser.parse_args()
+
+    guide_path = BASE_PATH / "guide.txt"
+    functions_path = BASE_PATH / "functions.json"
+    index_path = Path("/tmp/bench-guide-index.json")
+    index_path.unlink(missing_ok=True)
+
+    start = time.perf_counter()
+    GuideIndex.load_or_build(guide_path, index_path, args.passage_tokens)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    index = GuideIndex.load_or_build(guide_path, index_path, args.passage_tokens)
+    warm = time.perf_counter() - start
+    print(f"{len(index.passages)} passages; index build {cold * 1e3:.1f} ms, load {warm * 1e3:.1f} ms")
+
+    full_prompt = load_system_prompt(guide_path, functions_path)
+    base_prompt = load_system_prompt(guide_path, functions_path, include_guide=False)
+    print(
+        f"full system prompt: {full_prompt.total_tokens} tokens; "
+        f"without guide: {base_prompt.total_tokens} tokens\n"
+    )
+
+    for top_k in args.top_k:
+        hits = 0
+        context_tokens = 0
+        start = time.perf_counter()
+        for utterance, function in EXAMPLES:
+            passages = index.search(utterance, top_k)
+            context_tokens += sum(count_tokens(p.render()) for p in passages)
+            if any(p.chapter == FUNCTION_CHAPTERS[function] for p in passages):
+                hits += 1
+            elif top_k == max(args.top_k):
+                print(f"  miss: {utterance!r} -> {[p.chapter for p in passages]}")
+        elapsed = (time.perf_counter() - start) / len(EXAMPLES)
+        per_turn = base_prompt.total_tokens + context_tokens / len(EXAMPLES)
+        print(
+            f"top-{top_k}: recall {hits}/{len(EXAMPLES)} ({hits / len(EXAMPLES):.0%}), "
+            f"{elapsed * 1e3:.2f} ms/query, ~{per_turn:.0f} prompt tokens/turn "
+            f"({full_prompt.total_tokens / per_turn:.1f}x smaller)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Accuracy and latency of the local function router against the LLM path.
+
+Runs the caller utterances of bench_retrieval.py, plus ambiguous ones that
+must be left to the model, through :class:`llm.FunctionRouter` and through
+``LLMAssistant.chat_async`` without the router. For the router, coverage is
+the share of utterances answered locally and precision the share of those
+answered with the right function; argument extraction is checked on
+utterances that state their parameters.
+
+Without ``--mistral`` the LLM path is loadtest.FakeMistral, which gives its
+latency but not a meaningful accuracy; with ``--mistral`` (MISTRAL_API_KEY
+set) both are measured against the real model.
+
+Usage: python bench_router.py [--mistral] [--latency 0.8]
+"""
+
+import argparse
+import asyncio
+import time
+
+from bench_retrieval import EXAMPLES
+from llm import FunctionRouter
+from loadtest import FakeMistral
+from sessions import SessionManager
+
+# No single protocol is clearly named: the model must decide, or ask.
+AMBIGUOUS = [
+    ("Help, please, something terrible happened!", None),
+    ("He collapsed and he's not breathing", None),
+    ("Il est tombé, il saigne de la tête et ne répond plus", None),
+    ("She burned her hand and now she feels dizzy", None),
+    ("He's not bleeding but his arm hurts a lot", None),
+    ("Qu'est-ce que je dois faire maintenant ?", None),
+]
+# Utterances stating parameters, with the arguments the router must extract.
+ARGUMENTS = [
+    ("My son is 4 years old and he's choking on a candy", {"âge": 4}),
+    ("Mon bébé de 8 mois s'étouffe, il a avalé une bille", {"âge": 0.7}),
+    ("Elle saigne énormément de la jambe", {"zone_corporelle": "jambe", "intensite_saignement": "abondant"}),
+    ("He's bleeding a little from his finger", {"zone_corporelle": "doigt", "intensite_saignement": "léger"}),
+    ("Chemical burn on his face from a cleaning product", {"type_brule": "chimique"}),
+    ("Elle s'est brûlée avec de l'eau bouillante sur le bras", {"type_brule": "thermique"}),
+    ("Il s'est fait une entorse à la cheville en courant", {"zone_corporelle": "cheville", "type_trauma": "entorse"}),
+    ("I think my leg is broken, I fell down the stairs", {"zone_corporelle": "jambe", "type_trauma": "fracture"}),
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def bench_router(router: FunctionRouter, cases: list, repeat: int) -> None:
+    routed = correct = 0
+    for utterance, expected in cases:
+        function = router.decide(utterance).function
+        if function is not None:
+            routed += 1
+            correct += function.name == expected
+    timings = []
+    for _ in range(repeat):
+        for utterance, _ in cases:
+            start = time.perf_counter()
+            router.decide(utterance)
+            timings.append(time.perf_counter() - start)
+    print(
+        f"router: {routed}/{len(cases)} answered locally ({routed / len(cases):.0%}), "
+        f"precision {correct}/{routed} ({correct / max(routed, 1):.0%}) | "
+        f"p50 {percentile(timings, 0.5) * 1e6:.0f} us, p99 {percentile(timings, 0.99) * 1e6:.0f} us"
+    )
+
+    exact = 0
+    for utterance, expected in ARGUMENTS:
+        function = router.decide(utterance).function
+        arguments = function.arguments if function is not None else {}
+        ok = all(arguments.get(name) == value for name, value in expected.items())
+        exact += ok
+        if not ok:
+            print(f"  arguments missed: {utterance!r} -> {arguments}, expected {expected}")
+    print(f"router arguments: {exact}/{len(ARGUMENTS)} utterances fully extracted")
+
+
+async def bench_llm(client, cases: list, label: str) -> None:
+    factory = SessionManager.shared_llm_factory(client, local_routing=False)
+    correct = 0
+    timings = []
+    for utterance, expected in cases:
+        assistant = factory()
+        start = time.perf_counter()
+        try:
+            function = await assistant.chat_async(utterance)
+        except RuntimeError as e:
+            print(f"  {utterance!r}: {e}")
+            continue
+        timings.append(time.perf_counter() - start)
+        # Ambiguous cases are right when the model asks rather than guesses.
+        correct += function.name == (expected or "ask_for_more_information")
+    print(
+        f"{label}: accuracy {correct}/{len(cases)} ({correct / len(cases):.0%}) | "
+        f"p50 {percentile(timings, 0.5) * 1e3:.0f} ms, p99 {percentile(timings, 0.99) * 1e3:.0f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mistral", action="store_true", help="Measure the real model")
+    parser.add_argument("--latency", type=float, default=0.8, help="Fake LLM first-token latency")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = EXAMPLES + AMBIGUOUS
+    bench_router(FunctionRouter(), cases, args.repeat)
+    if args.mistral:
+        asyncio.run(bench_llm(None, cases, "mistral"))
+    else:
+        asyncio.run(bench_llm(FakeMistral(latency=args.latency), cases, "fake LLM (latency only)"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Server CPU per session with and without the VAD gate on a long call.
+
+The synthetic call alternates short utterances with long quiet stretches
+(background noise around -60 dBFS), as when the caller is busy with chest
+compressions. Each path ingests it in 20 ms frames; the cost downstream of
+the gate is represented by the resampling, the one stage the servers always
+run, so the real saving (recorder VAD and realtime Whisper on the skipped
+audio) is larger.
+
+Usage: python bench_vad_gate.py [--minutes 5] [--speech-ratio 0.15] [--rate 48000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from bench_resample import make_signal
+from resampler import StreamingResampler
+from vad_gate import VadGate, webrtcvad
+
+FRAME_MS = 20
+UTTERANCE_SECONDS = 3.0
+
+
+def make_call(rate: int, minutes: float, speech_ratio: float) -> np.ndarray:
+    rng = np.random.default_rng(1)
+    speech = make_signal(rate, UTTERANCE_SECONDS)
+    pause = int(UTTERANCE_SECONDS * rate * (1 - speech_ratio) / speech_ratio)
+    parts = []
+    total = int(minutes * 60 * rate)
+    while sum(len(p) for p in parts) < total:
+        parts.append(speech)
+        parts.append((30 * rng.standard_normal(pause)).astype(np.int16))
+    return np.concatenate(parts)[:total]
+
+
+def run(call: np.ndarray, rate: int, gate: bool) -> tuple[float, float]:
+    step = rate * FRAME_MS // 1000
+    resampler = StreamingResampler(rate, 16000)
+    vad = VadGate(rate) if gate else None
+    start = time.perf_counter()
+    for i in range(0, len(call), step):
+        samples = call[i : i + step]
+        if vad is not None:
+            samples = vad.process(samples)
+            if not len(samples):
+                continue
+        resampler.process(samples)
+    elapsed = time.perf_counter() - start
+    return elapsed, vad.stats.saved if vad is not None else 0.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, default=5.0)
+    parser.add_argument("--speech-ratio", type=float, default=0.15)
+    parser.add_argument("--rate", type=int, default=48000)
+    args = parser.parse_args()
+
+    call = make_call(args.rate, args.minutes, args.speech_ratio)
+    seconds = len(call) / args.rate
+    print(f"{seconds:.0f}s call at {args.rate} Hz, WebRTC VAD {'on' if webrtcvad else 'not installed'}")
+    for name, gate in (("no gate", False), ("VAD gate", True)):
+        elapsed, saved = run(call, args.rate, gate)
+        print(
+            f"{name:<10} {elapsed * 1e3 / seconds:6.3f} ms CPU per s of audio | "
+            f"{saved:5.1%} of the audio skipped"
+        )
+
+
+if __name__ == "__main__":
+    main()
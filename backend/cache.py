@@ -0,0 +1,229 @@
+import atexit
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+# Writes to the SQLite file are batched: buffered puts are written in one
+# transaction every FLUSH_EVERY puts or FLUSH_INTERVAL seconds, and expired or
+# surplus rows are pruned every PRUNE_EVERY puts rather than on each one.
+FLUSH_EVERY = 32
+FLUSH_INTERVAL = 1.0
+PRUNE_EVERY = 1024
+
+# Punctuation and fillers the transcriber adds or drops between otherwise
+# identical utterances ("Help! He's choking!!!" / "help he's choking").
+_PUNCTUATION_RE = re.compile(r"[^\w\s']+")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of ``text``."""
+    text = unicodedata.normalize("NFC", text).casefold().replace("’", "'")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+@lru_cache(maxsize=32)
+def schema_hash(response_format: type) -> str:
+    """Fingerprint of a response format, so a schema change invalidates entries."""
+    if isinstance(response_format, type) and issubclass(response_format, BaseModel):
+        schema = response_format.model_json_schema()
+    else:
+        schema = repr(response_format)
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def cache_key(
+    model: str,
+    system_prompt_hash: str,
+    messages: list[dict[str, str]],
+    response_format: type,
+    **params,
+) -> str:
+    """
+    Key of a chat completion request.
+
+    Args:
+        model: Model identifier
+        system_prompt_hash: sha256 of the pinned system prompt; the system
+            message itself is not hashed again on every request
+        messages: The turns sent after the system prompt; contents are normalized
+        response_format: Expected response format
+        params: Other request parameters that change the output (max_tokens, ...)
+    """
+    payload = [
+        model,
+        system_prompt_hash,
+        schema_hash(response_format),
+        sorted(params.items()),
+        [[m["role"], normalize_text(m["content"])] for m in messages],
+    ]
+    return hashlib.sha256(
+        json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def as_dict(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class ResponseCache:
+    """LRU cache of raw LLM responses with TTL and optional persistence.
+
+    Only deterministic requests (``temperature == 0``) should be cached. Values
+    are the raw response text so any response format can be stored. With a
+    ``path``, entries also go to a SQLite file shared across processes and
+    restarts; the in-memory LRU sits in front of it. Disk writes are batched,
+    so other processes see a put after at most ``FLUSH_INTERVAL`` seconds or
+    ``FLUSH_EVERY`` puts, or once ``flush()`` is called.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 24 * 3600,
+        path: Optional[Path] = None,
+        max_disk_entries: int = 100_000,
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Entries kept in memory; least recently used are evicted
+            ttl: Seconds an entry stays valid. If None, entries never expire
+            path: SQLite file backing the cache. If None, memory only
+            max_disk_entries: Entries kept on disk, enforced every ``PRUNE_EVERY``
+                puts so the file may briefly hold a few more
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.stats = CacheStats()
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._unflushed: dict[str, tuple[float, str]] = {}
+        self._flushed_at = time.monotonic()
+        self._puts_since_prune = 0
+        if path is not None:
+            self._db = sqlite3.connect(str(path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.commit()
+            atexit.register(self.flush)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self._db is not None:
+                entry = self._unflushed.get(key)
+                if entry is None:
+                    row = self._db.execute(
+                        "SELECT expires_at, value FROM responses WHERE key = ?", (key,)
+                    ).fetchone()
+                    entry = (row[0], row[1]) if row is not None else None
+                if entry is not None:
+                    self._store(key, entry)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            if entry[0] <= now:
+                self._discard(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: str) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else float("inf")
+        with self._lock:
+            self._store(key, (expires_at, value))
+            if self._db is not None:
+                self._unflushed[key] = (expires_at, value)
+                self._puts_since_prune += 1
+                if (
+                    len(self._unflushed) >= FLUSH_EVERY
+                    or time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+                ):
+                    self._flush()
+
+    def flush(self) -> None:
+        """Write buffered puts to the SQLite file now."""
+        with self._lock:
+            if self._db is not None:
+                self._flush()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._unflushed.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _store(self, key: str, entry: tuple[float, str]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats.evictions += 1
+
+    def _flush(self) -> None:
+        self._flushed_at = time.monotonic()
+        if self._unflushed:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                [(key, value, expires_at) for key, (expires_at, value) in self._unflushed.items()],
+            )
+            self._unflushed.clear()
+        if self._puts_since_prune >= PRUNE_EVERY:
+            self._puts_since_prune = 0
+            self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+            (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+            if count > self.max_disk_entries:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY expires_at LIMIT ?)",
+                    (count - self.max_disk_entries,),
+                )
+        self._db.commit()
+
+    def _discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+        self._unflushed.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
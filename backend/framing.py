@@ -0,0 +1,108 @@
+"""Binary audio framing shared by the WebSocket servers and their clients.
+
+Every audio message is one frame: a fixed 28-byte little-endian header
+followed by the payload.
+
+    offset  size  field
+         0     2  magic, b"AF"
+         2     1  version (FRAME_VERSION)
+         3     1  codec (Codec)
+         4     4  session, chosen by the client, constant for a stream
+         8     4  seq, incremented by one per frame
+        12     4  sample_rate, Hz
+        16     8  timestamp, capture time in ms since the Unix epoch
+        24     4  payload_length, bytes
+
+For ``Codec.PCM16`` the payload is mono signed 16-bit little-endian PCM; for
+``Codec.OPUS`` it is one Opus packet (see audio_codecs.py).
+"""
+
+import struct
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Optional, Union
+
+import numpy as np
+
+MAGIC = b"AF"
+FRAME_VERSION = 1
+HEADER = struct.Struct("<2sBBIIIQI")
+HEADER_SIZE = HEADER.size
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+class Codec(IntEnum):
+    PCM16 = 0
+    OPUS = 1
+
+
+class FrameError(ValueError):
+    """Raised when a message is not a valid audio frame."""
+
+
+@dataclass(frozen=True)
+class AudioFrame:
+    """A parsed frame; ``payload`` is a view into the received message."""
+
+    session: int
+    seq: int
+    sample_rate: int
+    codec: Codec
+    timestamp: int
+    payload: memoryview
+
+    def samples(self) -> np.ndarray:
+        """The PCM16 payload as an int16 array sharing the message's memory."""
+        if self.codec != Codec.PCM16:
+            raise FrameError(f"Frame payload is {self.codec.name}, not PCM16")
+        return np.frombuffer(self.payload, dtype="<i2")
+
+
+def is_frame(message: Buffer) -> bool:
+    return len(message) >= HEADER_SIZE and bytes(message[:2]) == MAGIC
+
+
+def encode_frame(
+    payload: Buffer,
+    *,
+    session: int,
+    seq: int,
+    sample_rate: int,
+    codec: Codec = Codec.PCM16,
+    timestamp: Optional[int] = None,
+) -> bytes:
+    """Build a frame, e.g. on the client side or in tests."""
+    if timestamp is None:
+        timestamp = int(time.time() * 1000)
+    header = HEADER.pack(
+        MAGIC, FRAME_VERSION, codec, session, seq, sample_rate, timestamp, len(payload)
+    )
+    return header + bytes(payload)
+
+
+def parse_frame(message: Buffer) -> AudioFrame:
+    """
+    Parse a frame without copying its payload.
+
+    Raises:
+        FrameError: If the magic, version, codec or length is wrong
+    """
+    view = memoryview(message)
+    if len(view) < HEADER_SIZE:
+        raise FrameError(f"Frame shorter than its {HEADER_SIZE}-byte header")
+    magic, version, codec, session, seq, sample_rate, timestamp, length = HEADER.unpack_from(view)
+    if magic != MAGIC:
+        raise FrameError("Not an audio frame")
+    if version != FRAME_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if len(view) - HEADER_SIZE != length:
+        raise FrameError(f"Payload is {len(view) - HEADER_SIZE} bytes, header says {length}")
+    try:
+        codec = Codec(codec)
+    except ValueError:
+        raise FrameError(f"Unknown codec {codec}")
+    if codec == Codec.PCM16 and length % 2:
+        raise FrameError("PCM16 payload has an odd number of bytes")
+    return AudioFrame(session, seq, sample_rate, codec, timestamp, view[HEADER_SIZE:])
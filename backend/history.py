@@ -0,0 +1,140 @@
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from prompt import Tokenizer, count_tokens
+
+Message = dict[str, str]
+# Folds evicted messages into the running summary: (previous summary, evicted) -> summary.
+Summarizer = Callable[[Optional[str], list[Message]], str]
+
+SUMMARY_HEADER = "Summary of the earlier conversation:"
+
+
+def extractive_summarizer(max_tokens: int = 300, tokenizer: Tokenizer = count_tokens) -> Summarizer:
+    """
+    Summarize without a model call: keep one line per evicted message, newest
+    last, and drop the oldest lines once the summary exceeds ``max_tokens``.
+
+    What the caller said (ages, symptoms, location) is kept verbatim; the
+    assistant's turns are reduced to their first line, which for structured
+    responses holds the function that was chosen.
+    """
+
+    def summarize(previous: Optional[str], evicted: list[Message]) -> str:
+        lines = previous.splitlines() if previous else []
+        for message in evicted:
+            content = " ".join(message["content"].split())
+            if message["role"] == "assistant":
+                content = content[:160]
+            lines.append(f"{message['role']}: {content}")
+        while len(lines) > 1 and tokenizer("\n".join(lines)) > max_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
+
+    return summarize
+
+
+@dataclass
+class HistoryMetrics:
+    """Per-conversation accounting of what is sent to the model."""
+
+    tokens_sent: list[int] = field(default_factory=list)
+    truncated_messages: int = 0
+    summarizations: int = 0
+
+    def record_turn(self, tokens: int) -> None:
+        self.tokens_sent.append(tokens)
+
+    def as_dict(self) -> dict[str, float]:
+        sent = self.tokens_sent or [0]
+        return {
+            "turns": len(self.tokens_sent),
+            "last_tokens_sent": sent[-1],
+            "max_tokens_sent": max(sent),
+            "mean_tokens_sent": sum(sent) / len(sent),
+            "truncated_messages": self.truncated_messages,
+            "summarizations": self.summarizations,
+        }
+
+
+class ConversationHistory:
+    """Chat history kept within a token budget.
+
+    The system prompt and the last ``keep_last_exchanges`` user/assistant
+    exchanges are always sent. Older messages are evicted oldest first once the
+    budget is exceeded and folded into a rolling summary appended to the system
+    message, so the system prompt itself stays a byte-identical prefix.
+    """
+
+    def __init__(
+        self,
+        system_prompt: str,
+        *,
+        token_budget: int = 8000,
+        keep_last_exchanges: int = 3,
+        tokenizer: Tokenizer = count_tokens,
+        summarizer: Optional[Summarizer] = None,
+    ):
+        """
+        Initialize the history.
+
+        Args:
+            system_prompt: Pinned first message
+            token_budget: Maximum tokens of system prompt, summary and turns
+            keep_last_exchanges: Exchanges never evicted, whatever the budget
+            tokenizer: Token counter used for the budget
+            summarizer: Folds evicted messages into the summary. If None, uses
+                :func:`extractive_summarizer`
+        """
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.keep_last_exchanges = keep_last_exchanges
+        self.tokenizer = tokenizer
+        self.summarizer = summarizer or extractive_summarizer(tokenizer=tokenizer)
+        self.summary: Optional[str] = None
+        self.turns: list[Message] = []
+        self.metrics = HistoryMetrics()
+        self._system_tokens = tokenizer(system_prompt)
+        self._turn_tokens: list[int] = []
+        self._summary_tokens = 0
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    @property
+    def tokens(self) -> int:
+        return self._system_tokens + self._summary_tokens + sum(self._turn_tokens)
+
+    def append(self, role: str, content: str) -> None:
+        self.turns.append({"role": role, "content": content})
+        self._turn_tokens.append(self.tokenizer(content))
+        self._enforce_budget()
+
+    def pop(self) -> Message:
+        """Remove the newest message, e.g. after a failed request."""
+        self._turn_tokens.pop()
+        return self.turns.pop()
+
+    def messages(self) -> list[Message]:
+        """The messages to send: system (with summary) followed by the kept turns."""
+        system = self.system_prompt
+        if self.summary:
+            system = f"{system}\n\n{SUMMARY_HEADER}\n{self.summary}"
+        return [{"role": "system", "content": system}, *self.turns]
+
+    def _enforce_budget(self) -> None:
+        pinned = 2 * self.keep_last_exchanges + 1
+        evicted: list[Message] = []
+        while self.tokens > self.token_budget and len(self.turns) > pinned:
+            evicted.append(self.turns.pop(0))
+            self._turn_tokens.pop(0)
+            # Never leave an assistant message without the question it answers.
+            if self.turns and self.turns[0]["role"] == "assistant" and len(self.turns) > pinned:
+                evicted.append(self.turns.pop(0))
+                self._turn_tokens.pop(0)
+
+        if evicted:
+            self.metrics.truncated_messages += len(evicted)
+            self.metrics.summarizations += 1
+            self.summary = self.summarizer(self.summary, evicted)
+            self._summary_tokens = self.tokenizer(f"{SUMMARY_HEADER}\n{self.summary}")
@@ -0,0 +1,66 @@
+from typing import Optional
+
+from retrieval import expand_query, tokenize
+
+# Cues for each protocol of functions.json, matched after query expansion.
+INTENT_KEYWORDS = {
+    "assistance_obstruction_voies_respiratoires": "étouffe étouffement obstruction corps étranger avalé",
+    "assistance_hemorragie_externe": "saigne saignement hémorragie sang",
+    "assistance_perte_connaissance": "inconscient inconsciente connaissance répond respire respiration",
+    "assistance_arret_cardiaque": "arrêt cardiaque massage compressions pouls",
+    "assistance_malaise": "malaise vertiges douleur poitrine",
+    "assistance_plaie": "plaie coupure",
+    "assistance_brule": "brûlure brûlé brûlée",
+    "assistance_traumatisme_os_articulations": "fracture entorse luxation cassé traumatisme os",
+    "assistance_utilisation_defibrillateur": "défibrillateur dae défibrillation",
+}
+# The most frequent protocols, answered locally when clearly indicated. The
+# others still take part in scoring, so a competing symptom makes the
+# classifier abstain rather than pick the wrong protocol.
+LOCAL_INTENTS = frozenset(
+    {
+        "assistance_obstruction_voies_respiratoires",
+        "assistance_hemorragie_externe",
+        "assistance_brule",
+        "assistance_traumatisme_os_articulations",
+    }
+)
+# Distinct cue stems an utterance must contain before the classifier commits
+# to a protocol.
+MIN_INTENT_SCORE = 2
+
+
+class IntentClassifier:
+    """Keyword pre-classifier mapping a first utterance to a protocol.
+
+    It is deliberately conservative: it abstains unless exactly one protocol
+    has cues, leaving ambiguous or multi-symptom calls to the model.
+    """
+
+    def __init__(
+        self,
+        keywords: Optional[dict[str, str]] = None,
+        local_intents: frozenset[str] = LOCAL_INTENTS,
+    ):
+        keywords = keywords or INTENT_KEYWORDS
+        self.local_intents = local_intents
+        self.cues = {name: frozenset(tokenize(words)) for name, words in keywords.items()}
+
+    def scores(self, utterance: str) -> dict[str, int]:
+        terms = set(tokenize(expand_query(utterance)))
+        return {name: len(cues & terms) for name, cues in self.cues.items()}
+
+    def preselect(self, utterance: str, min_score: int = 1) -> Optional[str]:
+        """The only protocol with at least ``min_score`` cues in ``utterance``, if any."""
+        matched = {name: score for name, score in self.scores(utterance).items() if score}
+        if len(matched) != 1:
+            return None
+        (name, score), = matched.items()
+        return name if score >= min_score else None
+
+    def classify(self, utterance: str) -> Optional[str]:
+        """Return the function name ``utterance`` clearly calls for, or None."""
+        name = self.preselect(utterance, MIN_INTENT_SCORE)
+        if name not in self.local_intents:
+            return None
+        return name
@@ -1,13 +1,28 @@
+import asyncio
+import copy
+import hashlib
 import json
 import os
+import re
+import threading
+import unicodedata
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Generic, Optional, TypeVar
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Generic, Optional, TypeVar
 
 from dotenv import load_dotenv
-from mistralai import Mistral
 from pydantic import BaseModel, Field
-from RealtimeSTT import AudioToTextRecorder
+
+from cache import ResponseCache, cache_key
+from history import ConversationHistory
+from intents import LOCAL_INTENTS, IntentClassifier
+from prompt import Tokenizer, count_tokens, load_system_prompt
+from retrieval import GuideIndex
+from schemas import FunctionSchemas, SchemaError, response_format as sdk_response_format
+
+if TYPE_CHECKING:
+    from mistralai import Mistral
 
 # Type variable for response format
 T = TypeVar("T")
@@ -21,6 +36,8 @@ class Config:
     guide_path: Path = base_path / "guide.txt"
     functions_path: Path = base_path / "functions.json"
     user_example_path: Path = base_path / "user-example.txt"
+    # Generated on first use; not required to exist.
+    index_path: Path = base_path / "guide-index.json"
 
     def __post_init__(self):
         """Validate all paths exist on initialization."""
@@ -40,14 +57,305 @@ class Function(BaseModel):
     )
 
 
+# Phrases naming a protocol outright, in French and English, matched on
+# lowercased, accent-free text. One phrase weighs PHRASE_WEIGHT cue stems.
+ROUTE_PATTERNS = {
+    "assistance_obstruction_voies_respiratoires": (
+        r"s'?etouff\w*|chok\w*|fausse route|corps etranger|avale de travers"
+        r"|can'?t (?:breathe|talk|speak)|cannot (?:breathe|talk|speak)"
+        r"|ne (?:peut|arrive) plus (?:a )?(?:parler|respirer)|stuck in (?:his|her|their|my) throat"
+    ),
+    "assistance_hemorragie_externe": r"saign\w*|hemorragi\w*|bleed\w*|blood\w*|pisse le sang|gicl\w*",
+    "assistance_perte_connaissance": (
+        r"inconscient\w*|unconscious|passed out|perdu connaissance|ne repond (?:plus|pas)"
+        r"|(?:won'?t|doesn'?t|does not|is not|isn'?t) (?:wake up|respond\w*)"
+    ),
+    "assistance_arret_cardiaque": (
+        r"arret cardiaque|cardiac arrest|heart (?:attack|stopped)|crise cardiaque|no pulse"
+        r"|pas de pouls|massage cardiaque|\bcpr\b|\brcp\b"
+    ),
+    "assistance_malaise": (
+        r"malaise|vertige\w*|dizz\w*|faint\w*|evanoui\w*|chest pain"
+        r"|douleur (?:a|dans) la poitrine|feels? unwell|sent pas bien"
+    ),
+    "assistance_plaie": r"plaie|coupure|wound|\bcut\b|gash|entaille",
+    "assistance_brule": r"brul\w*|burn\w*|scald\w*|ebouillant\w*",
+    "assistance_traumatisme_os_articulations": (
+        r"fractur\w*|entorse|luxation|sprain\w*|dislocat\w*|broken (?:arm|leg|wrist|ankle|bone|hip)"
+        r"|(?:bras|jambe|poignet|cheville|os) casse|twisted (?:his|her|my|their) ankle"
+    ),
+    "assistance_position_laterale_securite": r"position laterale|recovery position|\bpls\b",
+    "assistance_utilisation_defibrillateur": r"defibrillat\w*|\bdae\b|\baed\b",
+}
+PHRASE_WEIGHT = 2
+# A phrase preceded by one of these (within two words) is negated:
+# "he's not bleeding", "elle ne saigne pas", "no blood".
+_NEGATION_RE = re.compile(
+    r"(?:\b(?:not|no|never|without|ne|pas|sans|jamais|aucune?)|n't|n')\s+(?:[\w']+\s+){0,2}$"
+)
+
+_NUMBER_WORDS = {
+    "un": 1, "une": 1, "one": 1, "deux": 2, "two": 2, "trois": 3, "three": 3,
+    "quatre": 4, "four": 4, "cinq": 5, "five": 5, "six": 6, "sept": 7, "seven": 7,
+    "huit": 8, "eight": 8, "neuf": 9, "nine": 9, "dix": 10, "ten": 10,
+    "onze": 11, "eleven": 11, "douze": 12, "twelve": 12,
+}
+_NUMBER = r"(\d+(?:[.,]\d+)?|" + "|".join(_NUMBER_WORDS) + r")"
+_AGE_RE = re.compile(_NUMBER + r"[\s-]*(ans?|years?|yrs?|yo|mois|months?)\b")
+_CM_RE = re.compile(_NUMBER + r"\s*(?:cm|centimet\w*)\b(?!\s*(?:2|²|carr|square))")
+_CM2_RE = re.compile(_NUMBER + r"\s*(?:cm\s*(?:2|²)|centimet\w* carr\w*|square centimet\w*)")
+
+# Body parts named by callers, mapped to the French the functions use.
+_BODY_PARTS = {
+    "bras": "bras", "arm": "bras", "jambe": "jambe", "leg": "jambe", "tete": "tête",
+    "head": "tête", "main": "main", "hand": "main", "pied": "pied", "foot": "pied",
+    "cou": "cou", "neck": "cou", "poignet": "poignet", "wrist": "poignet",
+    "cheville": "cheville", "ankle": "cheville", "genou": "genou", "knee": "genou",
+    "epaule": "épaule", "shoulder": "épaule", "visage": "visage", "face": "visage",
+    "doigt": "doigt", "finger": "doigt", "ventre": "ventre", "belly": "ventre",
+    "stomach": "ventre", "poitrine": "poitrine", "chest": "poitrine",
+    "cuisse": "cuisse", "thigh": "cuisse", "hanche": "hanche", "hip": "hanche",
+}
+_BODY_PART_RE = re.compile(r"\b(" + "|".join(_BODY_PARTS) + r")s?\b")
+
+# String and boolean parameters: the first matching pattern gives the value.
+_PARAMETER_VALUES: dict[str, list[tuple[str, Any]]] = {
+    "intensite_saignement": [
+        (r"abondant\w*|enorm\w*|beaucoup de sang|heav\w*|a lot|lots of|so much|massive\w*|gicl\w*|spurt\w*|won'?t stop|sans arret", "abondant"),
+        (r"leger\w*|un peu|a little|slight\w*|minor", "léger"),
+    ],
+    "respiration_normale": [
+        (r"(?:ne|n') respire (?:plus|pas)|(?:not|n't|no longer|stopped) breathing|can'?t breathe|ne respire|pas de respiration", False),
+        (r"respire|breathing|breathes", True),
+    ],
+    "conscience": [
+        (r"inconscient\w*|unconscious|ne repond|passed out|evanoui\w*|faint\w*", False),
+        (r"conscient\w*|conscious|awake|repond|talking|parle", True),
+    ],
+    "type_malaise": [
+        (r"evanoui\w*|faint\w*|passed out", "évanouissement"),
+        (r"vertige\w*|dizz\w*", "vertiges"),
+        (r"douleur\w*|pain\w*|mal (?:a|au)", "douleurs"),
+    ],
+    "profondeur": [
+        (r"peu profond\w*|superficiel\w*|shallow|small|petite?", "peu profonde"),
+        (r"profond\w*|deep", "profonde"),
+    ],
+    "type_brule": [
+        (r"chimique|chemical|acid\w*|acide|javel|bleach|produit", "chimique"),
+        (r"thermique|feu|fire|flamme\w*|flame\w*|bouillant\w*|boiling|chaud\w*|hot|stove|four|oven|vapeur|steam|scald\w*", "thermique"),
+    ],
+    "type_trauma": [
+        (r"fractur\w*|broken|casse\w*", "fracture"),
+        (r"entorse|sprain\w*|twisted|tordu\w*", "entorse"),
+        (r"luxation|luxe\w*|dislocat\w*|deboite\w*", "luxation"),
+    ],
+    "type_defibrillateur": [
+        (r"\bdae\b|\baed\b|automati\w*", "DAE"),
+        (r"manuel|manual", "manuel"),
+    ],
+}
+
+
+def _fold(text: str) -> str:
+    """Lowercase ``text`` and strip its accents."""
+    text = unicodedata.normalize("NFKD", text.lower().replace("’", "'"))
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def _number(word: str) -> float:
+    return float(_NUMBER_WORDS.get(word) or word.replace(",", "."))
+
+
+@dataclass
+class RouterStats:
+    routed: int = 0
+    fallbacks: int = 0
+
+    def as_dict(self) -> dict[str, float]:
+        total = self.routed + self.fallbacks
+        return {
+            "routed": self.routed,
+            "fallbacks": self.fallbacks,
+            "routed_ratio": self.routed / total if total else 0.0,
+        }
+
+
+@dataclass
+class RouteDecision:
+    """What the router made of an utterance."""
+
+    # Best-scoring protocol, even when it is not confident enough to route.
+    intent: Optional[str]
+    confidence: float
+    scores: dict[str, float]
+    # The call to make without asking the model, when confident.
+    function: Optional[Function] = None
+
+
+class FunctionRouter:
+    """Local fast path from a transcript to a :class:`Function` call.
+
+    Each utterance is matched against one compiled automaton of protocol
+    phrases (see ROUTE_PATTERNS) and scored by a linear classifier over the
+    phrase hits and the :class:`IntentClassifier` cue stems; negated phrases
+    ("he's not bleeding") count against their protocol. When a protocol the
+    router may answer holds most of the score, its function is emitted
+    directly, with the parameters of functions.json that can be read off the
+    transcript (age, body part, breathing...). Anything else returns None and
+    goes to the model.
+    """
+
+    def __init__(
+        self,
+        functions_path: Optional[Path] = None,
+        *,
+        classifier: Optional[IntentClassifier] = None,
+        local_intents: frozenset[str] = LOCAL_INTENTS,
+        min_score: float = 3,
+        min_confidence: float = 0.75,
+    ):
+        """
+        Initialize the router.
+
+        Args:
+            functions_path: functions.json; defaults to the one of :class:`Config`
+            classifier: Cue-stem classifier; defaults to :class:`IntentClassifier`
+            local_intents: Protocols that may be answered without the model
+            min_score: Weighted evidence the best protocol needs
+            min_confidence: Share of the total score it needs
+        """
+        functions_path = functions_path or Config.functions_path
+        functions = json.loads(Path(functions_path).read_text(encoding="utf-8"))["functions"]
+        self.functions = {f["name"]: f for f in functions}
+        self.classifier = classifier or IntentClassifier()
+        self.local_intents = local_intents
+        self.min_score = min_score
+        self.min_confidence = min_confidence
+        self.stats = RouterStats()
+        self._stats_lock = threading.Lock()
+        self._automaton = re.compile(
+            "|".join(
+                f"(?P<i{i}>{pattern})"
+                for i, pattern in enumerate(ROUTE_PATTERNS.values())
+            )
+        )
+        self._intents = list(ROUTE_PATTERNS)
+        self._values = {
+            name: [(re.compile(pattern), value) for pattern, value in table]
+            for name, table in _PARAMETER_VALUES.items()
+        }
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def shared(cls, functions_path: Path) -> "FunctionRouter":
+        """The router for ``functions_path``, built on first use and reused across sessions."""
+        return cls(functions_path)
+
+    def decide(self, utterance: str) -> RouteDecision:
+        """Score ``utterance`` against every protocol."""
+        text = _fold(utterance)
+        phrases: dict[str, set[str]] = {}
+        negated: set[str] = set()
+        for match in self._automaton.finditer(text):
+            intent = self._intents[int(match.lastgroup[1:])]
+            if _NEGATION_RE.search(text, max(0, match.start() - 30), match.start()):
+                negated.add(intent)
+            else:
+                phrases.setdefault(intent, set()).add(match.group())
+
+        scores: dict[str, float] = {}
+        for intent, cues in self.classifier.scores(utterance).items():
+            hits = len(phrases.get(intent, ()))
+            if intent in negated and not hits:
+                continue
+            score = PHRASE_WEIGHT * hits + cues
+            if score:
+                scores[intent] = score
+        for intent, hits in phrases.items():
+            scores.setdefault(intent, PHRASE_WEIGHT * len(hits))
+
+        if not scores:
+            return RouteDecision(None, 0.0, scores)
+        intent = max(scores, key=scores.get)
+        confidence = scores[intent] / sum(scores.values())
+        decision = RouteDecision(intent, confidence, scores)
+        if (
+            intent in self.local_intents
+            and intent in self.functions
+            and scores[intent] >= self.min_score
+            and confidence >= self.min_confidence
+        ):
+            spec = self.functions[intent]
+            decision.function = Function(
+                name=intent,
+                description=spec["description"],
+                arguments=self.extract_arguments(intent, utterance),
+            )
+        return decision
+
+    def route(self, utterance: str) -> Optional[Function]:
+        """The function ``utterance`` unambiguously calls for, or None to ask the model."""
+        function = self.decide(utterance).function
+        with self._stats_lock:
+            if function is not None:
+                self.stats.routed += 1
+            else:
+                self.stats.fallbacks += 1
+        return function
+
+    def extract_arguments(self, name: str, utterance: str) -> dict[str, Any]:
+        """The parameters of function ``name`` stated in ``utterance``; others are omitted."""
+        text = _fold(utterance)
+        arguments: dict[str, Any] = {}
+        for parameter in self.functions[name]["parameters"]:
+            value = self._extract(parameter["name"], text)
+            if value is None:
+                continue
+            if parameter["type"] == "number" and isinstance(value, float) and value.is_integer():
+                value = int(value)
+            arguments[parameter["name"]] = value
+        return arguments
+
+    def _extract(self, parameter: str, text: str) -> Any:
+        if parameter == "âge":
+            match = _AGE_RE.search(text)
+            if match is None:
+                return None
+            age = _number(match.group(1))
+            return round(age / 12, 1) if match.group(2).startswith("mo") else age
+        if parameter == "zone_corporelle":
+            match = _BODY_PART_RE.search(text)
+            return _BODY_PARTS[match.group(1)] if match else None
+        if parameter == "taille_plaie_cm":
+            match = _CM_RE.search(text)
+            return _number(match.group(1)) if match else None
+        if parameter == "surface_touchee":
+            match = _CM2_RE.search(text)
+            return _number(match.group(1)) if match else None
+        for pattern, value in self._values.get(parameter, ()):
+            if pattern.search(text):
+                return value
+        return None
+
+
 class LLMAssistant(Generic[T]):
     """A generic LLM assistant that can work with different response formats."""
 
     def __init__(
         self,
         config: Optional[Config] = None,
-        client: Optional[Mistral] = None,
+        client: Optional["Mistral"] = None,
         system_prompt: Optional[str] = None,
+        retrieval_top_k: Optional[int] = 4,
+        guide_index: Optional[GuideIndex] = None,
+        history_token_budget: int = 8000,
+        keep_last_exchanges: int = 3,
+        tokenizer: Tokenizer = count_tokens,
+        response_cache: Optional[ResponseCache] = None,
+        intent_classifier: Optional[IntentClassifier] = None,
+        router: Optional[FunctionRouter] = None,
+        schemas: Optional[FunctionSchemas] = None,
     ):
         """
         Initialize the LLM Assistant.
@@ -55,46 +363,96 @@ class LLMAssistant(Generic[T]):
         Args:
             config: Configuration object. If None, uses default Config
             client: Mistral client. If None, creates new client using env variables
+            system_prompt: Prebuilt system prompt, e.g. shared between sessions
+            retrieval_top_k: Number of guide passages sent with each user turn.
+                If None or 0, the whole guide is embedded in the system prompt
+            guide_index: Prebuilt guide index. If None and retrieval is enabled,
+                the index persisted at ``config.index_path`` is loaded or built
+            history_token_budget: Token budget of system prompt plus history;
+                older turns are summarized beyond it
+            keep_last_exchanges: Recent exchanges always sent verbatim
+            tokenizer: Token counter used for budgeting and metrics
+            response_cache: Cache of deterministic responses, e.g. shared
+                between sessions. If None, an in-memory cache is created
+            intent_classifier: Lets first turns that clearly match a frequent
+                protocol be answered from the cache. If None, uses the default
+                :class:`IntentClassifier`
+            router: Answers utterances that unambiguously call for a frequent
+                protocol locally, without a request to the model. If None,
+                every turn goes to the model
+            schemas: Argument models that :class:`Function` responses are
+                validated and repaired against. If None, the ones built from
+                ``config.functions_path`` once per process are used
         """
         load_dotenv()
 
         self.config = config or Config()
         self.client = client or self._create_client()
-        self.history: list[dict[str, str]] = []
+        self.retrieval_top_k = retrieval_top_k or 0
+        self.guide_index = None
+        if self.retrieval_top_k:
+            self.guide_index = guide_index or GuideIndex.load_or_build(
+                self.config.guide_path, self.config.index_path
+            )
         self.system_prompt = system_prompt or self._build_system_prompt()
+        self.system_prompt_hash = hashlib.sha256(self.system_prompt.encode("utf-8")).hexdigest()
+        self.response_cache = response_cache if response_cache is not None else ResponseCache()
+        self.intent_classifier = intent_classifier or IntentClassifier()
+        self.router = router
+        self.schemas = schemas or FunctionSchemas.shared(self.config.functions_path)
 
         # Initialize chat history with system prompt
-        self.history = [{"role": "system", "content": self.system_prompt}]
-
-    def _create_client(self) -> Mistral:
+        self.history = ConversationHistory(
+            self.system_prompt,
+            token_budget=history_token_budget,
+            keep_last_exchanges=keep_last_exchanges,
+            tokenizer=tokenizer,
+        )
+
+    def _create_client(self) -> "Mistral":
         """Create and return a new Mistral client."""
         api_key = os.getenv("MISTRAL_API_KEY")
         if not api_key:
             raise ValueError("MISTRAL_API_KEY environment variable not set")
+        # Imported here: the SDK takes most of a second to import, which
+        # servers given a client (or a fake) should not pay.
+        from mistralai import Mistral
+
         return Mistral(api_key=api_key)
 
     def _build_system_prompt(self) -> str:
         """Build the system prompt from various components."""
         try:
-            with open(self.config.guide_path) as f:
-                reference_guide = f.read()
-
-            with open(self.config.functions_path) as f:
-                first_aid_functions = json.load(f)["functions"]
-
-            return "\n\n".join(
-                [
-                    f"Use the following reference guide to complete the task:\n{reference_guide}",
-                    f"I have a list of first aid functions, each with a description and expected arguments. "
-                    f"Based on a user's input, I want to choose the appropriate function to call. "
-                    f"The list of available functions is as follows:\n{first_aid_functions}",
-                    "You should systematically ask for more context information if the user's input is "
-                    "ambiguous or incomplete. Don't take any risk with first aid.",
-                ]
-            )
+            return load_system_prompt(
+                self.config.guide_path,
+                self.config.functions_path,
+                include_guide=self.guide_index is None,
+            ).text
         except Exception as e:
             raise RuntimeError(f"Failed to build system prompt: {str(e)}")
 
+    def _messages_for_request(self) -> list[dict[str, str]]:
+        """The history to send, with guide excerpts attached to the last user turn.
+
+        Excerpts are only sent with the current turn and never stored in the
+        history, so earlier turns stay short and the prefix stays stable.
+        """
+        messages = self.history.messages()
+        if self.guide_index is None:
+            return messages
+
+        user_turns = [m["content"] for m in messages if m["role"] == "user"]
+        # The previous turn helps with follow-ups such as "he's still not breathing".
+        query = "\n".join(user_turns[-2:])
+        context = self.guide_index.context(query, self.retrieval_top_k)
+        if context is None:
+            return messages
+
+        last = messages[-1]
+        return messages[:-1] + [
+            {"role": last["role"], "content": f"{context}\n\n---\n\n{last['content']}"}
+        ]
+
     def chat(
         self,
         prompt: str,
@@ -124,27 +482,351 @@ class LLMAssistant(Generic[T]):
         if not prompt.strip():
             raise ValueError("Prompt cannot be empty")
 
-        try:
-            self.history.append({"role": "user", "content": prompt})
+        routed = self._routed_response(prompt, response_format)
+        if routed is not None:
+            return routed
 
-            response = self.client.chat.parse(
+        try:
+            messages = self._start_turn(prompt)
+            params = {"max_tokens": max_tokens, "temperature": temperature}
+            cached, keys = self._cached_response(prompt, messages, model, response_format, params)
+            if cached is not None:
+                self.history.append("assistant", cached)
+                return cached
+
+            # Same request as client.chat.parse, with the schema built once.
+            response = self.client.chat.complete(
                 model=model,
-                messages=self.history,
-                response_format=response_format,
+                messages=messages,
+                response_format=sdk_response_format(response_format),
                 max_tokens=max_tokens,
                 temperature=temperature,
             )
 
-            result = response.choices[0].message.content
-            self.history.append({"role": "assistant", "content": str(result)})
+            _, result = self._parse(response.choices[0].message.content, response_format)
+            self._cache_response(keys, result)
+            self.history.append("assistant", result)
 
             return result
 
         except Exception as e:
             raise RuntimeError(f"Chat completion failed: {str(e)}")
 
+    async def chat_async(
+        self,
+        prompt: str,
+        *,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+        model: str = "mistral-small-latest",
+        response_format: type[T] = Function,
+        max_tokens: int = 100000,
+        temperature: float = 0.0,
+    ) -> T:
+        """
+        Send a chat message without blocking the event loop, streaming the output.
+
+        Cancelling the awaiting task aborts the request and removes ``prompt``
+        from the history, as if it had never been sent.
+
+        Args:
+            prompt: User's input message
+            on_delta: Awaited with each chunk of raw output as it arrives
+            model: Model identifier to use
+            response_format: Expected response format (must be Pydantic model)
+            max_tokens: Maximum tokens in response
+            temperature: Temperature for response generation
+
+        Returns:
+            Parsed response in specified format
+
+        Raises:
+            ValueError: If prompt is empty
+            RuntimeError: If API call fails
+        """
+        if not prompt.strip():
+            raise ValueError("Prompt cannot be empty")
+
+        routed = self._routed_response(prompt, response_format)
+        if routed is not None:
+            if on_delta is not None:
+                await on_delta(routed)
+            return response_format.model_validate_json(routed)
+
+        messages = self._start_turn(prompt)
+        params = {"max_tokens": max_tokens, "temperature": temperature}
+        cached, keys = self._cached_response(prompt, messages, model, response_format, params)
+        if cached is not None:
+            if on_delta is not None:
+                await on_delta(cached)
+            self.history.append("assistant", cached)
+            return response_format.model_validate_json(cached)
+
+        try:
+            stream = await self.client.chat.stream_async(
+                response_format=sdk_response_format(response_format),
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            parts: list[str] = []
+            async with stream:
+                async for event in stream:
+                    delta = event.data.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if not isinstance(delta, str):
+                        delta = "".join(getattr(chunk, "text", "") for chunk in delta)
+                    parts.append(delta)
+                    if on_delta is not None:
+                        await on_delta(delta)
+
+            result, text = self._parse("".join(parts), response_format)
+        except asyncio.CancelledError:
+            self.history.pop()
+            raise
+        except Exception as e:
+            self.history.pop()
+            raise RuntimeError(f"Chat completion failed: {str(e)}")
+
+        self._cache_response(keys, text)
+        self.history.append("assistant", text)
+        return result
+
+    def _parse(self, text: str, response_format: type[T]) -> tuple[T, str]:
+        """
+        Validate a response, repairing the arguments of a :class:`Function`
+        rather than asking the model again.
+
+        Returns:
+            The parsed response and its text, rewritten if it was repaired
+
+        Raises:
+            pydantic.ValidationError: If the response is not valid JSON of ``response_format``
+            schemas.SchemaError: If it calls a function that does not exist
+        """
+        result = response_format.model_validate_json(text)
+        if isinstance(result, Function):
+            name, arguments = self.schemas.validate(result.name, result.arguments)
+            if name != result.name or arguments != result.arguments:
+                result = result.model_copy(update={"name": name, "arguments": arguments})
+                text = result.model_dump_json()
+        return result, text
+
+    def fork(self) -> "LLMAssistant[T]":
+        """
+        A copy sharing the client, prompt, index and cache but with its own
+        history, for requests that must not touch this conversation until
+        they are confirmed.
+        """
+        clone = copy.copy(self)
+        clone.history = copy.deepcopy(self.history)
+        return clone
+
+    def _routed_response(self, prompt: str, response_format: type) -> Optional[str]:
+        """
+        Answer the turn with the local router if it is confident.
+
+        Returns:
+            The response text, already recorded in the history, or None if
+            the turn must go to the model
+        """
+        if self.router is None or response_format is not Function:
+            return None
+        function = self.router.route(prompt)
+        if function is None:
+            return None
+        text = function.model_dump_json()
+        self.history.append("user", prompt)
+        self.history.append("assistant", text)
+        return text
+
+    def _start_turn(self, prompt: str) -> list[dict[str, str]]:
+        """Record the user turn and return the messages to send for it."""
+        self.history.append("user", prompt)
+        messages = self._messages_for_request()
+        self.history.metrics.record_turn(
+            sum(self.history.tokenizer(m["content"]) for m in messages)
+        )
+        return messages
+
+    def _cached_response(
+        self,
+        prompt: str,
+        messages: list[dict[str, str]],
+        model: str,
+        response_format: type,
+        params: dict[str, Any],
+    ) -> tuple[Optional[str], dict[str, str]]:
+        """
+        Look the turn up in the response cache.
+
+        Returns:
+            The cached response text, if any, and the keys to store a fresh
+            response under: ``"exact"`` for this history and, on a first turn
+            the classifier recognizes, ``"intent"`` with the function name
+        """
+        if params["temperature"] != 0:
+            return None, {}
+
+        keys = {}
+        if len(self.history) == 1 and response_format is Function:
+            intent = self.intent_classifier.classify(prompt)
+            if intent is not None:
+                keys["intent"] = cache_key(
+                    model,
+                    self.system_prompt_hash,
+                    [{"role": "intent", "content": intent}],
+                    response_format,
+                    **params,
+                )
+                keys["function"] = intent
+        keys["exact"] = cache_key(
+            model,
+            self.system_prompt_hash,
+            messages[1:],
+            response_format,
+            summary=self.history.summary or "",
+            **params,
+        )
+
+        cached = self.response_cache.get(keys["exact"])
+        if cached is not None:
+            return cached, keys
+        if "intent" in keys:
+            cached = self.response_cache.get(keys["intent"])
+            if cached is not None:
+                cached = self._fill_arguments(cached, prompt)
+                if cached is not None:
+                    return cached, keys
+        return None, keys
+
+    def _fill_arguments(self, template: str, prompt: str) -> Optional[str]:
+        """
+        An answer cached by intent, with the arguments stated in ``prompt``.
+
+        The template was cached for another caller: their age, body part...
+        must never leak into this answer (choking is handled differently for
+        a child and an adult).
+
+        Returns:
+            The response text, or None if the template no longer fits
+            functions.json
+        """
+        try:
+            function = Function.model_validate_json(template)
+            arguments = self.stated_arguments(function.name, prompt)
+        except (KeyError, SchemaError, ValueError):
+            return None
+        return function.model_copy(update={"arguments": arguments}).model_dump_json()
+
+    def stated_arguments(self, name: str, prompt: str) -> dict[str, Any]:
+        """
+        The arguments of function ``name`` that ``prompt`` states, valid for
+        functions.json; read locally, without the model.
+
+        Raises:
+            KeyError: If ``name`` is not in functions.json
+        """
+        extractor = self.router or FunctionRouter.shared(self.config.functions_path)
+        return self.schemas.validate(name, extractor.extract_arguments(name, prompt))[1]
+
+    def _cache_response(self, keys: dict[str, str], text: str) -> None:
+        if "exact" not in keys:
+            return
+        self.response_cache.put(keys["exact"], text)
+        # Only answer future first turns by intent if the model agreed with the
+        # classifier on this one. Only the function is kept: the arguments
+        # belong to this caller and are read off each later prompt instead.
+        if "intent" in keys:
+            try:
+                function = Function.model_validate_json(text)
+            except ValueError:
+                return
+            if function.name == keys["function"]:
+                template = function.model_copy(update={"arguments": {}})
+                self.response_cache.put(keys["intent"], template.model_dump_json())
+
+
+class LLMTimeoutError(RuntimeError):
+    """Raised when an LLM request waits or runs longer than allowed."""
+
+
+class LLMRequestQueue:
+    """Bound the number of LLM requests in flight across all sessions.
+
+    Requests beyond ``max_concurrency`` wait their turn instead of piling onto
+    the API, and both the wait and the request itself are time-limited.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        *,
+        timeout: float = 30.0,
+        queue_timeout: float = 10.0,
+    ):
+        """
+        Initialize the queue.
+
+        Args:
+            max_concurrency: Maximum number of requests running at once
+            timeout: Seconds a running request may take
+            queue_timeout: Seconds a request may wait for a free slot
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.timeouts = 0
+
+    async def run(self, request: Awaitable[T], *, queue_timeout: Optional[float] = None) -> T:
+        """
+        Run ``request`` once a slot is free.
+
+        Args:
+            request: Coroutine to run; closed unstarted if it never gets a slot
+            queue_timeout: Overrides the queue's wait limit; 0 runs the request
+                only if a slot is free right now
+
+        Raises:
+            LLMTimeoutError: If no slot frees up or the request does not finish in time
+        """
+        if queue_timeout is None:
+            queue_timeout = self.queue_timeout
+        self.waiting += 1
+        try:
+            if queue_timeout <= 0 and self._slots.locked():
+                raise asyncio.TimeoutError
+            await asyncio.wait_for(self._slots.acquire(), max(queue_timeout, 0.001))
+        except asyncio.TimeoutError:
+            request.close()
+            self.timeouts += 1
+            raise LLMTimeoutError(f"No LLM slot free after {queue_timeout}s")
+        except asyncio.CancelledError:
+            request.close()
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(request, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise LLMTimeoutError(f"LLM request took longer than {self.timeout}s")
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
 
 if __name__ == "__main__":
+    from RealtimeSTT import AudioToTextRecorder
+
     recorder_config = {
         # "spinner": False,
         # "use_microphone": False,
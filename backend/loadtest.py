@@ -0,0 +1,326 @@
+"""Replay recorded audio against the server with many simulated clients.
+
+Each client streams WAV files in 20 ms binary frames (see framing.py), at
+real time or ``--speed`` times faster, followed by enough silence for the
+VAD to close the utterance, and waits for the answer:
+
+- ``--transport ws`` drives the raw WebSocket adapter (``ws://localhost:8001``)
+  and waits for its ``response`` message;
+- ``--transport socketio`` drives the Socket.IO adapter
+  (``http://localhost:5000``) with ``audioChunk`` events and waits for its
+  ``fullSentence`` transcription.
+
+End-to-end latency is measured from the last frame of speech sent to the
+answer received. Frames the client could not send on schedule are counted as
+late, frames it could not send at all as dropped.
+
+No network access is needed: start the server with ``FAKE_LLM_LATENCY`` set
+and the store in memory (``python -m server --fake-llm 0.8 --memory-store``)
+and it answers with :class:`FakeMistral` instead of the Mistral API, without
+Redis. The Whisper and Silero weights must already be in the local cache.
+
+Usage: python loadtest.py [--clients 10] [--speed 1] [--repeat 3]
+                          [--transport ws|socketio] [--url URL] [WAV ...]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+import numpy as np
+
+from framing import encode_frame
+from intents import IntentClassifier
+from wav_stream import WavStreamParser
+
+FRAME_MS = 20
+# Silence streamed after each file so the VAD ends the utterance.
+TRAILING_SILENCE = 1.5
+DEFAULT_AUDIOS = sorted((Path(__file__).parent.parent / "frontend" / "app" / "audios").glob("*.wav"))
+DEFAULT_URLS = {"ws": "ws://localhost:8001", "socketio": "http://localhost:5000"}
+
+
+def read_wav(path: Path) -> tuple[np.ndarray, int]:
+    """
+    Read a WAV file as mono int16.
+
+    Handles 16-bit PCM and 32-bit float files, which the ``wave`` module
+    rejects; multichannel audio is averaged down.
+
+    Returns:
+        The samples and the sample rate
+    """
+    parser = WavStreamParser()
+    try:
+        samples = parser.feed(path.read_bytes())
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+    if parser.sample_rate is None:
+        raise ValueError(f"{path} has no data chunk")
+    return samples, parser.sample_rate
+
+
+class FakeMistral:
+    """Offline stand-in for the Mistral client with configurable latency.
+
+    Answers ``chat.complete`` and ``chat.stream_async`` (and their ``parse``
+    variants) with a valid :class:`llm.Function` for the protocol the keyword
+    classifier picks from the last user turn. The first token arrives after ``latency`` seconds and
+    the rest at ``tokens_per_second``, roughly four characters per token.
+    """
+
+    def __init__(self, latency: float = 0.5, tokens_per_second: float = 60.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.classifier = IntentClassifier()
+        self.requests = 0
+        self.chat = SimpleNamespace(
+            complete=self.parse,
+            stream_async=self.parse_stream_async,
+            parse=self.parse,
+            parse_stream_async=self.parse_stream_async,
+        )
+
+    def answer(self, messages: list[dict[str, str]]) -> str:
+        # Guide excerpts come before the utterance, separated by a rule.
+        utterance = messages[-1]["content"].rsplit("\n---\n", 1)[-1]
+        name = self.classifier.preselect(utterance) or "assistance_malaise"
+        return json.dumps(
+            {
+                "name": name,
+                "description": "Réponse simulée pour les tests de charge.",
+                "arguments": {},
+            },
+            ensure_ascii=False,
+        )
+
+    def parse(self, *, messages: list[dict[str, str]], **kwargs) -> SimpleNamespace:
+        self.requests += 1
+        text = self.answer(messages)
+        time.sleep(self.latency + len(text) / 4 / self.tokens_per_second)
+        message = SimpleNamespace(content=text, parsed=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def parse_stream_async(self, *, messages: list[dict[str, str]], **kwargs) -> "_FakeStream":
+        self.requests += 1
+        return _FakeStream(self.answer(messages), self.latency, 1 / self.tokens_per_second)
+
+
+class _FakeStream:
+    def __init__(self, text: str, latency: float, token_interval: float):
+        self.tokens = [text[i : i + 4] for i in range(0, len(text), 4)]
+        self.latency = latency
+        self.token_interval = token_interval
+
+    async def __aenter__(self) -> "_FakeStream":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        pass
+
+    async def __aiter__(self):
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(self.tokens):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            delta = SimpleNamespace(content=token)
+            yield SimpleNamespace(data=SimpleNamespace(choices=[SimpleNamespace(delta=delta)]))
+
+
+@dataclass
+class ClientStats:
+    frames_sent: int = 0
+    late_frames: int = 0
+    dropped_frames: int = 0
+    answered: int = 0
+    unanswered: int = 0
+    audio_seconds: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+
+
+class Client:
+    """One simulated caller replaying ``audios`` over a transport."""
+
+    def __init__(self, client_id: int, audios: list[tuple[np.ndarray, int]], args: argparse.Namespace):
+        self.client_id = client_id
+        self.audios = audios
+        self.args = args
+        self.stats = ClientStats()
+        self.answers: asyncio.Queue[float] = asyncio.Queue()
+        self.seq = 0
+
+    async def run(self) -> ClientStats:
+        try:
+            await self.connect()
+        except Exception as e:
+            print(f"Client {self.client_id}: could not connect: {e}")
+            self.stats.unanswered += len(self.audios) * self.args.repeat
+            return self.stats
+        try:
+            for _ in range(self.args.repeat):
+                for samples, rate in self.audios:
+                    await self.replay(samples, rate)
+        finally:
+            await self.disconnect()
+        return self.stats
+
+    async def replay(self, samples: np.ndarray, rate: int) -> None:
+        step = rate * FRAME_MS // 1000
+        silence = np.zeros(int(TRAILING_SILENCE * rate), dtype=np.int16)
+        audio = np.concatenate((samples, silence))
+        interval = FRAME_MS / 1000 / self.args.speed
+        speech_frames = -(-len(samples) // step)
+        while not self.answers.empty():
+            self.answers.get_nowait()
+
+        start = time.monotonic()
+        speech_end = start
+        for n, i in enumerate(range(0, len(audio), step)):
+            due = start + n * interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif -delay > interval:
+                self.stats.late_frames += 1
+            frame = encode_frame(
+                audio[i : i + step].tobytes(), session=self.client_id, seq=self.seq, sample_rate=rate
+            )
+            self.seq += 1
+            try:
+                await self.send(frame)
+                self.stats.frames_sent += 1
+            except Exception:
+                self.stats.dropped_frames += 1
+            if n == speech_frames - 1:
+                speech_end = time.monotonic()
+        self.stats.audio_seconds += len(samples) / rate
+
+        try:
+            answered_at = await asyncio.wait_for(self.answers.get(), self.args.timeout)
+        except asyncio.TimeoutError:
+            self.stats.unanswered += 1
+            return
+        self.stats.answered += 1
+        self.stats.latencies.append(max(answered_at - speech_end, 0.0))
+
+    async def connect(self) -> None:
+        raise NotImplementedError
+
+    async def send(self, frame: bytes) -> None:
+        raise NotImplementedError
+
+    async def disconnect(self) -> None:
+        raise NotImplementedError
+
+
+class WebSocketClient(Client):
+    """Raw WebSocket client: binary frames, JSON ``response`` messages."""
+
+    async def connect(self) -> None:
+        import websockets
+
+        self.websocket = await websockets.connect(f"{self.args.url}?codecs=pcm16", max_size=None)
+        self._receiver = asyncio.create_task(self._receive())
+
+    async def _receive(self) -> None:
+        try:
+            async for message in self.websocket:
+                if json.loads(message).get("type") == "response":
+                    self.answers.put_nowait(time.monotonic())
+        except Exception:
+            pass
+
+    async def send(self, frame: bytes) -> None:
+        await self.websocket.send(frame)
+
+    async def disconnect(self) -> None:
+        self._receiver.cancel()
+        # A clean close tells the server the caller hung up.
+        await self.websocket.close()
+
+
+class SocketIOClient(Client):
+    """Socket.IO client: ``audioChunk`` events, ``fullSentence`` transcriptions."""
+
+    async def connect(self) -> None:
+        import socketio
+
+        self.sio = socketio.AsyncClient(reconnection=False)
+
+        @self.sio.on("transcription")
+        async def on_transcription(data):
+            if data.get("type") == "fullSentence":
+                self.answers.put_nowait(time.monotonic())
+
+        await self.sio.connect(f"{self.args.url}?codecs=pcm16", transports=["websocket"])
+
+    async def send(self, frame: bytes) -> None:
+        await self.sio.emit("audioChunk", frame)
+
+    async def disconnect(self) -> None:
+        await self.sio.disconnect()
+
+
+def percentile(values: list[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+def report(stats: list[ClientStats], wall: float) -> None:
+    latencies = [latency for s in stats for latency in s.latencies]
+    audio = sum(s.audio_seconds for s in stats)
+    answered = sum(s.answered for s in stats)
+    sent = sum(s.frames_sent for s in stats)
+    print(f"clients:        {len(stats)}")
+    print(f"wall time:      {wall:.1f} s")
+    print(f"throughput:     {audio / wall:.1f} s of speech/s, {answered / wall:.2f} answers/s")
+    print(f"answered:       {answered}, unanswered {sum(s.unanswered for s in stats)}")
+    print(
+        f"latency (ms):   p50 {1e3 * percentile(latencies, 50):.0f} | "
+        f"p95 {1e3 * percentile(latencies, 95):.0f} | p99 {1e3 * percentile(latencies, 99):.0f}"
+    )
+    print(
+        f"frames:         {sent} sent, {sum(s.late_frames for s in stats)} late, "
+        f"{sum(s.dropped_frames for s in stats)} dropped"
+    )
+
+
+async def run(args: argparse.Namespace, audios: list[tuple[np.ndarray, int]]) -> None:
+    client_type = WebSocketClient if args.transport == "ws" else SocketIOClient
+    clients = [client_type(i + 1, audios, args) for i in range(args.clients)]
+
+    async def staggered(client: Client) -> ClientStats:
+        # Spread connections so the clients do not all speak in lockstep.
+        await asyncio.sleep(args.ramp * (client.client_id - 1) / max(args.clients, 1))
+        return await client.run()
+
+    start = time.monotonic()
+    stats = await asyncio.gather(*(staggered(c) for c in clients))
+    report(stats, time.monotonic() - start)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("wavs", nargs="*", type=Path, default=DEFAULT_AUDIOS)
+    parser.add_argument("--transport", choices=("ws", "socketio"), default="ws")
+    parser.add_argument("--url", help="Server URL; defaults to the transport's local server")
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1 = real time")
+    parser.add_argument("--repeat", type=int, default=3, help="Times each client replays the files")
+    parser.add_argument("--ramp", type=float, default=2.0, help="Seconds over which clients connect")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds to wait for an answer")
+    args = parser.parse_args(argv)
+    args.url = args.url or DEFAULT_URLS[args.transport]
+    if not args.wavs:
+        parser.error("no WAV files given")
+
+    audios = [read_wav(path) for path in args.wavs]
+    asyncio.run(run(args, audios))
+
+
+if __name__ == "__main__":
+    main()
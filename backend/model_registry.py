@@ -0,0 +1,210 @@
+"""Per-host cache of the speech models and per-process registry of loaded ones.
+
+Every replica used to download Whisper and Silero weights on its own and load
+them before accepting a connection. The registry splits that in two:
+
+- **Per host**, the weights live in one model directory (``MODEL_CACHE_DIR``,
+  default ``~/.cache/biasbusters/models``) shared by every server process and
+  recorder on the machine. ``python model_registry.py`` fills it ahead of
+  time (image build, init container) and reports cold and warm load times;
+  with ``MODEL_OFFLINE=1`` a replica refuses to download and only reads it,
+  so scaling out never waits on the network. Processes loading the same files
+  share them through the OS page cache.
+- **Per process**, each model is loaded once, pinned and handed out to every
+  caller, and warmed up with one inference so the first caller does not pay
+  for lazy initialization.
+
+faster-whisper is imported on first use only.
+"""
+
+import argparse
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+
+from tracing import Tracer, tracer as default_tracer
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "biasbusters" / "models"
+WARMUP_SECONDS = 1.0
+
+
+@dataclass
+class ModelLoad:
+    """How long a model took to become usable in this process."""
+
+    name: str
+    # True if the weights were already in the model directory.
+    cached: bool
+    fetch_seconds: float
+    load_seconds: float
+    warmup_seconds: float = 0.0
+
+    @property
+    def total_seconds(self) -> float:
+        return self.fetch_seconds + self.load_seconds + self.warmup_seconds
+
+
+class ModelRegistry:
+    """Loads each Whisper model once per process, from the per-host model directory."""
+
+    def __init__(
+        self,
+        cache_dir: Optional[str] = None,
+        *,
+        offline: Optional[bool] = None,
+        tracer: Optional[Tracer] = None,
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            cache_dir: Model directory; defaults to ``MODEL_CACHE_DIR`` or
+                ``~/.cache/biasbusters/models``
+            offline: Never download, only read the model directory; defaults
+                to ``MODEL_OFFLINE=1``
+            tracer: Where to report load times; defaults to the process tracer
+        """
+        self.cache_dir = Path(cache_dir or os.getenv("MODEL_CACHE_DIR") or DEFAULT_CACHE_DIR)
+        self.offline = offline if offline is not None else os.getenv("MODEL_OFFLINE") == "1"
+        self.loads: dict[str, ModelLoad] = {}
+        self._models: dict[tuple, Any] = {}
+        self._lock = threading.Lock()
+        tracer = tracer or default_tracer
+        tracer.register(
+            "model_load_seconds",
+            "gauge",
+            "Seconds to fetch, load and warm up each model, by model directory state.",
+            lambda: {
+                f'model="{load.name}",cache="{"warm" if load.cached else "cold"}"': load.total_seconds
+                for load in self.loads.values()
+            },
+        )
+
+    def recorder_config(self, config: dict[str, Any]) -> dict[str, Any]:
+        """``config`` for AudioToTextRecorder, reading its models from the model directory."""
+        return {"download_root": str(self.cache_dir), **config}
+
+    def whisper_path(self, name: str) -> tuple[str, bool]:
+        """
+        Local directory of a faster-whisper model, downloading it if needed.
+
+        Args:
+            name: Model size (e.g. "small") or Hugging Face repository
+
+        Returns:
+            The directory, and whether it was already in the model directory
+
+        Raises:
+            RuntimeError: If the model is missing and the registry is offline
+        """
+        if os.path.isdir(name):
+            return name, True
+        from faster_whisper.utils import download_model
+
+        try:
+            return download_model(name, local_files_only=True, cache_dir=str(self.cache_dir)), True
+        except Exception:
+            if self.offline:
+                raise RuntimeError(
+                    f"Model {name} is not in {self.cache_dir} and MODEL_OFFLINE is set; "
+                    "run model_registry.py to preload it"
+                )
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        return download_model(name, cache_dir=str(self.cache_dir)), False
+
+    def whisper(
+        self,
+        name: str,
+        *,
+        device: str = "cpu",
+        compute_type: str = "int8",
+        cpu_threads: int = 4,
+        warm_up: bool = True,
+    ) -> Any:
+        """
+        The loaded WhisperModel for ``name``, loading and warming it up on first use.
+
+        Returns:
+            A ``faster_whisper.WhisperModel`` shared with every other caller
+        """
+        key = (name, device, compute_type, cpu_threads)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                return model
+            from faster_whisper import WhisperModel
+
+            start = time.perf_counter()
+            path, cached = self.whisper_path(name)
+            fetched = time.perf_counter()
+            model = WhisperModel(
+                path, device=device, compute_type=compute_type, cpu_threads=cpu_threads
+            )
+            load = ModelLoad(name, cached, fetched - start, time.perf_counter() - fetched)
+            if warm_up:
+                load.warmup_seconds = self.warm_up(model)
+            self._models[key] = model
+            self.loads[name] = load
+        print(
+            f"Model {name} ready in {load.total_seconds:.2f}s "
+            f"({'warm' if cached else 'cold'} cache: fetch {load.fetch_seconds:.2f}s, "
+            f"load {load.load_seconds:.2f}s, warm-up {load.warmup_seconds:.2f}s)"
+        )
+        return model
+
+    @staticmethod
+    def warm_up(model: Any) -> float:
+        """
+        Run one inference on quiet noise, so buffers and kernels are set up
+        before the first real utterance.
+
+        Returns:
+            Seconds spent
+        """
+        start = time.perf_counter()
+        audio = (1e-3 * np.random.default_rng(0).standard_normal(int(16000 * WARMUP_SECONDS)))
+        segments, _ = model.transcribe(audio.astype(np.float32), language="en", beam_size=1)
+        for _ in segments:  # transcription is lazy
+            pass
+        return time.perf_counter() - start
+
+    def preload_silero(self) -> float:
+        """Fetch the Silero VAD used by the recorders into the torch hub cache.
+
+        Returns:
+            Seconds spent
+        """
+        import torch
+
+        start = time.perf_counter()
+        torch.hub.load("snakers4/silero-vad", "silero_vad", verbose=False, trust_repo=True)
+        return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Preload the speech models into the per-host model directory"
+    )
+    parser.add_argument("models", nargs="*", default=["small", "tiny.en"])
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--no-silero", action="store_true")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.cache_dir)
+    print(f"Model directory: {registry.cache_dir}")
+    for name in args.models:
+        registry.whisper(name)
+        # A second process would find the weights in place: time that too.
+        warm = ModelRegistry(args.cache_dir, offline=True, tracer=Tracer())
+        warm.whisper(name)
+    if not args.no_silero:
+        print(f"Silero VAD ready in {registry.preload_silero():.2f}s")
+
+
+if __name__ == "__main__":
+    main()
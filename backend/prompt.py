@@ -0,0 +1,229 @@
+import hashlib
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Optional
+
+# A tokenizer only needs to count; anything with this signature can be plugged in.
+Tokenizer = Callable[[str], int]
+
+# Approximates a BPE vocabulary: long words split into ~4 character pieces,
+# punctuation counted on its own. Good to within ~15% of the Mistral tokenizer
+# on the French guide, and deterministic.
+_TOKEN_RE = re.compile(r"\w{1,4}|[^\w\s]")
+
+# The PDF export replaced the "ti" ligature with "$" or "/" inside words
+# ("pra$que", "forma/on"); "et/ou" is the only legitimate in-word slash.
+_LIGATURE_RE = re.compile(r"(?<=[^\W\d_])(\$|(?<!\bet)/)(?=[^\W\d_])")
+_RUNNING_HEADER_RE = re.compile(r"^(\d+\s+)?GUIDE pratique(\s+\d+)?\s+PREMIERS SECOURS$")
+_PAGE_NUMBER_RE = re.compile(r"^\d+$")
+_FIGURE_CAPTION_RE = re.compile(r"^Figure \d+\s*:")
+_FIGURE_REF_RE = re.compile(r"\s*\(fig\. \d+\)")
+_PRIVATE_USE_RE = re.compile("[\ue000-\uf8ff]")
+_SPACES_RE = re.compile(r"[ \t]+")
+
+# Chapters that carry no first-aid content.
+SKIPPED_CHAPTERS = {"AVANT-PROPOS", "SCHEMA GENERAL DE L’ACTION DE SECOURS (PSC 1)"}
+# Repeated lines shorter than this are headings ("Technique", "Chez l'adulte")
+# and are kept; longer ones are duplicated explanations and are dropped.
+MIN_DEDUPLICATED_LINE = 60
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the number of tokens in ``text``."""
+    return len(_TOKEN_RE.findall(text))
+
+
+@dataclass(frozen=True)
+class GuideSection:
+    """One chapter of the first-aid guide."""
+
+    title: str
+    text: str
+
+
+@dataclass(frozen=True)
+class SystemPrompt:
+    """A built system prompt and its per-section token accounting."""
+
+    text: str
+    section_tokens: tuple[tuple[str, int], ...]
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(tokens for _, tokens in self.section_tokens)
+
+    @property
+    def sha256(self) -> str:
+        return hashlib.sha256(self.text.encode("utf-8")).hexdigest()
+
+    def report(self) -> str:
+        width = max(len(name) for name, _ in self.section_tokens)
+        lines = [f"{name:<{width}}  {tokens:>6}" for name, tokens in self.section_tokens]
+        lines.append(f"{'total':<{width}}  {self.total_tokens:>6}")
+        return "\n".join(lines)
+
+
+def _is_chapter_heading(line: str) -> bool:
+    return len(line) > 4 and line == line.upper() and re.search(r"[A-Z]{4}", line) is not None
+
+
+def _clean_line(line: str) -> str:
+    line = _PRIVATE_USE_RE.sub("-", line)
+    line = _LIGATURE_RE.sub("ti", line)
+    line = _FIGURE_REF_RE.sub("", line)
+    return _SPACES_RE.sub(" ", line).strip()
+
+
+def parse_guide(raw: str) -> list[GuideSection]:
+    """
+    Split the raw guide text into cleaned chapters.
+
+    Page numbers, running headers, figure captions and references, the title
+    page and table of contents and broken ligatures are removed; hard-wrapped
+    lines are re-joined and duplicated explanations dropped.
+
+    Args:
+        raw: Text of ``guide.txt``
+
+    Returns:
+        Chapters in document order, titled by their heading
+    """
+    sections: list[GuideSection] = []
+    title = None
+    lines: list[str] = []
+    started = False
+
+    def flush():
+        if title not in SKIPPED_CHAPTERS and lines:
+            sections.append(GuideSection(title.capitalize(), "\n".join(lines)))
+
+    for raw_line in unicodedata.normalize("NFC", raw).splitlines():
+        line = _clean_line(raw_line)
+        if not line:
+            continue
+        if line.startswith("©"):
+            # The copyright line closes the title page and table of contents.
+            started = True
+            continue
+        if not started:
+            continue
+        if line.startswith("Remerciements"):
+            # Acknowledgements start the back cover.
+            break
+        if (
+            _PAGE_NUMBER_RE.match(line)
+            or _RUNNING_HEADER_RE.match(line)
+            or _FIGURE_CAPTION_RE.match(line)
+        ):
+            continue
+        if _is_chapter_heading(line):
+            flush()
+            title, lines = line, []
+            continue
+        if title is None:
+            continue
+
+        if lines and lines[-1][-1] not in ".:;!?" and line[0].islower():
+            # Hard-wrapped sentence continuing on the next line.
+            lines[-1] = f"{lines[-1]} {line}"
+        elif len(line) >= MIN_DEDUPLICATED_LINE and line in lines:
+            continue
+        else:
+            lines.append(line)
+
+    flush()
+    return sections
+
+
+def render_functions(functions: list[dict]) -> str:
+    """Canonical, compact JSON rendering of the function list."""
+    return json.dumps(functions, ensure_ascii=False, separators=(",", ":"))
+
+
+def build_system_prompt(
+    sections: Optional[list[GuideSection]],
+    functions: list[dict],
+    tokenizer: Tokenizer = count_tokens,
+) -> SystemPrompt:
+    """
+    Assemble the system prompt.
+
+    The output depends only on its inputs, so it is byte-identical across
+    requests, sessions and processes and can hit provider-side prefix caches.
+
+    Args:
+        sections: Guide chapters to embed. If None, the prompt announces that
+            relevant excerpts come with each user message instead
+        functions: The function list of ``functions.json``
+        tokenizer: Token counter used for the per-section report
+    """
+    parts = [
+        (
+            "instructions",
+            "I have a list of first aid functions, each with a description and expected arguments. "
+            "Based on a user's input, I want to choose the appropriate function to call. "
+            "You should systematically ask for more context information if the user's input is "
+            "ambiguous or incomplete. Don't take any risk with first aid.",
+        ),
+        (
+            "functions",
+            f"The list of available functions is as follows:\n{render_functions(functions)}",
+        ),
+    ]
+    if sections is None:
+        parts.append(
+            (
+                "guide header",
+                "Each user message is preceded by the relevant excerpts of the reference guide. "
+                "Use them to complete the task.",
+            )
+        )
+    else:
+        parts.append(
+            ("guide header", "Use the following reference guide to complete the task:")
+        )
+        parts.extend(
+            (f"guide: {section.title}", f"## {section.title}\n{section.text}")
+            for section in sections
+        )
+
+    return SystemPrompt(
+        text="\n\n".join(text for _, text in parts),
+        section_tokens=tuple((name, tokenizer(text)) for name, text in parts),
+    )
+
+
+@lru_cache(maxsize=8)
+def _load_system_prompt(
+    guide_path: Path, functions_path: Path, include_guide: bool, _stamp: tuple
+) -> SystemPrompt:
+    sections = None
+    if include_guide:
+        sections = parse_guide(guide_path.read_text(encoding="utf-8"))
+    functions = json.loads(functions_path.read_text(encoding="utf-8"))["functions"]
+    return build_system_prompt(sections, functions)
+
+
+def load_system_prompt(
+    guide_path: Path, functions_path: Path, include_guide: bool = True
+) -> SystemPrompt:
+    """Build the system prompt once per process and input file version."""
+    stamp = tuple(
+        (path.stat().st_mtime_ns, path.stat().st_size) for path in (guide_path, functions_path)
+    )
+    return _load_system_prompt(Path(guide_path), Path(functions_path), include_guide, stamp)
+
+
+if __name__ == "__main__":
+    from llm import Config
+
+    config = Config()
+    prompt = load_system_prompt(config.guide_path, config.functions_path)
+    raw_size = config.guide_path.stat().st_size
+    print(prompt.report())
+    print(f"\nguide.txt: {raw_size} bytes -> system prompt: {len(prompt.text.encode())} bytes")
+    print(f"sha256: {prompt.sha256}")
@@ -0,0 +1,685 @@
+import asyncio
+import fnmatch
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+# Where the store lives; MEMORY_URL keeps it in this process (see
+# MemoryBackend), for load tests and development without a Redis server.
+REDIS_URL = os.getenv("REDIS_URL") or f"redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}"
+MEMORY_URL = "memory://"
+
+
+def connect(url: str = REDIS_URL, max_connections: int = 32):
+    """
+    Async Redis client backed by a bounded connection pool.
+
+    Args:
+        url: ``redis://host:port/db``, or :data:`MEMORY_URL` for a
+            :class:`MemoryBackend` that lives and dies with this process
+        max_connections: Size of the connection pool
+    """
+    if url == MEMORY_URL:
+        return MemoryBackend()
+    import redis.asyncio as aioredis
+
+    pool = aioredis.ConnectionPool.from_url(
+        url, max_connections=max_connections, decode_responses=True
+    )
+    return aioredis.Redis(connection_pool=pool)
+
+
+class MemoryBackend:
+    """In-process stand-in for the subset of ``redis.asyncio.Redis`` used here.
+
+    Lets the store run and be exercised without a Redis server. Each awaited
+    command or pipeline ``execute()`` counts as one round trip and optionally
+    sleeps ``latency`` seconds to model the network.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self._data: dict[str, Any] = {}
+        self._expires: dict[str, float] = {}
+
+    async def _round_trip(self) -> None:
+        self.round_trips += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _live(self, key: str) -> bool:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    # Commands, applied synchronously; the async wrappers below add the round trip.
+
+    def _rpush(self, key: str, *values: str) -> int:
+        self._live(key)
+        items = self._data.setdefault(key, [])
+        items.extend(values)
+        return len(items)
+
+    def _ltrim(self, key: str, start: int, end: int) -> bool:
+        if self._live(key):
+            items = self._data[key]
+            self._data[key] = items[_slice(len(items), start, end)]
+            if not self._data[key]:
+                del self._data[key]
+        return True
+
+    def _lrange(self, key: str, start: int, end: int) -> list[str]:
+        if not self._live(key):
+            return []
+        items = self._data[key]
+        return items[_slice(len(items), start, end)]
+
+    def _llen(self, key: str) -> int:
+        return len(self._data[key]) if self._live(key) else 0
+
+    def _incrby(self, key: str, amount: int = 1) -> int:
+        value = int(self._data[key]) + amount if self._live(key) else amount
+        self._data[key] = str(value)
+        return value
+
+    def _get(self, key: str) -> Optional[str]:
+        return self._data[key] if self._live(key) else None
+
+    def _hset(self, key: str, mapping: dict[str, Any]) -> int:
+        self._live(key)
+        hash_ = self._data.setdefault(key, {})
+        added = len(set(mapping) - set(hash_))
+        hash_.update({field: str(value) for field, value in mapping.items()})
+        return added
+
+    def _hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        self._live(key)
+        hash_ = self._data.setdefault(key, {})
+        hash_[field] = str(int(hash_.get(field, 0)) + amount)
+        return int(hash_[field])
+
+    def _hget(self, key: str, field: str) -> Optional[str]:
+        return self._data[key].get(field) if self._live(key) else None
+
+    def _hgetall(self, key: str) -> dict[str, str]:
+        return dict(self._data[key]) if self._live(key) else {}
+
+    def _exists(self, *keys: str) -> int:
+        return sum(1 for key in keys if self._live(key))
+
+    def _expire(self, key: str, seconds: int) -> bool:
+        if not self._live(key):
+            return False
+        self._expires[key] = time.monotonic() + seconds
+        return True
+
+    def _ttl(self, key: str) -> int:
+        if not self._live(key):
+            return -2
+        expires = self._expires.get(key)
+        return -1 if expires is None else max(int(expires - time.monotonic()), 0)
+
+    def _delete(self, *keys: str) -> int:
+        deleted = 0
+        for key in keys:
+            if self._live(key):
+                del self._data[key]
+                deleted += 1
+            self._expires.pop(key, None)
+        return deleted
+
+    def _keys(self, pattern: str = "*") -> list[str]:
+        return [key for key in list(self._data) if self._live(key) and fnmatch.fnmatchcase(key, pattern)]
+
+    # Streams and consumer groups, for workqueue.py. Replies have the shapes
+    # redis-py gives with decode_responses=True.
+
+    def _stream(self, key: str, create: bool = False) -> Optional["_Stream"]:
+        if not self._live(key):
+            if not create:
+                return None
+            self._data[key] = _Stream()
+        return self._data[key]
+
+    def _group(self, key: str, groupname: str) -> "_Group":
+        stream = self._stream(key)
+        if stream is None or groupname not in stream.groups:
+            raise ResponseError(f"NOGROUP No such key '{key}' or consumer group '{groupname}'")
+        return stream.groups[groupname]
+
+    def _xadd(
+        self,
+        name: str,
+        fields: dict[str, Any],
+        id: str = "*",
+        maxlen: Optional[int] = None,
+        approximate: bool = True,
+    ) -> str:
+        stream = self._stream(name, create=True)
+        ms = int(time.time() * 1000)
+        last = stream.last_id
+        entry_id = (ms, 0) if ms > last[0] else (last[0], last[1] + 1)
+        stream.last_id = entry_id
+        stream.entries[entry_id] = {field: str(value) for field, value in fields.items()}
+        if maxlen is not None:
+            while len(stream.entries) > maxlen:
+                del stream.entries[next(iter(stream.entries))]
+        return _format_id(entry_id)
+
+    def _xlen(self, name: str) -> int:
+        stream = self._stream(name)
+        return len(stream.entries) if stream is not None else 0
+
+    def _xgroup_create(
+        self, name: str, groupname: str, id: str = "$", mkstream: bool = False
+    ) -> bool:
+        stream = self._stream(name, create=mkstream)
+        if stream is None:
+            raise ResponseError("ERR The XGROUP subcommand requires the key to exist")
+        if groupname in stream.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        stream.groups[groupname] = _Group(stream.last_id if id == "$" else _parse_id(id))
+        return True
+
+    def _xreadgroup(
+        self,
+        groupname: str,
+        consumername: str,
+        streams: dict[str, str],
+        count: Optional[int] = None,
+        block: Optional[int] = None,
+        noack: bool = False,
+    ) -> list:
+        replies = []
+        for name, start in streams.items():
+            group = self._group(name, groupname)
+            entries = self._data[name].entries
+            if start == ">":
+                ids = [i for i in entries if i > group.last_delivered][:count]
+                if ids:
+                    group.last_delivered = ids[-1]
+                now = time.monotonic()
+                for entry_id in ids:
+                    if not noack:
+                        group.pending[entry_id] = [consumername, now, 1]
+                found = [(_format_id(i), dict(entries[i])) for i in ids]
+            else:
+                # History: this consumer's own pending entries after ``start``.
+                after = _parse_id(start)
+                ids = [
+                    i for i, (owner, _, _) in group.pending.items()
+                    if owner == consumername and i > after
+                ][:count]
+                found = [(_format_id(i), dict(entries.get(i, {}))) for i in ids]
+            if found or start != ">":
+                replies.append([name, found])
+        return replies
+
+    def _xack(self, name: str, groupname: str, *ids: str) -> int:
+        group = self._group(name, groupname)
+        return sum(group.pending.pop(_parse_id(i), None) is not None for i in ids)
+
+    def _xautoclaim(
+        self,
+        name: str,
+        groupname: str,
+        consumername: str,
+        min_idle_time: int,
+        start_id: str = "0-0",
+        count: Optional[int] = None,
+        justid: bool = False,
+    ) -> list:
+        group = self._group(name, groupname)
+        entries = self._data[name].entries
+        now = time.monotonic()
+        start = _parse_id(start_id)
+        claimed, deleted = [], []
+        for entry_id in sorted(group.pending):
+            if entry_id < start or now - group.pending[entry_id][1] < min_idle_time / 1000:
+                continue
+            if count is not None and len(claimed) + len(deleted) >= count:
+                return [_format_id(entry_id), claimed, deleted]
+            if entry_id not in entries:
+                # Trimmed away while pending: nothing left to deliver.
+                del group.pending[entry_id]
+                deleted.append(_format_id(entry_id))
+                continue
+            pending = group.pending[entry_id]
+            group.pending[entry_id] = [consumername, now, pending[2] + 1]
+            claimed.append(
+                _format_id(entry_id) if justid else (_format_id(entry_id), dict(entries[entry_id]))
+            )
+        return ["0-0", claimed, deleted]
+
+    def _xpending(self, name: str, groupname: str) -> dict[str, Any]:
+        group = self._group(name, groupname)
+        consumers: dict[str, int] = {}
+        for owner, _, _ in group.pending.values():
+            consumers[owner] = consumers.get(owner, 0) + 1
+        ids = sorted(group.pending)
+        return {
+            "pending": len(ids),
+            "min": _format_id(ids[0]) if ids else None,
+            "max": _format_id(ids[-1]) if ids else None,
+            "consumers": [{"name": n, "pending": c} for n, c in consumers.items()],
+        }
+
+    def _xread(
+        self, streams: dict[str, str], count: Optional[int] = None, block: Optional[int] = None
+    ) -> list:
+        replies = []
+        for name, start in streams.items():
+            stream = self._stream(name)
+            if stream is None:
+                continue
+            after = stream.last_id if start == "$" else _parse_id(start)
+            found = [(_format_id(i), dict(f)) for i, f in stream.entries.items() if i > after]
+            if found:
+                replies.append([name, found[:count]])
+        return replies
+
+    async def xreadgroup(self, *args, block: Optional[int] = None, **kwargs) -> list:
+        """XREADGROUP, waiting up to ``block`` milliseconds for new entries."""
+        return await self._blocking(self._xreadgroup, block, *args, **kwargs)
+
+    async def xread(self, *args, block: Optional[int] = None, **kwargs) -> list:
+        """XREAD, waiting up to ``block`` milliseconds for new entries."""
+        streams = dict(kwargs.pop("streams", None) or args[0])
+        # "$" means entries added after the call, not after each poll.
+        for name, start in streams.items():
+            if start == "$":
+                stream = self._stream(name)
+                streams[name] = _format_id(stream.last_id) if stream is not None else "0-0"
+        return await self._blocking(self._xread, block, streams, *args[1:], **kwargs)
+
+    async def _blocking(self, command, block: Optional[int], *args, **kwargs) -> list:
+        await self._round_trip()
+        deadline = time.monotonic() + (block or 0) / 1000
+        while True:
+            replies = command(*args, **kwargs)
+            if any(found for _, found in replies) or not block or time.monotonic() >= deadline:
+                return replies
+            await asyncio.sleep(min(0.005, max(deadline - time.monotonic(), 0)))
+
+    def pipeline(self, transaction: bool = True) -> "MemoryPipeline":
+        return MemoryPipeline(self)
+
+    def __getattr__(self, name: str):
+        command = getattr(type(self), f"_{name}", None)
+        if command is None:
+            raise AttributeError(name)
+
+        async def run(*args, **kwargs):
+            await self._round_trip()
+            return command(self, *args, **kwargs)
+
+        return run
+
+    async def aclose(self) -> None:
+        pass
+
+
+class MemoryPipeline:
+    """Buffers commands and runs them in one round trip, like a Redis pipeline."""
+
+    def __init__(self, backend: MemoryBackend):
+        self.backend = backend
+        self._commands: list[tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str):
+        if getattr(MemoryBackend, f"_{name}", None) is None:
+            raise AttributeError(name)
+
+        def buffer(*args, **kwargs):
+            self._commands.append((name, args, kwargs))
+            return self
+
+        return buffer
+
+    async def execute(self) -> list[Any]:
+        await self.backend._round_trip()
+        commands, self._commands = self._commands, []
+        return [
+            getattr(MemoryBackend, f"_{name}")(self.backend, *args, **kwargs)
+            for name, args, kwargs in commands
+        ]
+
+    async def __aenter__(self) -> "MemoryPipeline":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self._commands = []
+
+
+def _slice(length: int, start: int, end: int) -> slice:
+    """Python slice equivalent to Redis' inclusive, negative-aware range."""
+    if start < 0:
+        start = max(length + start, 0)
+    if end < 0:
+        end = length + end
+    return slice(start, end + 1)
+
+
+class ResponseError(Exception):
+    """Error reply of a :class:`MemoryBackend` command, like ``redis.ResponseError``."""
+
+
+@dataclass
+class _Group:
+    last_delivered: tuple[int, int]
+    # Entry ID -> [consumer, delivery time, delivery count], in delivery order.
+    pending: dict[tuple[int, int], list] = field(default_factory=dict)
+
+
+@dataclass
+class _Stream:
+    entries: dict[tuple[int, int], dict[str, str]] = field(default_factory=dict)
+    last_id: tuple[int, int] = (0, 0)
+    groups: dict[str, _Group] = field(default_factory=dict)
+
+
+def _parse_id(entry_id: str) -> tuple[int, int]:
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def _format_id(entry_id: tuple[int, int]) -> str:
+    return f"{entry_id[0]}-{entry_id[1]}"
+
+
+@dataclass
+class SessionRecord:
+    """What a session needs to resume: everything but the messages themselves."""
+
+    token: str
+    # Absolute index of the next message, i.e. how many were ever appended.
+    next_index: int = 0
+    personal_data: dict[str, str] = field(default_factory=dict)
+    # Pipeline state (pending sentence, audio format, ...), opaque to the store.
+    state: dict[str, Any] = field(default_factory=dict)
+    resumed: bool = False
+
+
+@dataclass
+class _LocalEntry:
+    record: SessionRecord
+    messages: Optional[list[dict[str, str]]] = None
+    # Index of messages[0]; older messages may have been trimmed.
+    first_index: int = 0
+    checked_at: float = 0.0
+
+
+class HistoryStore:
+    """Conversation history and per-session state in Redis.
+
+    A session is identified by an opaque token issued on connect; a client that
+    reconnects with it resumes the same conversation. Each session owns two
+    keys: ``chat:{token}``, the capped message list, and ``session:{token}``, a
+    hash holding the history pointer (``seq``), personal data (``p:<name>``
+    fields) and pipeline state (``state``, JSON).
+
+    Writes are batched into a single pipelined round trip and every key expires
+    ``ttl`` seconds after its last write, so abandoned sessions clean themselves
+    up. A small in-process cache sits in front of Redis: this process' own
+    writes update it, and entries older than ``local_ttl`` are revalidated, so
+    a session resumed on another server is picked up within that delay.
+    """
+
+    def __init__(
+        self,
+        client: Any = None,
+        *,
+        max_messages: int = 200,
+        ttl: int = 3600,
+        local_entries: int = 1024,
+        local_ttl: float = 5.0,
+    ):
+        """
+        Initialize the store.
+
+        Args:
+            client: ``redis.asyncio.Redis`` or :class:`MemoryBackend`. If None,
+                connects to the configured Redis server
+            max_messages: Messages kept per conversation; older ones are trimmed
+            ttl: Seconds of inactivity before a session's keys expire
+            local_entries: Sessions kept in the in-process cache
+            local_ttl: Seconds a cached session is trusted without asking Redis
+        """
+        self.client = client if client is not None else connect()
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self.local_entries = local_entries
+        self.local_ttl = local_ttl
+        self._local: OrderedDict[str, _LocalEntry] = OrderedDict()
+
+    @staticmethod
+    def _keys(token: str) -> tuple[str, str]:
+        return f"chat:{token}", f"session:{token}"
+
+    # Local cache
+
+    def _cached(self, token: str) -> Optional[_LocalEntry]:
+        entry = self._local.get(token)
+        if entry is None or time.monotonic() - entry.checked_at > self.local_ttl:
+            return None
+        self._local.move_to_end(token)
+        return entry
+
+    def _remember(self, entry: _LocalEntry) -> _LocalEntry:
+        entry.checked_at = time.monotonic()
+        self._local[entry.record.token] = entry
+        self._local.move_to_end(entry.record.token)
+        while len(self._local) > self.local_entries:
+            self._local.popitem(last=False)
+        return entry
+
+    def invalidate(self, token: str) -> None:
+        """Drop ``token`` from the in-process cache."""
+        self._local.pop(token, None)
+
+    # Sessions
+
+    async def open_session(self, token: Optional[str] = None) -> SessionRecord:
+        """
+        Resume the session of ``token`` or start a new one.
+
+        Returns:
+            The stored session if ``token`` is known and has not expired
+            (``resumed`` is True), otherwise a new session with a fresh token
+        """
+        if token:
+            record = await self.load_session(token)
+            if record is not None:
+                record.resumed = True
+                await self.touch(token)
+                return record
+
+        token = secrets.token_urlsafe(16)
+        _, session_key = self._keys(token)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(session_key, mapping={"seq": 0, "created": int(time.time())})
+        pipe.expire(session_key, self.ttl)
+        await pipe.execute()
+        record = SessionRecord(token)
+        self._remember(_LocalEntry(record, messages=[]))
+        return record
+
+    async def load_session(self, token: str) -> Optional[SessionRecord]:
+        """Fetch a session's pointer, personal data and state in one round trip."""
+        entry = self._cached(token)
+        if entry is not None:
+            return entry.record
+
+        _, session_key = self._keys(token)
+        fields = await self.client.hgetall(session_key)
+        if not fields:
+            self.invalidate(token)
+            return None
+        record = SessionRecord(
+            token,
+            next_index=int(fields.get("seq", 0)),
+            personal_data={k[2:]: v for k, v in fields.items() if k.startswith("p:")},
+            state=json.loads(fields["state"]) if "state" in fields else {},
+        )
+        previous = self._local.get(token)
+        entry = _LocalEntry(record)
+        if previous is not None and previous.messages is not None:
+            # Keep the messages already fetched; load_history only asks for the rest.
+            entry.messages, entry.first_index = previous.messages, previous.first_index
+        self._remember(entry)
+        return record
+
+    async def save_state(self, token: str, state: dict[str, Any]) -> None:
+        """Store the pipeline state of a session, replacing the previous one."""
+        _, session_key = self._keys(token)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(session_key, mapping={"state": json.dumps(state, ensure_ascii=False)})
+        pipe.expire(session_key, self.ttl)
+        await pipe.execute()
+        entry = self._local.get(token)
+        if entry is not None:
+            entry.record.state = dict(state)
+
+    # Messages
+
+    async def save_messages(self, token: str, messages: list[dict[str, str]]) -> int:
+        """
+        Append messages to the history in one round trip.
+
+        Returns:
+            Absolute index of the next message, i.e. the total ever appended
+        """
+        chat_key, session_key = self._keys(token)
+        if not messages:
+            return int(await self.client.hget(session_key, "seq") or 0)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(chat_key, *(json.dumps(m, ensure_ascii=False) for m in messages))
+        pipe.ltrim(chat_key, -self.max_messages, -1)
+        pipe.hincrby(session_key, "seq", len(messages))
+        pipe.expire(chat_key, self.ttl)
+        pipe.expire(session_key, self.ttl)
+        results = await pipe.execute()
+        total = int(results[2])
+
+        entry = self._local.get(token)
+        if entry is not None:
+            if entry.messages is not None and entry.record.next_index + len(messages) == total:
+                entry.messages.extend(messages)
+                overflow = len(entry.messages) - self.max_messages
+                if overflow > 0:
+                    del entry.messages[:overflow]
+                    entry.first_index += overflow
+            else:
+                # Another writer got in between; refetch on next read.
+                entry.messages = None
+            entry.record.next_index = total
+        return total
+
+    async def save_message(self, token: str, role: str, content: str) -> int:
+        """Sauvegarde un message dans l'historique."""
+        return await self.save_messages(token, [{"role": role, "content": content}])
+
+    async def get_history(self, token: str, since: int = 0) -> tuple[list[dict[str, str]], int]:
+        """
+        Récupère l'historique des messages.
+
+        Args:
+            token: Session token
+            since: Absolute index of the first message wanted; pass the value
+                returned by the previous call to only fetch new messages
+
+        Returns:
+            The messages still stored from ``since`` on, and the index to pass next
+        """
+        chat_key, session_key = self._keys(token)
+        if since <= 0:
+            pipe = self.client.pipeline(transaction=True)
+            pipe.lrange(chat_key, 0, -1)
+            pipe.hget(session_key, "seq")
+            raw, total = await pipe.execute()
+        else:
+            total = await self.client.hget(session_key, "seq")
+            raw = []
+            while int(total or 0) > since:
+                # Read the tail and the counter atomically; if a writer got in
+                # since the counter was read, the tail is misaligned: retry.
+                pipe = self.client.pipeline(transaction=True)
+                pipe.lrange(chat_key, since - int(total), -1)
+                pipe.hget(session_key, "seq")
+                raw, latest = await pipe.execute()
+                if latest == total:
+                    break
+                total = latest
+        return [json.loads(m) for m in raw], int(total or 0)
+
+    async def load_history(self, token: str) -> list[dict[str, str]]:
+        """
+        The stored history of a session, served from the in-process cache when
+        possible and otherwise fetching only what the cache is missing.
+        """
+        record = await self.load_session(token)
+        if record is None:
+            return []
+        entry = self._local[token]
+        if entry.messages is not None and entry.first_index + len(entry.messages) == record.next_index:
+            return list(entry.messages)
+
+        if entry.messages is None:
+            messages, total = await self.get_history(token)
+            entry.messages = messages
+        else:
+            new, total = await self.get_history(token, entry.first_index + len(entry.messages))
+            entry.messages.extend(new)
+        overflow = len(entry.messages) - self.max_messages
+        if overflow > 0:
+            del entry.messages[:overflow]
+        entry.first_index = total - len(entry.messages)
+        entry.record.next_index = total
+        return list(entry.messages)
+
+    # Personal data
+
+    async def set_personal_data(self, token: str, data: dict[str, Any]) -> None:
+        """Enregistre ou met à jour les données personnelles de l'utilisateur."""
+        if not data:
+            return
+        _, session_key = self._keys(token)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(session_key, mapping={f"p:{k}": v for k, v in data.items()})
+        pipe.expire(session_key, self.ttl)
+        await pipe.execute()
+        entry = self._local.get(token)
+        if entry is not None:
+            entry.record.personal_data.update({k: str(v) for k, v in data.items()})
+
+    async def get_personal_data(self, token: str) -> dict[str, str]:
+        """Récupère les données personnelles."""
+        record = await self.load_session(token)
+        return dict(record.personal_data) if record is not None else {}
+
+    # Lifetime
+
+    async def touch(self, token: str) -> None:
+        """Push back the expiry of an active session's keys."""
+        pipe = self.client.pipeline(transaction=False)
+        for key in self._keys(token):
+            pipe.expire(key, self.ttl)
+        await pipe.execute()
+
+    async def clear_all_data(self, token: str) -> None:
+        """Supprime l'historique et les données personnelles."""
+        self.invalidate(token)
+        await self.client.delete(*self._keys(token))
+
+    async def close(self) -> None:
+        await self.client.aclose()
@@ -0,0 +1,133 @@
+from functools import lru_cache
+from math import gcd
+from typing import Callable, Union
+
+import numpy as np
+
+# Zero crossings of the windowed sinc on each side of the centre tap, and the
+# Kaiser window shape (same default as scipy.signal.resample_poly).
+FILTER_HALF_LENGTH = 10
+KAISER_BETA = 5.0
+
+
+@lru_cache(maxsize=None)
+def polyphase_filter(src_rate: int, dst_rate: int) -> tuple[int, int, np.ndarray]:
+    """
+    Design the resampling filter for a ``src_rate -> dst_rate`` conversion.
+
+    The conversion ratio is reduced to ``up / down`` and the windowed-sinc
+    low-pass filter is designed at ``up`` times the source rate. The result
+    is cached per rate pair and shared read-only by every stream at that rate.
+
+    Returns:
+        ``(up, down, taps)``
+    """
+    if src_rate <= 0 or dst_rate <= 0:
+        raise ValueError(f"Invalid sample rates: {src_rate} -> {dst_rate}")
+    g = gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    factor = max(up, down)
+
+    num_taps = 2 * FILTER_HALF_LENGTH * factor + 1
+    t = np.arange(num_taps) - (num_taps - 1) / 2
+    taps = np.sinc(t / factor) * np.kaiser(num_taps, KAISER_BETA)
+    # Unity DC gain once the zero-stuffed input is accounted for.
+    taps *= up / taps.sum()
+    return up, down, taps.astype(np.float32)
+
+
+@lru_cache(maxsize=None)
+def _upfirdn(src_rate: int, dst_rate: int) -> Callable[[np.ndarray], np.ndarray]:
+    """``x -> scipy.signal.upfirdn(taps, x, up, down)`` for the filter of a rate pair."""
+    up, down, taps = polyphase_filter(src_rate, dst_rate)
+    try:
+        # What upfirdn builds on every call: the taps laid out per phase
+        # (8821 of them at 44.1 kHz), a sizeable part of a 20 ms chunk's cost.
+        from scipy.signal._upfirdn import _UpFIRDn
+    except ImportError:
+        from scipy.signal import upfirdn
+
+        return lambda x: upfirdn(taps, x, up, down)
+    return _UpFIRDn(taps, np.float32, up, down).apply_filter
+
+
+class StreamingResampler:
+    """Rational-ratio polyphase resampler for a single int16 mono stream.
+
+    Filter state is carried from one chunk to the next, so a stream resampled
+    chunk by chunk is identical to the same stream resampled in one go, without
+    the edge artifacts of resampling each chunk independently. Each chunk is
+    one ``scipy.signal.upfirdn`` call (polyphase, in C) over the new samples
+    and the few before them the filter still needs.
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int = 16000):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.up, self.down, taps = polyphase_filter(src_rate, dst_rate)
+        self._num_taps = len(taps)
+        self._upfirdn = _upfirdn(src_rate, dst_rate)
+        self.reset()
+
+    @property
+    def delay(self) -> int:
+        """Group delay of the filter, in output samples."""
+        return FILTER_HALF_LENGTH * max(self.up, self.down) // self.down
+
+    def reset(self) -> None:
+        """Forget all buffered input, e.g. at the start of a new utterance."""
+        # Input kept for the filter, starting at stream sample _start (a
+        # multiple of down, so that output n of the stream is output
+        # n - _start * up / down of upfirdn), and the next output to emit.
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._start = 0
+        self._next = 0
+        self._odd_byte = b""
+
+    def process(self, chunk: Union[bytes, bytearray, memoryview, np.ndarray]) -> bytes:
+        """
+        Resample the next chunk of the stream.
+
+        Args:
+            chunk: Little-endian int16 PCM, as raw bytes or an int16 array
+
+        Returns:
+            Resampled int16 PCM bytes; may be empty for very small chunks
+        """
+        if isinstance(chunk, np.ndarray):
+            samples = chunk
+        else:
+            data = bytes(chunk)
+            if self._odd_byte:
+                data = self._odd_byte + data
+            cut = len(data) - (len(data) % 2)
+            self._odd_byte = data[cut:]
+            samples = np.frombuffer(data, dtype="<i2", count=cut // 2)
+
+        return self._filter(samples).tobytes()
+
+    def _filter(self, samples: np.ndarray) -> np.ndarray:
+        # One copy converts the new samples to float and appends them to the carry.
+        buffer = np.empty(len(self._buffer) + len(samples), dtype=np.float32)
+        buffer[: len(self._buffer)] = self._buffer
+        buffer[len(self._buffer) :] = samples
+        end = self._start + len(buffer)
+        # Last output whose inputs have all arrived.
+        last = (end * self.up - 1) // self.down
+        if last < self._next:
+            self._buffer = buffer
+            return np.empty(0, dtype="<i2")
+
+        offset = self._start // self.down * self.up
+        output = self._upfirdn(buffer)
+        output = output[self._next - offset : last + 1 - offset]
+        self._next = last + 1
+
+        # Keep from the first input the next output needs, rounded down to a cycle.
+        first = max((self._next * self.down - self._num_taps + 1) // self.up, self._start)
+        keep = first // self.down * self.down
+        self._buffer = buffer[keep - self._start :]
+        self._start = keep
+
+        np.clip(output, -32768, 32767, out=output)
+        return np.rint(output).astype("<i2")
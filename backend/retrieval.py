@@ -0,0 +1,245 @@
+import hashlib
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from prompt import GuideSection, count_tokens, parse_guide
+
+# Bump when the tokenizer or passage splitting changes so stale indexes on
+# disk are rebuilt.
+INDEX_VERSION = 1
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Callers speak French or English while the guide is French only; English
+# terms are expanded into the vocabulary the guide actually uses.
+QUERY_EXPANSIONS = {
+    "choking": "étouffe étouffement obstruction voies aériennes corps étranger",
+    "choke": "étouffe étouffement obstruction voies aériennes corps étranger",
+    "throat": "gorge voies aériennes obstruction",
+    "swallowed": "avalé corps étranger obstruction",
+    "talk": "parler",
+    "cough": "tousser toux",
+    "bleeding": "saigne saignement hémorragie",
+    "bleed": "saigne saignement hémorragie",
+    "blood": "sang saignement hémorragie",
+    "unconscious": "perte connaissance inconsciente répond pas",
+    "passed": "perte connaissance",
+    "fainted": "évanouissement perte connaissance malaise",
+    "breathing": "respire respiration",
+    "breathe": "respire respiration",
+    "breath": "respire respiration",
+    "heart": "cardiaque coeur",
+    "cardiac": "cardiaque arrêt",
+    "cpr": "massage cardiaque compressions thoraciques réanimation",
+    "defibrillator": "défibrillateur dae défibrillation",
+    "aed": "défibrillateur dae défibrillation",
+    "pulse": "pouls arrêt cardiaque",
+    "collapsed": "effondré perte connaissance arrêt cardiaque",
+    "dizzy": "vertiges malaise",
+    "unwell": "malaise sent pas bien",
+    "pain": "douleur",
+    "chest": "poitrine thorax",
+    "wound": "plaie",
+    "cut": "plaie coupure",
+    "burn": "brûlure brûlé",
+    "burned": "brûlure brûlé",
+    "burnt": "brûlure brûlé",
+    "fire": "brûlure feu",
+    "broken": "fracture traumatisme os",
+    "fracture": "fracture traumatisme os",
+    "sprain": "entorse traumatisme articulation",
+    "fell": "chute traumatisme",
+    "fall": "chute traumatisme",
+    "bone": "os fracture",
+    "arm": "bras membre",
+    "leg": "jambe membre",
+    "head": "tête",
+    "baby": "nourrisson",
+    "infant": "nourrisson",
+    "child": "enfant",
+    "kid": "enfant",
+}
+
+# Chapters that document each function of functions.json.
+FUNCTION_CHAPTERS = {
+    "assistance_obstruction_voies_respiratoires": "Obstruction des voies aeriennes par un corps etranger",
+    "assistance_hemorragie_externe": "Hemorragie externe",
+    "assistance_perte_connaissance": "Perte de connaissance",
+    "assistance_arret_cardiaque": "Arret cardiaque",
+    "assistance_malaise": "Malaise",
+    "assistance_plaie": "Plaie",
+    "assistance_brule": "Brulure",
+    "assistance_traumatisme_os_articulations": "Traumatisme des os et articulations",
+    "assistance_position_laterale_securite": "Perte de connaissance",
+    "assistance_utilisation_defibrillateur": "Arret cardiaque",
+}
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    """
+    a au aux avec ce ces cette dans de des du elle en est et il ils je la le les
+    leur lui ma mais me mes mon ne nous on ou par pas pour qu que qui sa se ses
+    si son sur ta te tes ton tu un une vos votre vous y l d s n c j m t qu
+    the an and or of to in on at is are was be it he she they his her my our
+    your i we you this that with for from has have had not can
+    """.split()
+)
+# Light stemming: French inflections mostly live in the word ending, so
+# keeping a fixed-length prefix conflates "saigne"/"saignement" and
+# "respire"/"respiration" well enough for lexical retrieval.
+STEM_LENGTH = 6
+
+
+def tokenize(text: str) -> list[str]:
+    """Lowercase, strip accents and stopwords, and stem ``text``."""
+    folded = unicodedata.normalize("NFKD", text.lower())
+    folded = "".join(c for c in folded if not unicodedata.combining(c))
+    return [
+        word[:STEM_LENGTH]
+        for word in _WORD_RE.findall(folded)
+        if word not in _STOPWORDS
+    ]
+
+
+def expand_query(text: str) -> str:
+    words = re.findall(r"\w+", text.lower())
+    extra = [QUERY_EXPANSIONS[w] for w in words if w in QUERY_EXPANSIONS]
+    return " ".join([text, *extra])
+
+
+@dataclass(frozen=True)
+class Passage:
+    """A retrievable slice of one guide chapter."""
+
+    chapter: str
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return count_tokens(self.text)
+
+    def render(self) -> str:
+        return f"## {self.chapter}\n{self.text}"
+
+
+def split_passages(sections: list[GuideSection], max_tokens: int) -> list[Passage]:
+    """Split chapters on line boundaries into passages of at most ``max_tokens``."""
+    passages = []
+    for section in sections:
+        current: list[str] = []
+        size = 0
+        for line in section.text.splitlines():
+            line_tokens = count_tokens(line)
+            if current and size + line_tokens > max_tokens:
+                passages.append(Passage(section.title, "\n".join(current)))
+                current, size = [], 0
+            current.append(line)
+            size += line_tokens
+        if current:
+            passages.append(Passage(section.title, "\n".join(current)))
+    return passages
+
+
+class GuideIndex:
+    """BM25 index over passages of the first-aid guide."""
+
+    def __init__(self, passages: list[Passage], term_freqs: list[dict[str, int]]):
+        self.passages = passages
+        self.term_freqs = term_freqs
+        self.lengths = [sum(tf.values()) for tf in term_freqs]
+        self.avg_length = sum(self.lengths) / max(len(self.lengths), 1)
+        doc_freq: Counter[str] = Counter()
+        for tf in term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(passages)
+        self.idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()
+        }
+
+    @classmethod
+    def build(cls, sections: list[GuideSection], max_tokens: int = 400) -> "GuideIndex":
+        passages = split_passages(sections, max_tokens)
+        term_freqs = [
+            dict(Counter(tokenize(f"{p.chapter}\n{p.text}"))) for p in passages
+        ]
+        return cls(passages, term_freqs)
+
+    @classmethod
+    def load_or_build(
+        cls, guide_path: Path, index_path: Path, max_tokens: int = 400
+    ) -> "GuideIndex":
+        """
+        Load the index persisted next to the guide, rebuilding it if the guide,
+        the passage size or the index format changed.
+        """
+        raw = Path(guide_path).read_text(encoding="utf-8")
+        fingerprint = hashlib.sha256(
+            f"{INDEX_VERSION}:{max_tokens}:{raw}".encode("utf-8")
+        ).hexdigest()
+
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data["fingerprint"] == fingerprint:
+                return cls(
+                    [Passage(**p) for p in data["passages"]], data["term_freqs"]
+                )
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        index = cls.build(parse_guide(raw), max_tokens)
+        try:
+            tmp_path = Path(f"{index_path}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {
+                        "fingerprint": fingerprint,
+                        "passages": [
+                            {"chapter": p.chapter, "text": p.text} for p in index.passages
+                        ],
+                        "term_freqs": index.term_freqs,
+                    },
+                    f,
+                    ensure_ascii=False,
+                )
+            tmp_path.replace(index_path)
+        except OSError as e:
+            print(f"Could not persist guide index to {index_path}: {e}")
+        return index
+
+    def scores(self, query: str) -> list[float]:
+        terms = tokenize(expand_query(query))
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / self.avg_length)
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (BM25_K1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def search(self, query: str, top_k: int = 4) -> list[Passage]:
+        """
+        Return the ``top_k`` passages most relevant to ``query``, in document
+        order so that passages of the same chapter read consecutively.
+        """
+        scores = self.scores(query)
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        best = sorted(i for i in ranked[:top_k] if scores[i] > 0)
+        return [self.passages[i] for i in best]
+
+    def context(self, query: str, top_k: int = 4) -> Optional[str]:
+        """Render the top passages for inclusion in a prompt."""
+        passages = self.search(query, top_k)
+        if not passages:
+            return None
+        return "\n\n".join(p.render() for p in passages)
@@ -0,0 +1,238 @@
+"""Structured-output schemas, built once per process and shared by every session.
+
+``Function.arguments`` is a free-form dict, so the model can return
+arguments that do not match functions.json (a string age, "oui" for a
+boolean, a parameter of another function). :class:`FunctionSchemas` builds
+one argument model per function from functions.json at startup and checks
+every response against it with pydantic's compiled validators. Fixable
+arguments are repaired locally (coerced, or dropped if hopeless) instead of
+asking the model again; a function that does not exist is rejected.
+
+The SDK response format of a response model is also built once per class
+(see :func:`response_format`); ``chat.parse`` would regenerate it on every
+request.
+"""
+
+import json
+import re
+import threading
+import time
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+
+from tracing import Tracer, tracer as default_tracer
+
+# functions.json parameter types. Numbers keep ints as ints.
+JSON_TYPES: dict[str, Any] = {
+    "number": Union[int, float],
+    "integer": int,
+    "string": str,
+    "boolean": bool,
+}
+_NUMBER_RE = re.compile(r"-?\d+(?:[.,]\d+)?")
+_BOOLEANS = {
+    "oui": True, "vrai": True, "yes": True, "true": True, "normale": True, "normal": True,
+    "non": False, "faux": False, "no": False, "false": False, "anormale": False, "abnormal": False,
+}
+
+
+class SchemaError(ValueError):
+    """Raised when a response cannot be repaired into a valid function call."""
+
+
+@lru_cache(maxsize=None)
+def response_format(model: type[BaseModel]) -> Any:
+    """
+    The SDK ``response_format`` for ``model``, built once per class.
+
+    Equivalent to what ``client.chat.parse`` builds on every call; pass it to
+    ``client.chat.complete`` or ``stream_async`` instead.
+    """
+    from mistralai.extra.utils.response_format import response_format_from_pydantic_model
+
+    return response_format_from_pydantic_model(model)
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.strip().lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+@dataclass
+class SchemaStats:
+    valid: int = 0
+    repaired: int = 0
+    rejected: int = 0
+    validation_seconds: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        total = self.valid + self.repaired + self.rejected
+        return {
+            "valid": self.valid,
+            "repaired": self.repaired,
+            "rejected": self.rejected,
+            "mean_validation_us": 1e6 * self.validation_seconds / total if total else 0.0,
+        }
+
+
+class FunctionSchemas:
+    """Argument models of the functions of functions.json, and validation against them."""
+
+    def __init__(self, functions_path: Path, tracer: Optional[Tracer] = None):
+        """
+        Build the argument models.
+
+        Args:
+            functions_path: functions.json
+            tracer: Where to report build and validation times; defaults to
+                the process tracer
+        """
+        start = time.perf_counter()
+        functions = json.loads(Path(functions_path).read_text(encoding="utf-8"))["functions"]
+        self.descriptions = {f["name"]: f["description"] for f in functions}
+        self.arguments: dict[str, type[BaseModel]] = {
+            f["name"]: self._arguments_model(f) for f in functions
+        }
+        self._names = {_fold(name): name for name in self.arguments}
+        # Validate once so pydantic's lazy setup is not paid by the first call.
+        for model in self.arguments.values():
+            model.model_validate({})
+        self.build_seconds = time.perf_counter() - start
+        self.stats = SchemaStats()
+        self._lock = threading.Lock()
+
+        tracer = tracer or default_tracer
+        self.validation_time = tracer.histogram(
+            "llm_validation_seconds", "Time to validate and repair one structured response."
+        )
+        tracer.register(
+            "llm_schema_build_seconds",
+            "gauge",
+            "Time to build the argument models from functions.json.",
+            lambda: {"": self.build_seconds},
+        )
+        tracer.register(
+            "llm_responses_total",
+            "counter",
+            "Structured responses by validation result.",
+            lambda: {
+                f'result="{name}"': value
+                for name, value in self.stats.as_dict().items()
+                if name in ("valid", "repaired", "rejected")
+            },
+        )
+
+    @staticmethod
+    def _arguments_model(function: dict[str, Any]) -> type[BaseModel]:
+        fields = {
+            parameter["name"]: (
+                Optional[JSON_TYPES.get(parameter["type"], Any)],
+                Field(None, description=parameter["description"]),
+            )
+            for parameter in function["parameters"]
+        }
+        return create_model(
+            f"{function['name']}_arguments", __config__=ConfigDict(extra="forbid"), **fields
+        )
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def shared(cls, functions_path: Path) -> "FunctionSchemas":
+        """The instance for ``functions_path``, built on first use and reused across sessions."""
+        return cls(functions_path)
+
+    def validate(self, name: str, arguments: Any) -> tuple[str, dict[str, Any]]:
+        """
+        Check a function call against functions.json, repairing what can be.
+
+        Unknown parameters are dropped; values of the wrong type are coerced
+        (``"4 ans"`` to 4, ``"oui"`` to True) or dropped if they cannot be.
+
+        Returns:
+            The function name and its valid arguments, without the unset ones
+
+        Raises:
+            SchemaError: If the function does not exist
+        """
+        start = time.perf_counter()
+        try:
+            name, arguments, repaired = self._validate(name, arguments)
+        except SchemaError:
+            self._record("rejected", start)
+            raise
+        self._record("repaired" if repaired else "valid", start)
+        return name, arguments
+
+    def _record(self, result: str, start: float) -> None:
+        elapsed = time.perf_counter() - start
+        self.validation_time.observe(elapsed)
+        with self._lock:
+            setattr(self.stats, result, getattr(self.stats, result) + 1)
+            self.stats.validation_seconds += elapsed
+
+    def _validate(self, name: str, arguments: Any) -> tuple[str, dict[str, Any], bool]:
+        repaired = False
+        if name not in self.arguments:
+            known = self._names.get(_fold(str(name)).replace(" ", "_"))
+            if known is None:
+                raise SchemaError(f"Unknown function: {name!r}")
+            name, repaired = known, True
+        if not isinstance(arguments, dict):
+            arguments, repaired = {}, True
+
+        model = self.arguments[name]
+        try:
+            return name, model.model_validate(arguments).model_dump(exclude_none=True), repaired
+        except ValidationError as e:
+            errors = e.errors()
+
+        arguments = dict(arguments)
+        # A field can fail several ways (one per member of a union): fix it once.
+        for field in dict.fromkeys(error["loc"][0] for error in errors if error["loc"]):
+            if field not in arguments:
+                continue
+            if field not in model.model_fields:
+                del arguments[field]
+                continue
+            value = self._coerce(model.model_fields[field].annotation, arguments[field])
+            if value is None:
+                del arguments[field]
+            else:
+                arguments[field] = value
+        try:
+            valid = model.model_validate(arguments)
+        except ValidationError:
+            # Keep whatever validates on its own.
+            valid = model.model_validate(
+                {k: v for k, v in arguments.items() if self._field_ok(model, k, v)}
+            )
+        return name, valid.model_dump(exclude_none=True), True
+
+    @staticmethod
+    def _coerce(annotation: Any, value: Any) -> Any:
+        if isinstance(value, str):
+            if annotation == Optional[bool]:
+                return _BOOLEANS.get(_fold(value))
+            if annotation in (Optional[JSON_TYPES["number"]], Optional[int]):
+                match = _NUMBER_RE.search(value)
+                if match is None:
+                    return None
+                number = float(match.group().replace(",", "."))
+                return int(number) if number.is_integer() else number
+            return None
+        if annotation == Optional[str] and isinstance(value, (int, float, bool)):
+            return str(value)
+        return None
+
+    @staticmethod
+    def _field_ok(model: type[BaseModel], field: str, value: Any) -> bool:
+        try:
+            model.model_validate({field: value})
+        except ValidationError:
+            return False
+        return True
@@ -0,0 +1,22 @@
+"""Unified backend server: one asyncio loop serving every client protocol.
+
+Replaces the former entry points (backend.py, ws_back.py, ws_stt.py, stt.py,
+stt_2.py, test.py). Raw WebSocket (``/`` and ``/ws``), Socket.IO
+(``/socket.io/``), WAV upload (``/upload``) and streaming transcription of an
+upload (``/upload/stream``) are thin adapters over the same
+:class:`sessions.SessionManager`; ``/health``, ``/ready`` and ``/metrics``
+report on the process.
+
+Run it with ``python -m server`` from the backend directory. With
+``--gateway`` it only holds the connections and queues the work for the STT
+and LLM workers of workers.py (see server/gateway.py and workqueue.py).
+"""
+
+import time
+
+# Startup phases (see Server.timings) are timed from here, before the heavy imports.
+STARTED_AT = time.monotonic()
+
+from .app import Server, ServerConfig, create_app  # noqa: E402
+
+__all__ = ["Server", "ServerConfig", "create_app"]
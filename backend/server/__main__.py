@@ -0,0 +1,79 @@
+import argparse
+import asyncio
+from typing import Optional, Sequence
+
+from aiohttp import web
+
+from redis_store import MEMORY_URL
+
+from .app import SERVER_KEY, ServerConfig, create_app
+
+
+async def serve(config: ServerConfig) -> None:
+    app = create_app(config)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        for port in config.ports:
+            await web.TCPSite(runner, config.host, port).start()
+        app[SERVER_KEY].mark("listening")
+        print(f"Server listening on {', '.join(str(p) for p in config.ports)}")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Unified STT + LLM backend server")
+    parser.add_argument("--host", default=None)
+    parser.add_argument(
+        "--port", type=int, action="append", help="Port to listen on, repeatable (default 8001 and 5000)"
+    )
+    parser.add_argument(
+        "--fake-llm", type=float, metavar="SECONDS", help="Answer with a local fake LLM of this latency"
+    )
+    parser.add_argument(
+        "--memory-store",
+        action="store_true",
+        help="Keep sessions in this process instead of Redis (REDIS_URL=memory://)",
+    )
+    parser.add_argument(
+        "--lazy", action="store_true", help="Load the models on the first connection"
+    )
+    parser.add_argument(
+        "--resample-processes",
+        type=int,
+        metavar="N",
+        help="Resample client audio in N worker processes (see audio_pool.py)",
+    )
+    parser.add_argument(
+        "--gateway",
+        action="store_true",
+        help="Only hold connections; transcription and answers are left to workers.py",
+    )
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    if args.host is not None:
+        overrides["host"] = args.host
+    if args.port:
+        overrides["ports"] = tuple(args.port)
+    if args.fake_llm is not None:
+        overrides["fake_llm_latency"] = args.fake_llm
+    if args.memory_store:
+        overrides["redis_url"] = MEMORY_URL
+    if args.lazy:
+        overrides["warm_start"] = False
+    if args.resample_processes is not None:
+        overrides["resample_processes"] = args.resample_processes
+    if args.gateway:
+        overrides["role"] = "gateway"
+    print("Starting server, please wait...")
+    try:
+        asyncio.run(serve(ServerConfig.from_env(**overrides)))
+    except KeyboardInterrupt:
+        print("Server stopped by user")
+
+
+if __name__ == "__main__":
+    main()
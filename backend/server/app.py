@@ -0,0 +1,362 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Optional, Union
+
+from aiohttp import web
+
+from audio_codecs import Codec
+from audio_pool import AudioProcessPool
+from model_registry import ModelRegistry
+from redis_store import MEMORY_URL, REDIS_URL, HistoryStore, connect
+from sessions import Session, SessionLimitError, SessionManager
+from tracing import tracer
+from transcription import TranscriptionEngine
+
+from . import STARTED_AT
+
+if TYPE_CHECKING:
+    from .gateway import Gateway, RemoteSession
+
+
+def default_recorder_config() -> dict[str, Any]:
+    return {
+        "spinner": False,
+        "use_microphone": False,
+        # Final transcriptions come from the shared engine; the recorder only
+        # runs VAD and realtime text, so its own main model is the smallest.
+        "model": "tiny.en",
+        "language": "en",
+        "silero_sensitivity": 0.4,
+        "webrtc_sensitivity": 2,
+        "post_speech_silence_duration": 0.2,
+        "min_length_of_recording": 0,
+        "min_gap_between_recordings": 0,
+        "enable_realtime_transcription": True,
+        "realtime_processing_pause": 0,
+        "realtime_model_type": "tiny.en",
+    }
+
+
+@dataclass
+class ServerConfig:
+    """Settings of the unified server; see :meth:`from_env` for the variables."""
+
+    host: str = "0.0.0.0"
+    # 8001 is where the raw WebSocket clients connect, 5000 the Socket.IO
+    # app and uploads; every port serves every adapter.
+    ports: tuple[int, ...] = (8001, 5000)
+    recorder_config: dict[str, Any] = field(default_factory=default_recorder_config)
+    whisper_model: str = "small"
+    language: Optional[str] = "en"
+    cpu_threads: int = 4
+    max_batch_size: int = 8
+    max_wait: float = 0.05
+    # Connections held at once. None: as many recorders as the host's memory
+    # holds (sessions.default_max_sessions, ~700 MB each), or 1000 gateway
+    # connections, which hold no recorder.
+    max_sessions: Optional[int] = None
+    # Threads for blocking work off the event loop: recorder leases, model
+    # loading, session teardown.
+    workers: int = 16
+    speculate: bool = True
+    # Answer unambiguous emergencies locally (see llm.FunctionRouter).
+    local_routing: bool = True
+    # Load models right after startup; if False, on the first connection.
+    warm_start: bool = True
+    # Seconds a connection waits for the models before it is turned away.
+    ready_timeout: float = 120.0
+    upload_dir: str = "uploads"
+    # Per-host model directory; defaults to MODEL_CACHE_DIR (see model_registry.py).
+    model_dir: Optional[str] = None
+    metrics_file: Optional[str] = None
+    # Session store; redis_store.MEMORY_URL keeps it in this process, which
+    # loses sessions on restart and cannot be shared with workers.py.
+    redis_url: str = REDIS_URL
+    fake_llm_latency: Optional[float] = None
+    # "standalone" runs the whole pipeline in this process; "gateway" only
+    # holds connections and queues the work for workers.py (see server/gateway.py).
+    role: str = "standalone"
+    # Partitions of the gateway work queues; must match the workers'.
+    queue_partitions: int = 8
+    # Worker processes resampling client audio (see audio_pool.py); 0 to
+    # resample in the sessions' own threads.
+    resample_processes: int = 0
+
+    @classmethod
+    def from_env(cls, **overrides: Any) -> "ServerConfig":
+        """Defaults overridden by WHISPER_MODEL, WHISPER_CPU_THREADS, WHISPER_MAX_BATCH,
+        WHISPER_MAX_WAIT, MAX_SESSIONS, SPECULATIVE_DISPATCH, LOCAL_ROUTING, WARM_START,
+        UPLOAD_DIR, METRICS_FILE, REDIS_URL, FAKE_LLM_LATENCY, SERVER_ROLE, QUEUE_PARTITIONS
+        and RESAMPLE_PROCESSES, then by ``overrides``.
+        The model directory is read by :class:`ModelRegistry` itself."""
+        env = os.environ
+        config = cls(
+            whisper_model=env.get("WHISPER_MODEL", cls.whisper_model),
+            cpu_threads=int(env.get("WHISPER_CPU_THREADS", cls.cpu_threads)),
+            max_batch_size=int(env.get("WHISPER_MAX_BATCH", cls.max_batch_size)),
+            max_wait=float(env.get("WHISPER_MAX_WAIT", cls.max_wait)),
+            max_sessions=int(env["MAX_SESSIONS"]) if env.get("MAX_SESSIONS") else None,
+            speculate=env.get("SPECULATIVE_DISPATCH", "1") == "1",
+            local_routing=env.get("LOCAL_ROUTING", "1") == "1",
+            warm_start=env.get("WARM_START", "1") == "1",
+            upload_dir=env.get("UPLOAD_DIR", cls.upload_dir),
+            metrics_file=env.get("METRICS_FILE") or None,
+            redis_url=env.get("REDIS_URL") or REDIS_URL,
+            fake_llm_latency=float(env["FAKE_LLM_LATENCY"]) if env.get("FAKE_LLM_LATENCY") else None,
+            role=env.get("SERVER_ROLE", cls.role),
+            queue_partitions=int(env.get("QUEUE_PARTITIONS", cls.queue_partitions)),
+            resample_processes=int(env.get("RESAMPLE_PROCESSES", cls.resample_processes)),
+        )
+        for name, value in overrides.items():
+            setattr(config, name, value)
+        return config
+
+
+class ServerNotReady(SessionLimitError):
+    """Raised when the models are not loaded in time for a connection."""
+
+
+class Server:
+    """Shared state of the unified server: models, sessions and store.
+
+    Models are loaded off the event loop, either right after startup or on
+    the first connection, so the sockets are listening (and ``/ready``
+    answers) while Whisper and the recorders load.
+    """
+
+    def __init__(self, config: ServerConfig):
+        self.config = config
+        self.created_at = STARTED_AT
+        self.timings: dict[str, float] = {}
+        self.models = ModelRegistry(config.model_dir)
+        self.store = HistoryStore(connect(config.redis_url))
+        if config.redis_url == MEMORY_URL:
+            print("Sessions are kept in memory: they cannot be resumed after a restart")
+        self.engine: Optional[TranscriptionEngine] = None
+        self.resample_pool: Optional[AudioProcessPool] = None
+        self.sessions: Optional[Union[SessionManager, "Gateway"]] = None
+        self.load_error: Optional[BaseException] = None
+        self._loading: Optional[asyncio.Task] = None
+        self._background: list[asyncio.Task] = []
+        self.mark("imported")
+        self.connect_seconds = tracer.histogram(
+            "session_open_seconds", "Time to set up a session for a new connection."
+        )
+        tracer.register(
+            "server_startup_seconds",
+            "gauge",
+            "Seconds from process start to each startup phase.",
+            lambda: {f'phase="{phase}"': seconds for phase, seconds in self.timings.items()},
+        )
+
+    @property
+    def ready(self) -> bool:
+        return self.sessions is not None
+
+    async def on_startup(self, app: web.Application) -> None:
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(
+            ThreadPoolExecutor(self.config.workers, thread_name_prefix="server")
+        )
+        if self.config.metrics_file:
+            self._background.append(asyncio.create_task(self._write_metrics()))
+        if self.config.warm_start:
+            self.load()
+
+    def mark(self, phase: str) -> None:
+        self.timings[phase] = time.monotonic() - self.created_at
+        print(f"Server {phase} after {self.timings[phase]:.2f}s")
+
+    def load(self) -> asyncio.Task:
+        """Start loading the models, once."""
+        if self._loading is None:
+            self._loading = asyncio.create_task(self._load())
+        return self._loading
+
+    async def _load(self) -> None:
+        loop = asyncio.get_running_loop()
+        config = self.config
+        if config.resample_processes and self.resample_pool is None:
+            self.resample_pool = await loop.run_in_executor(
+                None, AudioProcessPool, config.resample_processes
+            )
+        if config.role == "gateway":
+            await self._start_gateway()
+            return
+        try:
+            # Loaded from the per-host model directory and warmed up with
+            # one inference before any caller needs it.
+            model = await loop.run_in_executor(
+                None,
+                lambda: self.models.whisper(config.whisper_model, cpu_threads=config.cpu_threads),
+            )
+            self.mark("whisper_loaded")
+            engine = TranscriptionEngine(
+                model,
+                language=config.language,
+                max_batch_size=config.max_batch_size,
+                max_wait=config.max_wait,
+            )
+            self.engine = engine
+            llm_client = None
+            if config.fake_llm_latency is not None:
+                # Offline load tests: answer locally instead of calling Mistral.
+                from loadtest import FakeMistral
+
+                llm_client = FakeMistral(latency=config.fake_llm_latency)
+            llm_factory = await loop.run_in_executor(
+                None,
+                lambda: SessionManager.shared_llm_factory(
+                    llm_client, local_routing=config.local_routing
+                ),
+            )
+            sessions = SessionManager(
+                self.models.recorder_config(config.recorder_config),
+                max_sessions=config.max_sessions,
+                llm_factory=llm_factory,
+                store=self.store,
+                engine=engine,
+                speculate=config.speculate,
+                resample_pool=self.resample_pool,
+            )
+            # Load the first recorder up front so the first caller does not wait.
+            await loop.run_in_executor(None, sessions.pool.prewarm, 1)
+            self.mark("recorder_loaded")
+        except Exception as e:
+            self.load_error = e
+            print(f"Could not load the models: {e}")
+            raise
+        self.sessions = sessions
+        self.mark("ready")
+
+    async def _start_gateway(self) -> None:
+        from .gateway import Gateway
+
+        # No model to load: the work queues share the store's Redis.
+        gateway = Gateway(
+            self.store.client,
+            store=self.store,
+            partitions=self.config.queue_partitions,
+            max_sessions=self.config.max_sessions,
+            resample_pool=self.resample_pool,
+        )
+        await gateway.start()
+        self.sessions = gateway
+        self.mark("ready")
+
+    async def open_session(
+        self,
+        channel: Any,
+        token: Optional[str] = None,
+        codec: Codec = Codec.PCM16,
+        *,
+        partial_deltas: bool = False,
+    ) -> Union[Session, "RemoteSession"]:
+        """
+        Start a session for a new connection, waiting for the models if needed.
+        With ``partial_deltas``, realtime transcripts are sent as deltas (see
+        transcript_diff.py).
+
+        Raises:
+            SessionLimitError: If the server is saturated or not ready in time
+        """
+        start = time.monotonic()
+        if self.sessions is None:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.load()), self.config.ready_timeout)
+            except asyncio.TimeoutError:
+                raise ServerNotReady(f"Models not loaded after {self.config.ready_timeout}s")
+            except Exception as e:
+                raise ServerNotReady(f"Models failed to load: {e}")
+        session = await self.sessions.open(channel, token, codec, partial_deltas=partial_deltas)
+        self.connect_seconds.observe(time.monotonic() - start)
+        return session
+
+    async def close_session(
+        self, session: Union[Session, "RemoteSession"], *, forget: bool = False
+    ) -> None:
+        await self.sessions.close(session, forget=forget)
+
+    async def _write_metrics(self, interval: float = 15.0) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                tracer.write(self.config.metrics_file)
+            except OSError as e:
+                print(f"Could not write metrics to {self.config.metrics_file}: {e}")
+
+    async def on_cleanup(self, app: web.Application) -> None:
+        print("Shutting down server...")
+        for task in self._background:
+            task.cancel()
+        if self._loading is not None and not self._loading.done():
+            self._loading.cancel()
+        if isinstance(self.sessions, SessionManager):
+            await self.sessions.close_all()
+            self.sessions.pool.shutdown()
+        elif self.sessions is not None:
+            await self.sessions.stop()
+        if self.resample_pool is not None:
+            self.resample_pool.shutdown()
+        await self.store.close()
+        if self.engine is not None:
+            self.engine.shutdown()
+
+
+SERVER_KEY = web.AppKey("server", Server)
+
+
+async def health(request: web.Request) -> web.Response:
+    """Liveness: the event loop is answering."""
+    return web.json_response({"status": "ok"})
+
+
+async def ready(request: web.Request) -> web.Response:
+    """Readiness: models loaded and sessions can be opened."""
+    server = request.app[SERVER_KEY]
+    body: dict[str, Any] = {
+        "ready": server.ready,
+        "role": server.config.role,
+        "timings": server.timings,
+        "models": {name: asdict(load) for name, load in server.models.loads.items()},
+    }
+    if server.ready:
+        body["sessions"] = len(server.sessions)
+        if isinstance(server.sessions, SessionManager):
+            body["capacity"] = server.sessions.pool.size
+        else:
+            body["capacity"] = server.sessions.max_sessions
+        return web.json_response(body)
+    if server.load_error is not None:
+        body["error"] = str(server.load_error)
+    return web.json_response(body, status=503)
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=tracer.render(), content_type="text/plain", charset="utf-8")
+
+
+def create_app(config: Optional[ServerConfig] = None) -> web.Application:
+    """Build the application: raw WebSocket, Socket.IO and HTTP adapters on one loop."""
+    from .sio import attach_socketio
+    from .upload import stream_upload, upload
+    from .websocket import websocket_handler
+
+    server = Server(config or ServerConfig.from_env())
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app[SERVER_KEY] = server
+    app.router.add_get("/health", health)
+    app.router.add_get("/ready", ready)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_post("/upload", upload)
+    app.router.add_post("/upload/stream", stream_upload)
+    # stt_2.py clients connect to the root; /ws is the explicit path.
+    app.router.add_get("/", websocket_handler)
+    app.router.add_get("/ws", websocket_handler)
+    attach_socketio(app, server)
+    app.on_startup.append(server.on_startup)
+    app.on_cleanup.append(server.on_cleanup)
+    return app
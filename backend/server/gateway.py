@@ -0,0 +1,334 @@
+"""Gateway mode: hold the connections, leave transcription and answers to workers.
+
+With ``SERVER_ROLE=gateway`` (or ``python -m server --gateway``) the server
+loads no model. Each connection gets a :class:`RemoteSession`, which offers
+the socket adapters the same surface as :class:`sessions.Session` but only
+gates the audio: every utterance the VAD gate closes is resampled (in the
+resampling pool, if any) and queued for the STT workers, and the results the
+workers send back are forwarded to the socket (see workqueue.py and
+workers.py).
+"""
+
+import asyncio
+import base64
+import os
+import socket
+import uuid
+from typing import Any, Optional
+
+import numpy as np
+
+from audio_codecs import TARGET_RATE
+from audio_pool import AudioProcessPool, PooledResampler
+from framing import Codec
+from redis_store import HistoryStore, SessionRecord
+from sessions import ClientSession, SessionLimitError
+from tracing import Trace, Tracer, tracer as default_tracer
+from vad_gate import GateStats, VadGate
+from workqueue import DEFAULT_PARTITIONS, Replies, WorkQueue
+
+# Pause that ends an utterance. There is no recorder VAD after the gate here,
+# so its hangover is the end-of-speech silence itself.
+PAUSE_MS = 600
+# Longer utterances are cut and sent in pieces.
+MAX_UTTERANCE_SECONDS = 30
+# Connections a gateway holds by default; they hold no recorder.
+MAX_SESSIONS = 1000
+
+
+class RemoteSession(ClientSession):
+    """Gateway end of a session: cuts the audio into utterances and queues them.
+
+    Messages about an utterance come back from the workers through the
+    :class:`Gateway`, in the order the workers send them, and are posted to
+    the session's outbox, so a slow socket holds up only its own session.
+    """
+
+    def __init__(
+        self,
+        session_id: int,
+        websocket: Any,
+        gateway: "Gateway",
+        record: Optional[SessionRecord] = None,
+        codec: Codec = Codec.PCM16,
+        tracer: Optional[Tracer] = None,
+        resample_pool: Optional[AudioProcessPool] = None,
+    ):
+        super().__init__(session_id, websocket, asyncio.get_running_loop(), codec)
+        self.gateway = gateway
+        self.record = record
+        self.tracer = tracer or default_tracer
+        self.resample_pool = resample_pool
+        self._pooled_resampler: Optional[PooledResampler] = None
+        self.gate: Optional[VadGate] = None
+        self.gate_stats = GateStats()
+        # Audio of the utterance being captured, at the client's rate.
+        self._utterance: list[np.ndarray] = []
+        self._utterance_samples = 0
+        self._trace: Optional[Trace] = None
+        # Utterances and messages waiting to be queued, and their audio length.
+        self._jobs: asyncio.Queue = asyncio.Queue()
+        self._jobs_seconds = 0.0
+        # Work sent to the workers and not finished, by origin.
+        self.outstanding: dict[str, Trace] = {}
+        self._pump = self.loop.create_task(self._send_jobs())
+
+    @property
+    def token(self) -> Optional[str]:
+        return self.record.token if self.record is not None else None
+
+    @property
+    def key(self) -> str:
+        """Partition key: the token, so a resumed session stays with its workers."""
+        return self.token or f"{self.gateway.id}:{self.session_id}"
+
+    @property
+    def busy(self) -> bool:
+        """Audio being captured or queued, or an utterance not yet answered."""
+        return bool(self._utterance or self._jobs.qsize() or self.outstanding)
+
+    @property
+    def queued_seconds(self) -> float:
+        return self._jobs_seconds
+
+    def feed_samples(self, samples: np.ndarray, sample_rate: int) -> None:
+        """Gate the samples and add them to the utterance, queueing it once it ends."""
+        if not self.active:
+            return
+        if sample_rate != self.sample_rate:
+            self.close_utterance()
+            self.sample_rate = sample_rate
+            self.gate = VadGate(sample_rate, hangover_ms=PAUSE_MS, stats=self.gate_stats)
+        passed = self.gate.process(samples)
+        if len(passed):
+            if self._trace is None:
+                self._trace = self.tracer.start()
+            self._utterance.append(passed)
+            self._utterance_samples += len(passed)
+        if not self.gate.open or self._utterance_samples >= MAX_UTTERANCE_SECONDS * sample_rate:
+            self.close_utterance()
+
+    def close_utterance(self) -> None:
+        """Queue the utterance being captured, if any, for transcription."""
+        if not self._utterance:
+            return
+        audio = np.concatenate(self._utterance)
+        trace = self._trace or self.tracer.start()
+        self._utterance, self._utterance_samples, self._trace = [], 0, None
+        trace.mark("vad_end")
+        origin = uuid.uuid4().hex
+        self.outstanding[origin] = trace
+        self._jobs_seconds += len(audio) / self.sample_rate
+        self._jobs.put_nowait(("stt", origin, (audio, self.sample_rate)))
+
+    def respond(self, sentence: str, trace: Optional[Trace] = None) -> None:
+        """Have the workers answer a typed ``sentence``."""
+        if not self.active:
+            return
+        origin = uuid.uuid4().hex
+        self.outstanding[origin] = trace or self.tracer.start()
+        self._jobs.put_nowait(("llm", origin, sentence))
+
+    async def _send_jobs(self) -> None:
+        gateway = self.gateway
+        while True:
+            queue, origin, payload = await self._jobs.get()
+            trace = self.outstanding.get(origin) or self.tracer.start()
+            fields = {
+                "gateway": gateway.id,
+                "session": str(self.session_id),
+                "token": self.token or "",
+                "origin": origin,
+                "trace_id": trace.trace_id,
+            }
+            try:
+                if queue == "stt":
+                    audio, sample_rate = payload
+                    self._jobs_seconds -= len(audio) / sample_rate
+                    audio = await self._resample(audio, sample_rate)
+                    fields["audio"] = base64.b64encode(audio.astype("<i2").tobytes()).decode()
+                    await gateway.stt.put(self.key, fields)
+                else:
+                    await gateway.llm.put(self.key, {**fields, "text": payload})
+            except Exception as e:
+                print(f"Session {self.session_id}: could not queue {queue} job: {e}")
+                self.finish(origin, "error")
+                self.post({"type": "error", "text": str(e), "trace_id": trace.trace_id})
+
+    async def _resample(self, audio: np.ndarray, sample_rate: int) -> np.ndarray:
+        if self.resample_pool is None or sample_rate == TARGET_RATE:
+            return self.decoder.resample(audio, sample_rate)
+        try:
+            if self._pooled_resampler is None or self._pooled_resampler.src_rate != sample_rate:
+                if self._pooled_resampler is not None:
+                    self._pooled_resampler.close()
+                self._pooled_resampler = self.resample_pool.open(sample_rate)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self._pooled_resampler.process, audio)
+        except Exception as e:
+            # As in sessions.Session: lose the pool rather than the audio.
+            print(f"Session {self.session_id}: resampling pool failed, resampling locally: {e}")
+            self.resample_pool = None
+            return self.decoder.resample(audio, sample_rate)
+
+    def deliver(self, origin: str, message: dict[str, Any]) -> None:
+        """Post a worker's message about ``origin`` to the client."""
+        kind = message.get("type")
+        trace = self.outstanding.get(origin)
+        if trace is not None:
+            if kind == "fullSentence":
+                trace.mark("transcribed")
+            elif kind == "response_delta":
+                trace.mark("first_token")
+            elif kind in ("transcribed", "response", "error"):
+                self.finish(origin, {"transcribed": "empty", "response": "answered"}.get(kind, kind))
+        if kind != "transcribed":
+            self.post(message)
+
+    def finish(self, origin: str, outcome: str) -> None:
+        trace = self.outstanding.pop(origin, None)
+        if trace is not None:
+            if outcome == "answered":
+                trace.mark("sent")
+            trace.finish(outcome)
+
+    def stop(self) -> None:
+        """Stop queueing; utterances and answers still in flight are dropped."""
+        self.active = False
+        self._pump.cancel()
+        if self._pooled_resampler is not None:
+            self._pooled_resampler.close()
+        for origin in list(self.outstanding):
+            self.finish(origin, "closed")
+
+
+class Gateway:
+    """The sessions of a gateway process, and the queues linking them to the workers.
+
+    Offers the server the part of :class:`sessions.SessionManager` it uses.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        *,
+        store: Optional[HistoryStore] = None,
+        gateway_id: Optional[str] = None,
+        partitions: int = DEFAULT_PARTITIONS,
+        max_sessions: Optional[int] = None,
+        tracer: Optional[Tracer] = None,
+        resample_pool: Optional[AudioProcessPool] = None,
+    ):
+        """
+        Initialize the gateway.
+
+        Args:
+            client: ``redis.asyncio.Redis`` or :class:`redis_store.MemoryBackend`
+                shared with the workers
+            store: Persists sessions so they can be resumed by token, on any
+                gateway. If None, sessions end with their connection
+            gateway_id: Name of the reply stream of this process; defaults to
+                host name and PID, and must be unique among running gateways
+            partitions: Partitions of the work queues, as configured on the workers
+            max_sessions: Connections held at once; defaults to MAX_SESSIONS
+            tracer: Collects per-utterance latency traces. If None, uses the
+                process-wide tracer of tracing.py
+            resample_pool: Worker processes resampling the utterances. If
+                None, they are resampled on the event loop
+        """
+        self.id = gateway_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.store = store
+        self.stt = WorkQueue(client, "stt", partitions=partitions)
+        self.llm = WorkQueue(client, "llm", partitions=partitions)
+        self.replies = Replies(client)
+        self.max_sessions = max_sessions or MAX_SESSIONS
+        self.tracer = tracer or default_tracer
+        self.resample_pool = resample_pool
+        self.gate_stats = GateStats()
+        self.sessions: dict[int, RemoteSession] = {}
+        self._next_id = 0
+        self._listener: Optional[asyncio.Task] = None
+        self.tracer.register(
+            "gateway_outstanding_jobs",
+            "gauge",
+            "Utterances and messages sent to the workers and not answered yet.",
+            lambda: {"": sum(len(s.outstanding) for s in list(self.sessions.values()))},
+        )
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    async def start(self) -> None:
+        """Start reading this gateway's replies."""
+        if self._listener is None:
+            self._listener = asyncio.create_task(self.replies.listen(self.id, self._deliver))
+
+    async def _deliver(self, session_id: str, origin: str, message: dict[str, Any]) -> None:
+        # Only posts: the session's own task sends, so the listener never
+        # waits on one socket while replies for the others pile up.
+        session = self.sessions.get(int(session_id))
+        if session is not None:
+            session.deliver(origin, message)
+
+    async def open(
+        self,
+        websocket: Any,
+        token: Optional[str] = None,
+        codec: Codec = Codec.PCM16,
+        *,
+        partial_deltas: bool = False,
+    ) -> RemoteSession:
+        """Start a session for ``websocket``, like :meth:`sessions.SessionManager.open`.
+
+        Workers transcribe whole utterances, so there are no realtime
+        transcripts here and ``partial_deltas`` has no effect.
+
+        Raises:
+            SessionLimitError: If the gateway holds ``max_sessions`` connections
+        """
+        if len(self.sessions) >= self.max_sessions:
+            raise SessionLimitError(f"All {self.max_sessions} gateway sessions in use")
+        record = None
+        if self.store is not None:
+            try:
+                record = await self.store.open_session(token)
+            except Exception as e:
+                print(f"Session store unavailable: {e}")
+
+        self._next_id += 1
+        session = RemoteSession(
+            self._next_id, websocket, self, record, codec, self.tracer, self.resample_pool
+        )
+        self.sessions[session.session_id] = session
+        hello = {"type": "session", "codec": codec.name.lower()}
+        if record is not None:
+            hello.update(token=record.token, resumed=record.resumed)
+        await session.send(hello)
+        print(
+            f"Session {session.session_id} {'resumed' if record and record.resumed else 'opened'} "
+            f"on gateway {self.id} ({len(self.sessions)} active)"
+        )
+        return session
+
+    async def close(self, session: RemoteSession, *, forget: bool = False) -> None:
+        """Tear down ``session``; see :meth:`sessions.SessionManager.close`."""
+        if self.sessions.pop(session.session_id, None) is None:
+            return
+        session.stop()
+        self.gate_stats.merge(session.gate_stats)
+        if forget and self.store is not None and session.token is not None:
+            try:
+                await self.store.clear_all_data(session.token)
+            except Exception as e:
+                print(f"Error clearing stored data: {e}")
+        print(f"Session {session.session_id} closed ({len(self.sessions)} active)")
+
+    async def close_all(self) -> None:
+        for session in list(self.sessions.values()):
+            await self.close(session)
+
+    async def stop(self) -> None:
+        """Close every session and stop reading replies."""
+        await self.close_all()
+        if self._listener is not None:
+            self._listener.cancel()
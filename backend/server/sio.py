@@ -0,0 +1,110 @@
+import base64
+from typing import Any, Optional
+from urllib.parse import parse_qs
+
+import socketio
+from aiohttp import web
+
+from audio_codecs import negotiate
+from sessions import Session, SessionLimitError
+
+from .app import Server
+from .websocket import feed_binary
+
+# Socket.IO events of the mobile app (see frontend/app/index.tsx) and of the
+# former ws_stt.py / stt.py clients.
+TRANSCRIPTION_EVENT = "transcription"
+RESPONSE_EVENT = "serverResponse"
+
+
+class SocketIOChannel:
+    """What a :class:`Session` sends through: one Socket.IO event per message."""
+
+    def __init__(self, sio: socketio.AsyncServer, sid: str):
+        self.sio = sio
+        self.sid = sid
+
+    async def send_message(self, message: dict[str, Any]) -> None:
+        kind = message.get("type")
+        if kind in ("realtime", "realtime_delta", "fullSentence"):
+            await self.sio.emit(TRANSCRIPTION_EVENT, message, to=self.sid)
+        elif kind == "response" and isinstance(message.get("text"), dict):
+            function = message["text"]
+            await self.sio.emit(
+                RESPONSE_EVENT,
+                {
+                    "nom_fonction": function.get("name"),
+                    "arguments": function.get("arguments", {}),
+                    "description": function.get("description"),
+                    "trace_id": message.get("trace_id"),
+                },
+                to=self.sid,
+            )
+        else:
+            await self.sio.emit(kind or "message", message, to=self.sid)
+
+
+def _query(environ: dict[str, Any], name: str) -> Optional[str]:
+    values = parse_qs(environ.get("QUERY_STRING", "")).get(name)
+    return values[0] if values else None
+
+
+def attach_socketio(app: web.Application, server: Server) -> socketio.AsyncServer:
+    """Serve the Socket.IO protocol under ``/socket.io/`` of ``app``."""
+    sio = socketio.AsyncServer(async_mode="aiohttp", cors_allowed_origins="*")
+    sio.attach(app)
+    sessions: dict[str, Session] = {}
+
+    @sio.event
+    async def connect(sid: str, environ: dict[str, Any], auth: Optional[dict] = None) -> None:
+        auth = auth or {}
+        token = auth.get("token") or _query(environ, "token")
+        codecs = auth.get("codecs") or _query(environ, "codecs")
+        if isinstance(codecs, str):
+            codecs = codecs.split(",")
+        deltas = (auth.get("partials") or _query(environ, "partials")) == "delta"
+        try:
+            sessions[sid] = await server.open_session(
+                SocketIOChannel(sio, sid), token, negotiate(codecs), partial_deltas=deltas
+            )
+        except SessionLimitError as e:
+            print(f"Rejecting client: {e}")
+            raise socketio.exceptions.ConnectionRefusedError("Server busy, retry later")
+
+    @sio.on("audioChunk")
+    async def audio_chunk(sid: str, data: Any) -> None:
+        session = sessions.get(sid)
+        if session is None:
+            return
+        try:
+            if isinstance(data, (bytes, bytearray)):
+                feed_binary(session, data)
+            else:
+                # The app sends base64 PCM16 without metadata: 44.1 kHz.
+                sample_rate = data.get("metadata", {}).get("sampleRate", 44100)
+                session.feed_audio(base64.b64decode(data["data"]), sample_rate)
+        except Exception as e:
+            print(f"Erreur lors du traitement du chunk audio: {e}")
+
+    @sio.on("audioStart")
+    async def audio_start(sid: str, *args: Any) -> None:
+        print(f"Début de l'enregistrement ({sid})")
+
+    @sio.on("audioEnd")
+    async def audio_end(sid: str, *args: Any) -> None:
+        print(f"Fin de l'enregistrement ({sid})")
+
+    @sio.on("sendMessage")
+    async def send_message(sid: str, message: Any) -> None:
+        session = sessions.get(sid)
+        if session is not None and isinstance(message, str) and message.strip():
+            session.respond(message)
+
+    @sio.event
+    async def disconnect(sid: str, reason: Any = None) -> None:
+        session = sessions.pop(sid, None)
+        if session is not None:
+            hung_up = reason == sio.reason.CLIENT_DISCONNECT
+            await server.close_session(session, forget=hung_up)
+
+    return sio
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, AsyncIterator
+
+import numpy as np
+from aiohttp import web
+
+from sessions import Session, SessionLimitError
+from wav_stream import WavStreamParser
+
+from .app import SERVER_KEY
+
+CHUNK_SIZE = 64 * 1024
+# Audio a streaming upload may queue ahead of the recorder; reading more of
+# the body waits, so the client is slowed down by TCP instead of the server
+# buffering (or dropping) the file.
+MAX_QUEUED_SECONDS = 2.0
+# Silence fed after the file so the VAD closes the last utterance.
+TRAILING_SILENCE = 1.5
+# The session must stay idle this long to be considered done, covering the
+# gap between the recorder's VAD closing an utterance and it being reported.
+SETTLE_SECONDS = 0.5
+# Longest wait for the last transcription and answer after the upload.
+DRAIN_TIMEOUT = 60.0
+
+
+async def upload(request: web.Request) -> web.Response:
+    """Store a WAV file sent as the ``file`` field of a multipart form (former backend.py)."""
+    server = request.app[SERVER_KEY]
+    if not request.content_type.startswith("multipart/"):
+        return web.json_response({"error": "No file part"}, status=400)
+    reader = await request.multipart()
+    field = None
+    async for part in reader:
+        if part.name == "file":
+            field = part
+            break
+    if field is None:
+        return web.json_response({"error": "No file part"}, status=400)
+    if not field.filename:
+        return web.json_response({"error": "No selected file"}, status=400)
+    if not field.filename.endswith(".wav"):
+        return web.json_response(
+            {"error": "Invalid file format. Only WAV files are allowed."}, status=400
+        )
+
+    os.makedirs(server.config.upload_dir, exist_ok=True)
+    # Never trust a client path: keep the base name only.
+    file_path = os.path.join(server.config.upload_dir, os.path.basename(field.filename))
+    with open(file_path, "wb") as f:
+        while chunk := await field.read_chunk(CHUNK_SIZE):
+            f.write(chunk)
+    return web.json_response({"message": "File uploaded successfully", "file_path": file_path})
+
+
+class EventStreamChannel:
+    """What a :class:`Session` sends through: Server-Sent Events named by message type.
+
+    Messages sent before the response is prepared (the ``session`` greeting)
+    are held back until :meth:`prepare`.
+    """
+
+    def __init__(self, response: web.StreamResponse):
+        self.response = response
+        self.last_sent = time.monotonic()
+        self._held: list[dict[str, Any]] = []
+
+    async def prepare(self, request: web.Request) -> None:
+        await self.response.prepare(request)
+        held, self._held = self._held, []
+        for message in held:
+            await self.send_message(message)
+
+    async def send_message(self, message: dict[str, Any]) -> None:
+        if not self.response.prepared:
+            self._held.append(message)
+            return
+        self.last_sent = time.monotonic()
+        event = message.get("type", "message")
+        data = json.dumps(message, ensure_ascii=False)
+        await self.response.write(f"event: {event}\ndata: {data}\n\n".encode("utf-8"))
+
+
+async def _body_chunks(request: web.Request) -> AsyncIterator[bytes]:
+    """The WAV bytes of the request: the ``file`` field of a form, or the raw body."""
+    if request.content_type.startswith("multipart/"):
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == "file":
+                while chunk := await part.read_chunk(CHUNK_SIZE):
+                    yield chunk
+                return
+        raise ValueError("No file part")
+    async for chunk in request.content.iter_chunked(CHUNK_SIZE):
+        yield chunk
+
+
+async def _drain(session: Session, channel: EventStreamChannel) -> None:
+    """Wait until the session has transcribed and answered everything it was fed."""
+    deadline = time.monotonic() + DRAIN_TIMEOUT
+    idle_since = None
+    while time.monotonic() < deadline:
+        now = time.monotonic()
+        if session.busy or now - channel.last_sent < SETTLE_SECONDS:
+            idle_since = None
+        elif idle_since is None:
+            idle_since = now
+        elif now - idle_since >= SETTLE_SECONDS:
+            return
+        await asyncio.sleep(0.05)
+
+
+async def stream_upload(request: web.Request) -> web.StreamResponse:
+    """
+    Transcribe and answer a WAV file while it is being uploaded.
+
+    The body (raw ``audio/wav`` or a multipart ``file`` field) is read
+    incrementally and its PCM fed to a session as it arrives, so long
+    recordings are processed during the upload rather than after it; the
+    file is never held in memory or written to disk. Transcriptions, answers
+    and errors are streamed back as Server-Sent Events named after the
+    session's message types, ending with a ``done`` event.
+    """
+    server = request.app[SERVER_KEY]
+    response = web.StreamResponse(
+        headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+    )
+    channel = EventStreamChannel(response)
+    try:
+        session = await server.open_session(channel)
+    except SessionLimitError as e:
+        return web.json_response({"error": str(e)}, status=503)
+
+    parser = WavStreamParser()
+    error = None
+    try:
+        await channel.prepare(request)
+        try:
+            async for chunk in _body_chunks(request):
+                samples = parser.feed(chunk)
+                if not len(samples):
+                    continue
+                while session.queued_seconds > MAX_QUEUED_SECONDS:
+                    await asyncio.sleep(0.02)
+                session.feed_samples(samples, parser.sample_rate)
+                if parser.done:
+                    break
+        except ValueError as e:
+            error = str(e)
+            await channel.send_message({"type": "error", "text": error})
+        if error is None and parser.sample_rate is None:
+            error = "No audio in the upload"
+            await channel.send_message({"type": "error", "text": error})
+        if error is None:
+            session.feed_samples(
+                np.zeros(int(TRAILING_SILENCE * parser.sample_rate), dtype=np.int16),
+                parser.sample_rate,
+            )
+            await _drain(session, channel)
+        await channel.send_message(
+            {"type": "done", "seconds": round(parser.seconds, 3), "error": error}
+        )
+    except ConnectionResetError:
+        print(f"Session {session.session_id}: upload client went away")
+    finally:
+        await server.close_session(session, forget=True)
+    return response
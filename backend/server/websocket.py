@@ -0,0 +1,92 @@
+import json
+from typing import Any
+
+from aiohttp import WSCloseCode, WSMsgType, web
+
+from audio_codecs import negotiate
+from framing import is_frame, parse_frame
+from sessions import Session, SessionLimitError
+
+from .app import SERVER_KEY
+
+
+class WebSocketChannel:
+    """What a :class:`Session` sends through: JSON text messages."""
+
+    def __init__(self, ws: web.WebSocketResponse):
+        self.ws = ws
+
+    async def send(self, text: str) -> None:
+        await self.ws.send_str(text)
+
+
+def feed_binary(session: Session, message: bytes) -> None:
+    """Feed a binary audio message: a frame (see framing.py) or the legacy format."""
+    if is_frame(message):
+        session.feed_frame(parse_frame(message))
+        return
+    # Legacy clients: 4-byte metadata length, JSON metadata, PCM.
+    metadata_length = int.from_bytes(message[:4], byteorder="little")
+    metadata = json.loads(message[4 : 4 + metadata_length].decode("utf-8"))
+    session.feed_audio(memoryview(message)[4 + metadata_length :], metadata["sampleRate"])
+
+
+def is_hangup(text: str) -> bool:
+    """Whether a text message is the client's explicit ``hangup``."""
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return False
+    return isinstance(message, dict) and message.get("type") == "hangup"
+
+
+async def websocket_handler(request: web.Request) -> Any:
+    """
+    Raw WebSocket adapter, protocol of the former stt_2.py.
+
+    Query string: ``?token=...`` to resume a session, ``?codecs=opus,pcm16``
+    to negotiate the audio codec, ``?partials=delta`` to receive realtime
+    transcripts as ``realtime_delta`` messages (see transcript_diff.py).
+    Audio arrives as binary messages; the server answers with JSON text
+    messages. A ``{"type": "hangup"}`` text message, or a close with code
+    1000, ends the call and deletes its stored session.
+    """
+    ws = web.WebSocketResponse(max_msg_size=0, heartbeat=30)
+    if not ws.can_prepare(request).ok:
+        return web.json_response({"status": "ok", "websocket": "/ws", "socketio": "/socket.io/"})
+    await ws.prepare(request)
+
+    server = request.app[SERVER_KEY]
+    token = request.query.get("token")
+    codecs = request.query["codecs"].split(",") if "codecs" in request.query else None
+    deltas = request.query.get("partials") == "delta"
+    try:
+        session = await server.open_session(
+            WebSocketChannel(ws), token, negotiate(codecs), partial_deltas=deltas
+        )
+    except SessionLimitError as e:
+        print(f"Rejecting client: {e}")
+        await ws.close(code=WSCloseCode.TRY_AGAIN_LATER, message=b"Server busy, retry later")
+        return ws
+
+    hung_up = False
+    try:
+        async for message in ws:
+            if message.type == WSMsgType.BINARY:
+                try:
+                    feed_binary(session, message.data)
+                except Exception as e:
+                    print(f"Error processing message: {e}")
+            elif message.type == WSMsgType.TEXT and is_hangup(message.data):
+                hung_up = True
+                await ws.close()
+            elif message.type == WSMsgType.ERROR:
+                print(f"Client connection error: {ws.exception()}")
+    finally:
+        # Only a normal close or a hang-up message ends the call. Anything else,
+        # including 1001 when the page is reloaded or the app backgrounded, is
+        # a dropped connection that may come back with its token; its stored
+        # session expires with the store's TTL otherwise.
+        hung_up = hung_up or ws.close_code == WSCloseCode.OK
+        await server.close_session(session, forget=hung_up)
+    return ws
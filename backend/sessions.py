@@ -0,0 +1,986 @@
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from audio_codecs import TARGET_RATE, StreamDecoder
+from audio_pool import AudioProcessPool, PooledResampler
+from audio_queue import AudioQueue, DropPolicy, Flow, QueueStats, recorder_backlog
+from framing import AudioFrame, Codec
+from llm import FunctionRouter, LLMAssistant, LLMRequestQueue
+from redis_store import HistoryStore, SessionRecord
+from speculative import SpeculativeDispatcher
+from tracing import Trace, Tracer, tracer as default_tracer
+from transcript_diff import PartialStats, PartialTranscript
+from transcription import TranscriptionEngine
+from vad_gate import GateStats, VadGate
+
+
+# Audio queued between the socket and the recorder before the drop policy
+# applies (see audio_queue.py).
+MAX_BUFFERED_SECONDS = 10
+# While behind, pauses are shortened to this; longer than the VAD's
+# post-speech silence so utterances still split.
+KEEP_SILENCE_SECONDS = 1.0
+# Audio handed to the recorder per feed, and the recorder backlog (in its own
+# ~32 ms chunks) beyond which the feeder waits instead of piling on.
+FEED_SECONDS = 0.5
+MAX_RECORDER_BACKLOG = 16
+# Chunk length suggested to clients while the server is behind, and otherwise.
+SLOW_CHUNK_MS = 100
+NORMAL_CHUNK_MS = 20
+# Memory one leased recorder holds with the server's recorder config: its
+# transcription process (torch and a Whisper model) plus Silero VAD and the
+# realtime model in this process. RealtimeSTT cannot share loaded weights
+# between recorders, so memory, not CPU, bounds the sessions of a host.
+RECORDER_FOOTPRINT_MB = 700
+# Share of the host's memory the recorders may take.
+RECORDER_MEMORY_SHARE = 0.5
+
+
+def default_max_sessions() -> int:
+    """Recorders that fit in ``RECORDER_MEMORY_SHARE`` of this host's memory, at least 1."""
+    try:
+        total_mb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 2**20
+    except (AttributeError, ValueError, OSError):
+        return 4
+    return max(1, int(total_mb * RECORDER_MEMORY_SHARE / RECORDER_FOOTPRINT_MB))
+
+
+class SessionLimitError(RuntimeError):
+    """Raised when no recorder becomes available for a new session in time."""
+
+
+class PooledRecorder:
+    """An AudioToTextRecorder leased to at most one session at a time.
+
+    RealtimeSTT callbacks are bound at construction, so they are routed through
+    this wrapper to whichever session currently owns the recorder.
+    """
+
+    def __init__(self, recorder_config: dict[str, Any]):
+        from RealtimeSTT import AudioToTextRecorder
+
+        self.owner: Optional["Session"] = None
+        config = dict(recorder_config)
+        config["on_realtime_transcription_stabilized"] = self._on_realtime_text
+        config["on_recording_start"] = self._on_recording_start
+        config["on_recording_stop"] = self._on_recording_stop
+        self.recorder = AudioToTextRecorder(**config)
+
+    def _on_realtime_text(self, text: str) -> None:
+        owner = self.owner
+        if owner is not None:
+            owner.partials.update(text, owner.trace_fields())
+            if owner.speculator is not None:
+                owner.loop.call_soon_threadsafe(owner.on_partial, text)
+
+    def _on_recording_start(self) -> None:
+        owner = self.owner
+        if owner is not None:
+            owner.loop.call_soon_threadsafe(owner.cancel_response)
+
+    def _on_recording_stop(self) -> None:
+        owner = self.owner
+        if owner is not None:
+            owner.close_utterance()
+
+    def next_utterance(self) -> Optional[np.ndarray]:
+        """
+        Wait for the recorder's VAD to close an utterance and return its audio,
+        without running the recorder's own transcription model.
+
+        Mirrors ``AudioToTextRecorder.text()`` up to the point where it would
+        transcribe.
+
+        Returns:
+            Float32 samples at 16 kHz, or None if the recorder was aborted
+        """
+        recorder = self.recorder
+        recorder.interrupt_stop_event.clear()
+        recorder.was_interrupted.clear()
+        recorder.wait_audio()
+        if recorder.is_shut_down or recorder.interrupt_stop_event.is_set():
+            if recorder.interrupt_stop_event.is_set():
+                recorder.was_interrupted.set()
+            return None
+        return np.array(recorder.audio, dtype=np.float32)
+
+
+class RecorderPool:
+    """Bounded pool of recorders reused across sessions.
+
+    Loading Whisper and Silero weights is by far the most expensive part of a
+    session, so recorders are created lazily up to ``size`` and handed back to
+    the pool when their session ends instead of being torn down.
+    """
+
+    def __init__(self, recorder_config: dict[str, Any], size: int):
+        if size < 1:
+            raise ValueError("Recorder pool size must be at least 1")
+        self.recorder_config = recorder_config
+        self.size = size
+        self._idle: queue.LifoQueue[PooledRecorder] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @property
+    def in_use(self) -> int:
+        return self._created - self._idle.qsize()
+
+    def prewarm(self, count: int = 1) -> None:
+        """Load up to ``count`` recorders ahead of the first connection."""
+        for _ in range(min(count, self.size)):
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(PooledRecorder(self.recorder_config))
+
+    def acquire(self) -> PooledRecorder:
+        """Take an idle recorder, creating one if the pool is not yet full.
+
+        Raises:
+            SessionLimitError: If every recorder is already leased
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._created >= self.size:
+                raise SessionLimitError(f"All {self.size} recorders are busy")
+            self._created += 1
+        try:
+            return PooledRecorder(self.recorder_config)
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, pooled: PooledRecorder) -> None:
+        """Detach the recorder from its session and make it available again."""
+        pooled.owner = None
+        try:
+            pooled.recorder.clear_audio_queue()
+        except Exception as e:
+            print(f"Error resetting recorder: {e}")
+        self._idle.put(pooled)
+
+    def shutdown(self) -> None:
+        while True:
+            try:
+                pooled = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            pooled.recorder.shutdown()
+
+
+class ClientSession:
+    """The client-facing half of a session, shared with server.gateway.RemoteSession.
+
+    Sends messages to the socket from one task per batch, in the order they
+    are posted from any thread, and takes the client's audio frames apart
+    for ``feed_samples``.
+    """
+
+    def __init__(
+        self,
+        session_id: int,
+        websocket: Any,
+        loop: asyncio.AbstractEventLoop,
+        codec: Codec = Codec.PCM16,
+    ):
+        self.session_id = session_id
+        self.websocket = websocket
+        self.loop = loop
+        # Codec negotiated with the client; frames say which one they use.
+        self.codec = codec
+        self.decoder = StreamDecoder()
+        # Latest message of each coalesced type waiting to be sent.
+        self._pending: dict[str, dict[str, Any]] = {}
+        # Messages posted from any thread, sent in order by one task per batch.
+        self._outbox: deque[dict[str, Any]] = deque()
+        self._outbox_lock = threading.Lock()
+        self._flushing = False
+        self.sample_rate: Optional[int] = None
+        self.last_seq: Optional[int] = None
+        self.lost_frames = 0
+        self.late_frames = 0
+        self.active = True
+
+    async def send(self, message: dict[str, Any]) -> None:
+        """
+        Send ``message`` to the client. Sockets that map messages to their
+        own events (see server/sio.py) provide ``send_message``; others are
+        sent the message as JSON text.
+        """
+        try:
+            send_message = getattr(self.websocket, "send_message", None)
+            if send_message is not None:
+                await send_message(message)
+            else:
+                await self.websocket.send(json.dumps(message))
+        except Exception as e:
+            # The connection is gone; the socket handler will close the session.
+            print(f"Session {self.session_id}: send failed: {e}")
+
+    def send_threadsafe(self, message: dict[str, Any]) -> None:
+        """Schedule a send on the event loop from a recorder thread."""
+        self.post(message)
+
+    def post(self, message: dict[str, Any]) -> None:
+        """
+        Queue ``message`` for the client, from any thread. Messages are sent
+        in the order posted; those posted while a batch is being sent go out
+        together in the next one, from a single task instead of one each.
+        """
+        if not self.active:
+            return
+        with self._outbox_lock:
+            self._outbox.append(message)
+            if self._flushing:
+                return
+            self._flushing = True
+        self.loop.call_soon_threadsafe(self._start_flush)
+
+    def _start_flush(self) -> None:
+        self.loop.create_task(self._flush_outbox())
+
+    async def _flush_outbox(self) -> None:
+        while True:
+            with self._outbox_lock:
+                if not self._outbox:
+                    self._flushing = False
+                    return
+                batch = list(self._outbox)
+                self._outbox.clear()
+            for message in batch:
+                await self.send(message)
+
+    def send_latest(self, message: dict[str, Any]) -> None:
+        """
+        Like :meth:`send_threadsafe`, but a message not yet sent is replaced
+        by a newer one of the same type, so a slow client never has more than
+        one pending per type.
+        """
+        if not self.active:
+            return
+        kind = message["type"]
+        # Shared with the loop's _send_pending: the check and the pop must not interleave.
+        with self._outbox_lock:
+            first = kind not in self._pending
+            self._pending[kind] = message
+        if first:
+            self.loop.call_soon_threadsafe(self._send_pending, kind)
+
+    def _send_pending(self, kind: str) -> None:
+        with self._outbox_lock:
+            message = self._pending.pop(kind, None)
+        if message is not None:
+            self.post(message)
+
+    def feed_frame(self, frame: AudioFrame) -> None:
+        """Queue the audio of a parsed frame, dropping duplicates and late frames.
+
+        Raises:
+            FrameError: If the frame's codec cannot be decoded
+        """
+        lost = 0
+        if self.last_seq is not None:
+            if frame.seq <= self.last_seq:
+                self.late_frames += 1
+                return
+            lost = frame.seq - self.last_seq - 1
+            self.lost_frames += lost
+        self.last_seq = frame.seq
+        if frame.codec == Codec.PCM16:
+            self.feed_samples(frame.samples(), frame.sample_rate)
+        else:
+            # Compressed packets are decoded here, straight to 16 kHz; it is
+            # cheap, and the decoder state must follow the packet order.
+            self.feed_samples(self.decoder.decode(frame, lost), TARGET_RATE)
+
+    def feed_audio(self, chunk: bytes, sample_rate: int) -> None:
+        """Queue a mono int16 PCM chunk received without framing."""
+        self.feed_samples(np.frombuffer(chunk, dtype="<i2"), sample_rate)
+
+    def feed_samples(self, samples: np.ndarray, sample_rate: int) -> None:
+        """Take mono int16 samples at ``sample_rate``; defined by each kind of session."""
+        raise NotImplementedError
+
+
+class Session(ClientSession):
+    """State owned by a single WebSocket connection.
+
+    Each session has its own recorder (and therefore its own VAD and
+    transcription state), its own LLM conversation history and sends only to
+    its own socket.
+
+    A :class:`VadGate` drops silence from the raw audio before it is
+    resampled or reaches the recorder; ``gate_stats`` shows how much.
+
+    With a resampling pool, the feeder hands the audio to a worker process
+    (see audio_pool.py) instead of resampling it under the GIL.
+
+    Realtime transcripts are coalesced to one message per short window and,
+    with ``partial_deltas``, sent as changes to the previous one (see
+    transcript_diff.py). Messages from the recorder threads are sent in
+    batches by one task on the event loop, in order.
+
+    Audio goes through a bounded :class:`AudioQueue`: when transcription
+    falls behind, silence is dropped before speech and the client is asked
+    to send larger chunks less often until the queue drains.
+
+    The recorder thread only transcribes; answers are produced by a task on
+    the event loop, so the next utterance is transcribed while the previous
+    one is being answered. When the caller starts speaking again the pending
+    answer is cancelled and its sentence is prepended to the next one.
+
+    With a speculator, stabilized partial transcripts that clearly point to
+    one protocol are answered ahead of time, and the answer is used if the
+    final sentence confirms it.
+
+    Every utterance is traced from its first audio frame to the response
+    (see tracing.py); the trace ID is included in the messages about it.
+
+    With a store, every answered exchange and the pending sentence are
+    persisted under the session token, so a client that reconnects with the
+    token picks up the conversation where it dropped.
+    """
+
+    def __init__(
+        self,
+        session_id: int,
+        websocket: Any,
+        loop: asyncio.AbstractEventLoop,
+        pooled: PooledRecorder,
+        llm: LLMAssistant,
+        llm_queue: LLMRequestQueue,
+        record: Optional[SessionRecord] = None,
+        store: Optional[HistoryStore] = None,
+        codec: Codec = Codec.PCM16,
+        engine: Optional[TranscriptionEngine] = None,
+        speculator: Optional[SpeculativeDispatcher] = None,
+        tracer: Optional[Tracer] = None,
+        drop_policy: DropPolicy = DropPolicy.DROP_SILENCE,
+        queue_stats: Optional[QueueStats] = None,
+        vad_gate: bool = True,
+        resample_pool: Optional[AudioProcessPool] = None,
+        partial_deltas: bool = False,
+    ):
+        super().__init__(session_id, websocket, loop, codec)
+        self.pooled = pooled
+        self.llm = llm
+        self.llm_queue = llm_queue
+        self.record = record
+        self.store = store
+        self.engine = engine
+        self.speculator = speculator
+        self.tracer = tracer or default_tracer
+        # Trace of the utterance being captured, then of the one being
+        # transcribed once the VAD has closed it.
+        self._trace: Optional[Trace] = None
+        self._closed_trace: Optional[Trace] = None
+        self._trace_lock = threading.Lock()
+        self.resample_pool = resample_pool
+        self._pooled_resampler: Optional[PooledResampler] = None
+        self.drop_policy = drop_policy
+        self.queue_stats = queue_stats or QueueStats()
+        self.audio = self._make_queue(TARGET_RATE)
+        self.use_gate = vad_gate
+        self.gate: Optional[VadGate] = None
+        self.gate_stats = GateStats()
+        self.partial_stats = PartialStats()
+        self.partials = PartialTranscript(
+            loop, self.post, incremental=partial_deltas, stats=self.partial_stats
+        )
+        self._response: Optional[asyncio.Task] = None
+        # Sentence whose answer was cancelled, carried over to the next one.
+        self._interrupted = record.state.get("interrupted", "") if record else ""
+        self._thread = threading.Thread(
+            target=self._run, name=f"session-{session_id}", daemon=True
+        )
+        self._feeder = threading.Thread(
+            target=self._feed, name=f"session-{session_id}-feed", daemon=True
+        )
+
+    @property
+    def recorder(self):
+        return self.pooled.recorder
+
+    @property
+    def token(self) -> Optional[str]:
+        return self.record.token if self.record is not None else None
+
+    @property
+    def busy(self) -> bool:
+        """Audio still queued, recorded or transcribed, or an answer in progress."""
+        return bool(
+            len(self.audio)
+            or recorder_backlog(self.recorder)
+            or getattr(self.recorder, "is_recording", False)
+            or self._closed_trace is not None
+            or (self._response is not None and not self._response.done())
+        )
+
+    @property
+    def queued_seconds(self) -> float:
+        """Audio waiting for the recorder."""
+        return self.audio.depth
+
+    def start(self) -> None:
+        self.pooled.owner = self
+        self._thread.start()
+        self._feeder.start()
+
+    def _make_queue(self, sample_rate: int) -> AudioQueue:
+        return AudioQueue(
+            MAX_BUFFERED_SECONDS * sample_rate,
+            sample_rate=sample_rate,
+            policy=self.drop_policy,
+            keep_silence=int(KEEP_SILENCE_SECONDS * sample_rate),
+            stats=self.queue_stats,
+        )
+
+    def _signal_flow(self, flow: Flow) -> None:
+        """Ask the client to send less often while the queue is backed up."""
+        self.send_latest(
+            {
+                "type": "flow",
+                "action": flow.value,
+                "chunk_ms": SLOW_CHUNK_MS if flow == Flow.SLOW_DOWN else NORMAL_CHUNK_MS,
+                "queued_ms": int(1000 * self.audio.depth),
+            }
+        )
+
+    def feed_samples(self, samples: np.ndarray, sample_rate: int) -> None:
+        """Copy samples into the audio queue; the feeder thread takes it from there."""
+        if not self.active:
+            return
+        if sample_rate != self.sample_rate:
+            # Audio queued at the old rate cannot be resampled at the new one.
+            previous, self.audio = self.audio, self._make_queue(sample_rate)
+            previous.close()
+            self.sample_rate = sample_rate
+            if self.use_gate:
+                self.gate = VadGate(sample_rate, stats=self.gate_stats)
+        if self.gate is not None:
+            samples = self.gate.process(samples)
+            if not len(samples):
+                return
+        if self._trace is None:
+            with self._trace_lock:
+                if self._trace is None:
+                    self._trace = self.tracer.start()
+        flow = self.audio.put(samples)
+        if flow is not None:
+            self._signal_flow(flow)
+
+    def trace_fields(self) -> dict[str, str]:
+        """Message fields identifying the utterance being captured."""
+        trace = self._trace
+        return {"trace_id": trace.trace_id} if trace is not None else {}
+
+    def close_utterance(self) -> None:
+        """Mark the VAD end; audio fed from now on starts the next trace."""
+        with self._trace_lock:
+            if self._closed_trace is not None:
+                return
+            self._closed_trace = self._trace or self.tracer.start()
+            self._trace = None
+        self._closed_trace.mark("vad_end")
+
+    def _take_trace(self) -> Trace:
+        self.close_utterance()
+        with self._trace_lock:
+            trace, self._closed_trace = self._closed_trace, None
+        return trace
+
+    def _feed(self) -> None:
+        """Resample queued audio to 16 kHz and feed it to the recorder."""
+        while self.active:
+            # Backpressure: leave audio in the bounded queue, where the drop
+            # policy applies, rather than in the recorder's unbounded one.
+            if recorder_backlog(self.recorder) > MAX_RECORDER_BACKLOG:
+                time.sleep(0.02)
+                continue
+            audio = self.audio
+            samples, flow = audio.get(
+                timeout=0.5, max_samples=int(FEED_SECONDS * audio.sample_rate)
+            )
+            if flow is not None:
+                self._signal_flow(flow)
+            if samples is None:
+                continue
+            try:
+                self.recorder.feed_audio(self._resample(samples, audio.sample_rate).tobytes())
+                trace = self._trace
+                if trace is not None:
+                    trace.mark("resampled")
+            except Exception as e:
+                print(f"Error feeding audio in session {self.session_id}: {e}")
+
+    def _resample(self, samples: np.ndarray, sample_rate: int) -> np.ndarray:
+        if self.resample_pool is None or sample_rate == TARGET_RATE:
+            return self.decoder.resample(samples, sample_rate)
+        try:
+            if self._pooled_resampler is None or self._pooled_resampler.src_rate != sample_rate:
+                if self._pooled_resampler is not None:
+                    self._pooled_resampler.close()
+                self._pooled_resampler = self.resample_pool.open(sample_rate)
+            return self._pooled_resampler.process(samples)
+        except Exception as e:
+            # Lose the pool rather than the audio: resample here from now on.
+            print(f"Session {self.session_id}: resampling pool failed, resampling locally: {e}")
+            self.resample_pool = None
+            return self.decoder.resample(samples, sample_rate)
+
+    def _run(self) -> None:
+        """Transcribe full sentences and answer them until the session closes."""
+        while self.active:
+            try:
+                full_sentence = self._next_sentence()
+                if not self.active:
+                    break
+                trace = self._take_trace()
+                if full_sentence:
+                    trace.mark("transcribed")
+                    print(f"\rSession {self.session_id} sentence: {full_sentence}")
+                    # Drops a partial not sent yet, which would follow the sentence.
+                    self.partials.reset()
+                    self.send_threadsafe(
+                        {"type": "fullSentence", "text": full_sentence, "trace_id": trace.trace_id}
+                    )
+                    self.loop.call_soon_threadsafe(self.respond, full_sentence, trace)
+                else:
+                    trace.finish("empty")
+                    self.loop.call_soon_threadsafe(self._resume_interrupted)
+            except Exception as e:
+                print(f"Error in session {self.session_id} recorder thread: {e}")
+
+    def _next_sentence(self) -> str:
+        if self.engine is None:
+            return self.recorder.text()
+        audio = self.pooled.next_utterance()
+        if audio is None or not len(audio):
+            return ""
+        self.close_utterance()
+        # Blocks this session's thread only; the engine batches utterances
+        # from all sessions behind the scenes.
+        return self.engine.transcribe(audio, self.session_id).result()
+
+    def respond(self, sentence: str, trace: Optional[Trace] = None) -> None:
+        """Start answering ``sentence``, superseding any answer in progress."""
+        # The speculation, if any, is left for _answer to claim or discard.
+        self._cancel_answer()
+        trace = trace or self.tracer.start()
+        if self.active:
+            self._response = self.loop.create_task(self._answer(sentence, trace))
+        else:
+            trace.finish("closed")
+
+    def _resume_interrupted(self) -> None:
+        """
+        Answer the sentence whose answer was cancelled when the recording
+        that interrupted it held no words (noise, breathing, CPR sounds),
+        rather than waiting for a next sentence that may not come.
+        """
+        if self.active and self._interrupted and (
+            self._response is None or self._response.done()
+        ):
+            self.respond("")
+
+    def cancel_response(self) -> None:
+        """Abort the answer in progress and any speculation, e.g. because the caller spoke again."""
+        self._cancel_answer()
+        if self.speculator is not None:
+            self.speculator.cancel()
+
+    def _cancel_answer(self) -> None:
+        if self._response is not None and not self._response.done():
+            self._response.cancel()
+
+    def on_partial(self, text: str) -> None:
+        """Let the speculator act on a stabilized partial transcript."""
+        if self.active and self.speculator is not None and not self._interrupted:
+            self.speculator.update(text)
+
+    async def _answer(self, sentence: str, trace: Trace) -> None:
+        prompt = f"{self._interrupted} {sentence}".strip()
+        self._interrupted = ""
+        trace_id = trace.trace_id
+
+        async def on_delta(delta: str) -> None:
+            trace.mark("first_token")
+            await self.send({"type": "response_delta", "text": delta, "trace_id": trace_id})
+
+        async def request() -> Any:
+            trace.mark("llm_sent")
+            return await self.llm.chat_async(prompt, on_delta=on_delta)
+
+        try:
+            response = await self._speculated(prompt)
+            if response is None:
+                response = await self.llm_queue.run(request())
+        except asyncio.CancelledError:
+            trace.finish("cancelled")
+            self._interrupted = prompt
+            await self.send({"type": "response_cancelled", "trace_id": trace_id})
+            await self._persist(state={"interrupted": prompt})
+            raise
+        except Exception as e:
+            trace.finish("error")
+            print(f"Session {self.session_id}: LLM request failed: {e}")
+            await self.send({"type": "error", "text": str(e), "trace_id": trace_id})
+            return
+
+        trace.mark("parsed")
+        text = response.model_dump_json() if isinstance(response, BaseModel) else str(response)
+        if isinstance(response, BaseModel):
+            response = response.model_dump()
+        await self.send({"type": "response", "text": response, "trace_id": trace_id})
+        trace.mark("sent")
+        trace.finish()
+        await self._persist(
+            messages=[{"role": "user", "content": prompt}, {"role": "assistant", "content": text}],
+            state={},
+        )
+
+    async def _speculated(self, prompt: str) -> Optional[Any]:
+        """The answer speculated from the partials of ``prompt``, if it holds."""
+        if self.speculator is None:
+            return None
+        response = await self.speculator.resolve(prompt)
+        if response is not None:
+            # The speculation ran on a fork; record the turn in the real history.
+            text = response.model_dump_json() if isinstance(response, BaseModel) else str(response)
+            self.llm.history.append("user", prompt)
+            self.llm.history.append("assistant", text)
+        return response
+
+    async def _persist(
+        self,
+        messages: Optional[list[dict[str, str]]] = None,
+        state: Optional[dict[str, Any]] = None,
+    ) -> None:
+        if self.store is None or self.token is None:
+            return
+        try:
+            if messages:
+                await self.store.save_messages(self.token, messages)
+            if state is not None and state != self.record.state:
+                await self.store.save_state(self.token, state)
+                self.record.state = state
+        except Exception as e:
+            # Persistence only matters for resuming; never fail the answer over it.
+            print(f"Session {self.session_id}: could not persist state: {e}")
+
+    def stop(self) -> None:
+        """Stop the recorder thread; blocks until it has exited."""
+        self.active = False
+        # cancel_response also drops any speculation in flight.
+        self.loop.call_soon_threadsafe(self.cancel_response)
+        self.audio.close()
+        self._feeder.join(timeout=5)
+        if self._pooled_resampler is not None:
+            self._pooled_resampler.close()
+        try:
+            self.recorder.abort()
+        except Exception as e:
+            print(f"Error aborting recorder for session {self.session_id}: {e}")
+        self._thread.join(timeout=5)
+
+
+class SessionManager:
+    """Create and tear down one :class:`Session` per connected client."""
+
+    def __init__(
+        self,
+        recorder_config: dict[str, Any],
+        *,
+        max_sessions: Optional[int] = None,
+        acquire_timeout: float = 10.0,
+        llm_factory: Optional[Callable[[], LLMAssistant]] = None,
+        llm_queue: Optional[LLMRequestQueue] = None,
+        store: Optional[HistoryStore] = None,
+        engine: Optional[TranscriptionEngine] = None,
+        speculate: bool = False,
+        tracer: Optional[Tracer] = None,
+        drop_policy: DropPolicy = DropPolicy.DROP_SILENCE,
+        vad_gate: bool = True,
+        resample_pool: Optional[AudioProcessPool] = None,
+    ):
+        """
+        Initialize the session manager.
+
+        Args:
+            recorder_config: Keyword arguments for AudioToTextRecorder
+            max_sessions: Maximum number of recorders alive at once; defaults
+                to what the host's memory holds (see :func:`default_max_sessions`)
+            acquire_timeout: Seconds a new connection waits for a free recorder
+            llm_factory: Builds the per-session assistant. If None, every session
+                gets an LLMAssistant sharing one client and system prompt
+            llm_queue: Limits LLM requests across all sessions. If None, uses
+                a default :class:`LLMRequestQueue`
+            store: Persists sessions so they can be resumed by token. If None,
+                sessions end with their connection
+            engine: Shared model transcribing every session's utterances in
+                batches. If None, each recorder transcribes with its own model
+            speculate: Start answering from stabilized partial transcripts
+                before the sentence is final (see :class:`SpeculativeDispatcher`)
+            tracer: Collects per-utterance latency traces. If None, uses the
+                process-wide tracer of tracing.py
+            drop_policy: What each session's audio queue drops when
+                transcription falls behind
+            vad_gate: Drop silence before it reaches the recorders
+            resample_pool: Worker processes resampling the sessions' audio.
+                If None, each session resamples in its feeder thread
+        """
+        max_sessions = max_sessions or default_max_sessions()
+        self.pool = RecorderPool(recorder_config, max_sessions)
+        self.acquire_timeout = acquire_timeout
+        # Admission control: callers beyond the pool size queue here rather
+        # than tying up executor threads while they wait for a recorder.
+        self._slots = asyncio.Semaphore(max_sessions)
+        self.llm_factory = llm_factory or self.shared_llm_factory()
+        self.llm_queue = llm_queue or LLMRequestQueue()
+        self.store = store
+        self.engine = engine
+        self.speculate = speculate
+        self.tracer = tracer or default_tracer
+        self.drop_policy = drop_policy
+        self.queue_stats = QueueStats()
+        self.vad_gate = vad_gate
+        self.resample_pool = resample_pool
+        # Gate and partial stats of closed sessions; live ones are added at each scrape.
+        self.gate_stats = GateStats()
+        self.partial_stats = PartialStats()
+        self._register_metrics()
+        self.sessions: dict[int, Session] = {}
+        self._next_id = 0
+
+    @staticmethod
+    def shared_llm_factory(
+        client: Any = None, *, local_routing: bool = True
+    ) -> Callable[[], LLMAssistant]:
+        """
+        Build assistants sharing one client, system prompt, guide index,
+        response cache, intent classifier and function router.
+
+        Args:
+            client: Mistral client, or a stand-in such as loadtest.FakeMistral.
+                If None, one is created from the environment
+            local_routing: Answer unambiguous emergencies with the local
+                :class:`FunctionRouter` instead of the model
+        """
+        template = LLMAssistant(client=client)
+        if local_routing:
+            template.router = FunctionRouter(
+                template.config.functions_path, classifier=template.intent_classifier
+            )
+
+        def factory() -> LLMAssistant:
+            return LLMAssistant(
+                config=template.config,
+                client=template.client,
+                system_prompt=template.system_prompt,
+                retrieval_top_k=template.retrieval_top_k,
+                guide_index=template.guide_index,
+                response_cache=template.response_cache,
+                intent_classifier=template.intent_classifier,
+                router=template.router,
+            )
+
+        return factory
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def _register_metrics(self) -> None:
+        def depth() -> dict[str, float]:
+            depths = [s.audio.depth for s in list(self.sessions.values())]
+            return {'stat="max"': max(depths, default=0.0), 'stat="total"': sum(depths)}
+
+        def dropped() -> dict[str, float]:
+            stats = self.queue_stats
+            return {
+                'kind="coalesced_silence"': stats.coalesced,
+                'kind="silence"': stats.dropped_silence,
+                'kind="speech"': stats.dropped_speech,
+            }
+
+        self.tracer.register(
+            "audio_queue_depth_seconds", "gauge", "Audio waiting for the recorders.", depth
+        )
+        self.tracer.register(
+            "audio_queue_paused_sessions",
+            "gauge",
+            "Sessions asked to slow down.",
+            lambda: {"": sum(s.audio.paused for s in list(self.sessions.values()))},
+        )
+        self.tracer.register(
+            "audio_dropped_seconds_total", "counter", "Audio dropped by the queues.", dropped
+        )
+
+        def gated() -> dict[str, float]:
+            total = GateStats()
+            total.merge(self.gate_stats)
+            for session in list(self.sessions.values()):
+                total.merge(session.gate_stats)
+            return {
+                'result="passed"': total.seconds_passed,
+                'result="skipped"': total.seconds_in - total.seconds_passed,
+            }
+
+        self.tracer.register(
+            "audio_gate_seconds_total",
+            "counter",
+            "Audio seen by the VAD gates, by whether it reached a recorder.",
+            gated,
+        )
+
+        def partials() -> PartialStats:
+            total = PartialStats()
+            total.merge(self.partial_stats)
+            for session in list(self.sessions.values()):
+                total.merge(session.partial_stats)
+            return total
+
+        self.tracer.register(
+            "realtime_messages_total",
+            "counter",
+            "Realtime transcript updates from the recorders, and messages sent for them.",
+            lambda: {'kind="updates"': partials().updates, 'kind="sent"': partials().messages},
+        )
+        self.tracer.register(
+            "realtime_chars_total",
+            "counter",
+            "Realtime transcript characters, sent in full per update or as sent.",
+            lambda: {'kind="full"': partials().chars_full, 'kind="sent"': partials().chars_sent},
+        )
+
+    async def open(
+        self,
+        websocket: Any,
+        token: Optional[str] = None,
+        codec: Codec = Codec.PCM16,
+        *,
+        partial_deltas: bool = False,
+    ) -> Session:
+        """Lease a recorder for ``websocket`` and start its session.
+
+        If ``token`` names a stored session, its conversation and pending
+        sentence are restored; otherwise a new token is issued. The client is
+        told its token, the negotiated ``codec`` and how realtime transcripts
+        are sent (``partials``: ``delta`` if ``partial_deltas``, see
+        transcript_diff.py, else ``full``) in a ``session`` message.
+
+        Raises:
+            SessionLimitError: If the server is saturated
+        """
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            raise SessionLimitError(
+                f"All {self.pool.size} recorders busy after waiting {self.acquire_timeout}s"
+            )
+
+        loop = asyncio.get_running_loop()
+        try:
+            pooled = await loop.run_in_executor(None, self.pool.acquire)
+        except Exception:
+            self._slots.release()
+            raise
+        try:
+            llm = self.llm_factory()
+        except Exception:
+            self.pool.release(pooled)
+            self._slots.release()
+            raise
+        record = None
+        if self.store is not None:
+            try:
+                record = await self.store.open_session(token)
+                if record.resumed:
+                    for message in await self.store.load_history(record.token):
+                        llm.history.append(message["role"], message["content"])
+            except Exception as e:
+                # Without the store the call still works, it just cannot resume.
+                print(f"Session store unavailable: {e}")
+                record = None
+
+        self._next_id += 1
+        session = Session(
+            self._next_id,
+            websocket,
+            loop,
+            pooled,
+            llm,
+            self.llm_queue,
+            record=record,
+            store=self.store,
+            codec=codec,
+            engine=self.engine,
+            speculator=SpeculativeDispatcher(llm, self.llm_queue) if self.speculate else None,
+            tracer=self.tracer,
+            drop_policy=self.drop_policy,
+            queue_stats=self.queue_stats,
+            vad_gate=self.vad_gate,
+            resample_pool=self.resample_pool,
+            partial_deltas=partial_deltas,
+        )
+        self.sessions[session.session_id] = session
+        session.start()
+        hello = {
+            "type": "session",
+            "codec": codec.name.lower(),
+            "partials": "delta" if partial_deltas else "full",
+        }
+        if record is not None:
+            hello.update(token=record.token, resumed=record.resumed)
+        await session.send(hello)
+        print(
+            f"Session {session.session_id} {'resumed' if record and record.resumed else 'opened'} "
+            f"({len(self.sessions)} active, {self.pool.in_use}/{self.pool.size} recorders)"
+        )
+        return session
+
+    async def close(self, session: Session, *, forget: bool = False) -> None:
+        """
+        Tear down ``session`` and return its recorder to the pool.
+
+        Args:
+            session: Session to close
+            forget: Also delete its stored data, e.g. when the caller hung up
+                rather than dropped, so it can no longer be resumed
+        """
+        if self.sessions.pop(session.session_id, None) is None:
+            return
+        await asyncio.get_running_loop().run_in_executor(None, session.stop)
+        self.pool.release(session.pooled)
+        self._slots.release()
+        self.gate_stats.merge(session.gate_stats)
+        self.partial_stats.merge(session.partial_stats)
+        if forget and self.store is not None and session.token is not None:
+            try:
+                await self.store.clear_all_data(session.token)
+            except Exception as e:
+                print(f"Error clearing stored data: {e}")
+        gate = session.gate_stats
+        print(
+            f"Session {session.session_id} closed ({len(self.sessions)} active, "
+            f"gate skipped {gate.saved:.0%} of {gate.seconds_in:.0f}s of audio)"
+        )
+
+    async def close_all(self) -> None:
+        for session in list(self.sessions.values()):
+            await self.close(session)
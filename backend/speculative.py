@@ -0,0 +1,159 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from cache import normalize_text
+from intents import IntentClassifier
+from llm import LLMAssistant, LLMRequestQueue
+
+# Partials shorter than this rarely carry enough context to act on.
+MIN_PARTIAL_WORDS = 3
+
+
+@dataclass
+class Speculation:
+    partial: str
+    intent: str
+    task: asyncio.Task
+
+
+@dataclass
+class SpeculationStats:
+    started: int = 0
+    confirmed: int = 0
+    cancelled: int = 0
+    skipped: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "started": self.started,
+            "confirmed": self.confirmed,
+            "cancelled": self.cancelled,
+            "skipped": self.skipped,
+        }
+
+
+class SpeculativeDispatcher:
+    """Start answering from stabilized partial transcripts.
+
+    As realtime partials arrive, the intent classifier pre-selects a protocol.
+    Once one is clearly indicated, the answer to the partial is requested on
+    a fork of the conversation, so the guide excerpts are retrieved and the
+    model is already working while the caller finishes the sentence and the
+    silence timeout runs out.
+
+    When the final sentence lands, the speculation is used if the final text
+    is the partial, or if it points to the same protocol and the model chose
+    that protocol. In the latter case its arguments were read off the
+    partial, so those the final sentence states (e.g. "... il a 3 ans") are
+    read again and must not contradict them. Otherwise the speculation is
+    cancelled and the sentence is answered normally. Speculative requests only run when the request queue has a free
+    slot, so they never delay a confirmed request.
+    """
+
+    def __init__(
+        self,
+        llm: LLMAssistant,
+        llm_queue: LLMRequestQueue,
+        classifier: Optional[IntentClassifier] = None,
+    ):
+        self.llm = llm
+        self.llm_queue = llm_queue
+        self.classifier = classifier or llm.intent_classifier
+        self.current: Optional[Speculation] = None
+        self.stats = SpeculationStats()
+
+    def update(self, partial: str) -> None:
+        """Consider a new stabilized partial; must run on the event loop."""
+        if len(partial.split()) < MIN_PARTIAL_WORDS:
+            return
+        intent = self.classifier.preselect(partial)
+        if intent is None:
+            return
+        if self.current is not None:
+            # Keep one speculation per protocol: later partials of the same
+            # sentence usually only add detail the guide excerpt already covers.
+            if self.current.intent == intent:
+                return
+            self.cancel()
+
+        task = asyncio.get_running_loop().create_task(self._speculate(partial))
+        task.add_done_callback(self._on_done)
+        self.current = Speculation(partial, intent, task)
+        self.stats.started += 1
+
+    async def _speculate(self, partial: str) -> Any:
+        # Speculative requests never wait for a slot: a confirmed request
+        # must not queue behind a guess.
+        fork = self.llm.fork()
+        return await self.llm_queue.run(fork.chat_async(partial), queue_timeout=0)
+
+    def _on_done(self, task: asyncio.Task) -> None:
+        # Retrieve the exception so a failed speculation is not reported as
+        # "never retrieved"; it simply will not be confirmed.
+        if not task.cancelled() and task.exception() is not None:
+            self.stats.skipped += 1
+
+    async def resolve(self, sentence: str) -> Optional[Any]:
+        """
+        Claim the speculative answer for the final ``sentence``.
+
+        Returns:
+            The parsed response if the speculation holds, otherwise None after
+            cancelling it
+        """
+        speculation, self.current = self.current, None
+        if speculation is None:
+            return None
+
+        exact = normalize_text(sentence) == normalize_text(speculation.partial)
+        if not exact and self.classifier.preselect(sentence) != speculation.intent:
+            speculation.task.cancel()
+            self.stats.cancelled += 1
+            return None
+
+        try:
+            result = await asyncio.shield(speculation.task)
+        except asyncio.CancelledError:
+            if not speculation.task.done():
+                # We were cancelled, not the speculation: stop it too.
+                speculation.task.cancel()
+                raise
+            return None
+        except Exception:
+            return None
+
+        if not exact:
+            if getattr(result, "name", None) == speculation.intent:
+                result = self._restate(result, sentence)
+            else:
+                result = None
+            if result is None:
+                self.stats.cancelled += 1
+                return None
+        self.stats.confirmed += 1
+        return result
+
+    def _restate(self, result: Any, sentence: str) -> Optional[Any]:
+        """
+        ``result`` with the arguments stated in the final ``sentence`` added,
+        or None if the sentence contradicts the ones taken from the partial.
+        """
+        try:
+            stated = self.llm.stated_arguments(result.name, sentence)
+            if any(result.arguments.get(k, v) != v for k, v in stated.items()):
+                return None
+            _, arguments = self.llm.schemas.validate(
+                result.name, {**result.arguments, **stated}
+            )
+        except (KeyError, ValueError):
+            return None
+        return result.model_copy(update={"arguments": arguments})
+
+    def cancel(self) -> None:
+        """Drop the current speculation, e.g. when the caller starts a new sentence."""
+        if self.current is not None:
+            if not self.current.task.done():
+                self.current.task.cancel()
+                self.stats.cancelled += 1
+            self.current = None
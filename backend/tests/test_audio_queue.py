@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from audio_queue import AudioQueue, DropPolicy, Flow
+
+CHUNK = 1600
+
+
+def speech(value: int = 3000) -> np.ndarray:
+    return np.full(CHUNK, value, dtype=np.int16)
+
+
+def silence() -> np.ndarray:
+    return np.zeros(CHUNK, dtype=np.int16)
+
+
+def test_capacity_must_be_positive():
+    with pytest.raises(ValueError):
+        AudioQueue(0)
+
+
+def test_put_copies_and_get_returns_in_order():
+    queue = AudioQueue(10 * CHUNK)
+    chunk = speech(1)
+    queue.put(chunk)
+    chunk[:] = 2
+    queue.put(speech(3))
+
+    samples, _ = queue.get(timeout=0)
+    assert len(samples) == 2 * CHUNK
+    assert samples[0] == 1 and samples[-1] == 3
+    assert queue.get(timeout=0) == (None, None)
+
+
+def test_get_takes_at_most_max_samples():
+    queue = AudioQueue(10 * CHUNK)
+    queue.put(speech())
+    queue.put(speech())
+
+    samples, _ = queue.get(timeout=0, max_samples=CHUNK + 10)
+    assert len(samples) == CHUNK + 10
+    assert len(queue) == CHUNK - 10
+
+
+def test_drop_silence_keeps_speech_past_capacity():
+    queue = AudioQueue(3 * CHUNK, policy=DropPolicy.DROP_SILENCE)
+    for chunk in (speech(1000), silence(), speech(2000), silence(), speech(3000)):
+        queue.put(chunk)
+
+    samples, _ = queue.get(timeout=0)
+    assert len(samples) == 3 * CHUNK
+    assert [int(v) for v in samples[::CHUNK]] == [1000, 2000, 3000]
+    assert queue.stats.dropped_silence == pytest.approx(2 * CHUNK / 16000)
+    assert queue.stats.dropped_speech == 0
+
+
+def test_drop_silence_drops_oldest_speech_past_hard_capacity():
+    queue = AudioQueue(2 * CHUNK, hard_capacity=3 * CHUNK, policy=DropPolicy.DROP_SILENCE)
+    for value in range(1000, 6000, 1000):
+        queue.put(speech(value))
+
+    samples, _ = queue.get(timeout=0)
+    assert [int(v) for v in samples[::CHUNK]] == [3000, 4000, 5000]
+    assert queue.stats.dropped_speech == pytest.approx(2 * CHUNK / 16000)
+
+
+def test_drop_oldest_ignores_content():
+    queue = AudioQueue(2 * CHUNK, policy=DropPolicy.DROP_OLDEST)
+    for chunk in (speech(1000), silence(), speech(3000)):
+        queue.put(chunk)
+
+    samples, _ = queue.get(timeout=0)
+    assert len(samples) == 2 * CHUNK
+    assert samples[0] == 0 and samples[-1] == 3000
+
+
+def test_long_pauses_are_coalesced_while_behind():
+    queue = AudioQueue(20 * CHUNK, keep_silence=2 * CHUNK, low_water=0)
+    queue.put(speech())
+    for _ in range(5):
+        queue.put(silence())
+
+    assert len(queue) == 3 * CHUNK
+    assert queue.stats.coalesced == pytest.approx(3 * CHUNK / 16000)
+
+
+def test_flow_control_slows_down_and_resumes():
+    queue = AudioQueue(8 * CHUNK, high_water=4 * CHUNK, low_water=2 * CHUNK)
+    flows = [queue.put(speech()) for _ in range(4)]
+    assert flows == [None, None, None, Flow.SLOW_DOWN]
+    assert queue.paused
+
+    assert queue.get(timeout=0, max_samples=CHUNK)[1] is None
+    assert queue.get(timeout=0, max_samples=CHUNK)[1] == Flow.RESUME
+    assert not queue.paused
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from audio_codecs import TARGET_RATE, StreamDecoder, negotiate
+from framing import HEADER_SIZE, Codec, FrameError, encode_frame, is_frame, parse_frame
+
+
+def pcm(samples: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(-3000, 3000, samples, dtype=np.int16)
+
+
+def test_frame_round_trip():
+    samples = pcm(960)
+    message = encode_frame(samples.tobytes(), session=7, seq=42, sample_rate=48000, timestamp=123)
+    assert is_frame(message)
+    assert len(message) == HEADER_SIZE + 2 * len(samples)
+
+    frame = parse_frame(message)
+    assert (frame.session, frame.seq, frame.sample_rate) == (7, 42, 48000)
+    assert (frame.codec, frame.timestamp) == (Codec.PCM16, 123)
+    assert np.array_equal(frame.samples(), samples)
+
+
+def test_parse_does_not_copy_the_payload():
+    message = bytearray(encode_frame(pcm(160).tobytes(), session=1, seq=0, sample_rate=16000))
+    samples = parse_frame(message).samples()
+    message[HEADER_SIZE : HEADER_SIZE + 2] = b"\x01\x00"
+    assert samples[0] == 1
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        b"AF",
+        b"XX" + bytes(HEADER_SIZE),
+        encode_frame(b"\x00\x00", session=1, seq=0, sample_rate=16000)[:-1],
+        encode_frame(b"\x00\x00\x00", session=1, seq=0, sample_rate=16000),
+    ],
+)
+def test_malformed_frames_are_rejected(message):
+    with pytest.raises(FrameError):
+        parse_frame(message)
+
+
+def test_legacy_messages_are_not_frames():
+    assert not is_frame((12).to_bytes(4, "little") + b'{"sampleRate": 44100}')
+
+
+def test_negotiate_falls_back_to_pcm16():
+    assert negotiate(None) == Codec.PCM16
+    assert negotiate(["flac", " PCM16 "]) == Codec.PCM16
+
+
+def test_decoder_passes_16k_pcm_through():
+    samples = pcm(320)
+    frame = parse_frame(encode_frame(samples.tobytes(), session=1, seq=0, sample_rate=TARGET_RATE))
+    assert np.array_equal(StreamDecoder().decode(frame), samples)
+
+
+def test_decoder_resamples_a_framed_stream_like_a_whole_one():
+    samples = pcm(48000)
+    whole = StreamDecoder().resample(samples, 48000)
+
+    decoder = StreamDecoder()
+    parts = []
+    for seq, start in enumerate(range(0, len(samples), 960)):
+        message = encode_frame(
+            samples[start : start + 960].tobytes(), session=1, seq=seq, sample_rate=48000
+        )
+        parts.append(decoder.decode(parse_frame(message)))
+    assert np.array_equal(np.concatenate(parts), whole)
@@ -0,0 +1,81 @@
+import asyncio
+
+from redis_store import HistoryStore, MemoryBackend
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def messages(n: int, start: int = 0) -> list[dict[str, str]]:
+    return [{"role": "user", "content": f"message {i}"} for i in range(start, start + n)]
+
+
+def test_new_session_then_resume_by_token():
+    async def main():
+        store = HistoryStore(MemoryBackend())
+        record = await store.open_session()
+        assert not record.resumed
+        await store.save_messages(record.token, messages(2))
+        await store.save_state(record.token, {"interrupted": "he fell"})
+
+        # Another process: nothing cached locally.
+        other = HistoryStore(store.client)
+        resumed = await other.open_session(record.token)
+        return record, resumed, await other.load_history(record.token)
+
+    record, resumed, history = run(main())
+    assert resumed.resumed and resumed.token == record.token
+    assert resumed.next_index == 2
+    assert resumed.state == {"interrupted": "he fell"}
+    assert history == messages(2)
+
+
+def test_unknown_token_starts_a_new_session():
+    async def main():
+        store = HistoryStore(MemoryBackend())
+        return await store.open_session("no-such-token")
+
+    record = run(main())
+    assert not record.resumed
+    assert record.token != "no-such-token"
+
+
+def test_history_is_capped_and_read_incrementally():
+    async def main():
+        store = HistoryStore(MemoryBackend(), max_messages=5)
+        token = (await store.open_session()).token
+        assert await store.save_messages(token, messages(4)) == 4
+        history, since = await store.get_history(token)
+        assert (history, since) == (messages(4), 4)
+
+        assert await store.save_messages(token, messages(3, start=4)) == 7
+        new, since = await store.get_history(token, since)
+        assert (new, since) == (messages(3, start=4), 7)
+        return await HistoryStore(store.client).load_history(token)
+
+    assert run(main()) == messages(5, start=2)
+
+
+def test_personal_data_and_clear():
+    async def main():
+        store = HistoryStore(MemoryBackend())
+        token = (await store.open_session()).token
+        await store.set_personal_data(token, {"name": "Ana", "phone": "0600000000"})
+        data = await store.get_personal_data(token)
+        await store.clear_all_data(token)
+        return data, await HistoryStore(store.client).load_session(token)
+
+    data, after = run(main())
+    assert data == {"name": "Ana", "phone": "0600000000"}
+    assert after is None
+
+
+def test_keys_expire_after_the_ttl():
+    async def main():
+        store = HistoryStore(MemoryBackend(), ttl=60)
+        token = (await store.open_session()).token
+        await store.save_messages(token, messages(1))
+        return await store.client.ttl(f"chat:{token}"), await store.client.ttl(f"session:{token}")
+
+    assert all(0 < ttl <= 60 for ttl in run(main()))
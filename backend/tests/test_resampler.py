@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from resampler import StreamingResampler
+
+
+def signal(rate: int, seconds: float = 1.0) -> np.ndarray:
+    t = np.arange(int(rate * seconds)) / rate
+    tone = 8000 * np.sin(2 * np.pi * 440 * t) + 2000 * np.sin(2 * np.pi * 3000 * t)
+    return tone.astype(np.int16)
+
+
+@pytest.mark.parametrize("src_rate", [8000, 22050, 44100, 48000])
+@pytest.mark.parametrize("chunk", [1, 7, 160, 441, 960, 4801])
+def test_output_does_not_depend_on_chunking(src_rate, chunk):
+    samples = signal(src_rate)
+    whole = StreamingResampler(src_rate).process(samples.tobytes())
+
+    resampler = StreamingResampler(src_rate)
+    pieces = [
+        resampler.process(samples[i : i + chunk].tobytes()) for i in range(0, len(samples), chunk)
+    ]
+    assert b"".join(pieces) == whole
+
+
+def test_odd_byte_chunks_are_carried_over():
+    data = signal(44100).tobytes()
+    whole = StreamingResampler(44100).process(data)
+
+    resampler = StreamingResampler(44100)
+    pieces = [resampler.process(data[i : i + 333]) for i in range(0, len(data), 333)]
+    assert b"".join(pieces) == whole
+
+
+def test_arrays_and_bytes_give_the_same_output():
+    samples = signal(48000)
+    assert StreamingResampler(48000).process(samples) == StreamingResampler(48000).process(
+        samples.tobytes()
+    )
+
+
+def test_output_length_follows_the_ratio():
+    resampler = StreamingResampler(48000)
+    out = np.frombuffer(resampler.process(signal(48000)), dtype=np.int16)
+    assert abs(len(out) - 16000) <= 1
+
+
+def test_tone_is_preserved():
+    resampler = StreamingResampler(44100)
+    out = np.frombuffer(resampler.process(signal(44100, 2.0)), dtype=np.int16).astype(float)
+    t = (np.arange(len(out)) - resampler.delay) / 16000
+    expected = 8000 * np.sin(2 * np.pi * 440 * t) + 2000 * np.sin(2 * np.pi * 3000 * t)
+    middle = slice(1000, -1000)
+    error = out[middle] - expected[middle]
+    snr = 10 * np.log10(np.mean(expected[middle] ** 2) / np.mean(error**2))
+    assert snr > 40
+
+
+def test_reset_forgets_the_stream():
+    samples = signal(48000, 0.1)
+    resampler = StreamingResampler(48000)
+    first = resampler.process(samples)
+    resampler.reset()
+    assert resampler.process(samples) == first
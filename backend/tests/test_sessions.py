@@ -0,0 +1,119 @@
+import asyncio
+import json
+from types import SimpleNamespace as NS
+
+from llm import LLMAssistant, LLMRequestQueue
+from sessions import Session
+from speculative import SpeculativeDispatcher
+
+PARTIAL = "mon fils s'étouffe il a avalé un corps étranger"
+
+
+class FakeStream:
+    """What ``chat.stream_async`` returns: an async context yielding chunks."""
+
+    def __init__(self, text: str):
+        self.parts = [text[i : i + 8] for i in range(0, len(text), 8)]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def __aiter__(self):
+        for part in self.parts:
+            await asyncio.sleep(0.001)
+            yield NS(data=NS(choices=[NS(delta=NS(content=part))]))
+
+
+class FakeChat:
+    """Mistral chat API answering every request with the choking protocol."""
+
+    def __init__(self):
+        self.requests = 0
+
+    async def stream_async(self, messages, **kwargs):
+        self.requests += 1
+        age = {"âge": 3} if "3 ans" in messages[-1]["content"] else {}
+        return FakeStream(
+            json.dumps(
+                {
+                    "name": "assistance_obstruction_voies_respiratoires",
+                    "description": "Obstruction des voies respiratoires",
+                    "arguments": age,
+                }
+            )
+        )
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, text: str) -> None:
+        self.sent.append(json.loads(text))
+
+
+def make_session(chat: FakeChat) -> Session:
+    llm = LLMAssistant(client=NS(chat=chat))
+    llm_queue = LLMRequestQueue(2)
+    return Session(
+        1,
+        FakeSocket(),
+        asyncio.get_running_loop(),
+        NS(recorder=NS()),
+        llm,
+        llm_queue,
+        speculator=SpeculativeDispatcher(llm, llm_queue),
+        vad_gate=False,
+    )
+
+
+async def speculation_round(final: str):
+    chat = FakeChat()
+    session = make_session(chat)
+    session.on_partial(PARTIAL)
+    await asyncio.sleep(0.05)
+    session.respond(final)
+    await session._response
+    session.active = False
+    return chat, session, [m for m in session.websocket.sent if m["type"] == "response"]
+
+
+def test_matching_final_sentence_uses_the_speculation():
+    chat, session, responses = asyncio.run(speculation_round(PARTIAL))
+
+    assert chat.requests == 1
+    assert session.speculator.stats.confirmed == 1
+    assert responses[0]["text"]["name"] == "assistance_obstruction_voies_respiratoires"
+    assert [turn["role"] for turn in session.llm.history.turns] == ["user", "assistant"]
+
+
+def test_final_sentence_adding_arguments_restates_the_speculation():
+    chat, session, responses = asyncio.run(speculation_round(f"{PARTIAL} il a 3 ans"))
+
+    assert session.speculator.stats.confirmed == 1
+    assert responses[0]["text"]["arguments"]["âge"] == 3
+
+
+def test_final_sentence_of_another_protocol_is_requested_again():
+    chat, session, responses = asyncio.run(speculation_round("il saigne beaucoup du bras"))
+
+    assert chat.requests == 2
+    assert session.speculator.stats.confirmed == 0
+    assert session.speculator.stats.cancelled == 1
+    assert len(responses) == 1
+
+
+def test_recording_start_drops_the_speculation():
+    async def main():
+        session = make_session(FakeChat())
+        session.on_partial(PARTIAL)
+        session.cancel_response()
+        session.active = False
+        return session.speculator
+
+    speculator = asyncio.run(main())
+    assert speculator.current is None
+    assert speculator.stats.cancelled == 1
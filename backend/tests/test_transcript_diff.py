@@ -0,0 +1,74 @@
+import asyncio
+
+from transcript_diff import PartialTranscript, apply, diff
+
+
+def test_diff_round_trips_growing_and_corrected_text():
+    texts = ["", "hel", "hello", "hello wor", "hello word", "hello world", "help", "", "é ü"]
+    client = ""
+    for previous, current in zip(texts, texts[1:]):
+        keep, suffix = diff(previous, current)
+        assert keep <= len(previous)
+        client = apply(client, keep, suffix)
+        assert client == current
+
+
+def test_diff_sends_only_the_changed_tail():
+    assert diff("my father fell", "my father fell down") == (14, " down")
+    assert diff("my farther", "my father") == (5, "ther")
+
+
+async def collect(updates, *, incremental, window=0.05):
+    loop = asyncio.get_running_loop()
+    sent = []
+    partial = PartialTranscript(loop, sent.append, incremental=incremental, window=window)
+    for text in updates:
+        partial.update(text)
+    await asyncio.sleep(2 * window)
+    return partial, sent
+
+
+def test_updates_within_a_window_are_coalesced():
+    updates = ["he", "hel", "hell", "hello"]
+    partial, sent = asyncio.run(collect(updates, incremental=False))
+
+    assert [m["text"] for m in sent] == ["hello"]
+    assert partial.stats.updates == 4
+    assert partial.stats.messages == 1
+
+
+def test_delta_messages_rebuild_the_text():
+    async def main():
+        loop = asyncio.get_running_loop()
+        sent = []
+        partial = PartialTranscript(loop, sent.append, incremental=True, window=0.01)
+        for text in ["he is", "he is not", "he is not answering", "he is now answering"]:
+            partial.update(text, {"trace_id": "t"})
+            await asyncio.sleep(0.03)
+        return sent
+
+    sent = asyncio.run(main())
+    client = ""
+    for rev, message in enumerate(sent, start=1):
+        assert message["type"] == "realtime_delta"
+        assert message["rev"] == rev
+        assert message["trace_id"] == "t"
+        client = apply(client, message["keep"], message["text"])
+    assert client == "he is now answering"
+
+
+def test_reset_starts_the_next_utterance_from_empty_text():
+    async def main():
+        loop = asyncio.get_running_loop()
+        sent = []
+        partial = PartialTranscript(loop, sent.append, incremental=True, window=0.01)
+        partial.update("first sentence")
+        await asyncio.sleep(0.03)
+        partial.reset()
+        partial.update("first words")
+        await asyncio.sleep(0.03)
+        return sent
+
+    sent = asyncio.run(main())
+    assert sent[-1]["keep"] == 0
+    assert sent[-1]["text"] == "first words"
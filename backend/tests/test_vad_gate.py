@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from vad_gate import FRAME_MS, VadGate
+
+RATE = 16000
+FRAME = RATE * FRAME_MS // 1000
+
+
+def tone(frames: int, amplitude: int = 8000) -> np.ndarray:
+    t = np.arange(frames * FRAME) / RATE
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+
+
+def quiet(frames: int) -> np.ndarray:
+    return np.zeros(frames * FRAME, dtype=np.int16)
+
+
+def gate(**kwargs) -> VadGate:
+    return VadGate(RATE, use_webrtc=False, **kwargs)
+
+
+def test_silence_is_dropped():
+    g = gate()
+    assert len(g.process(quiet(50))) == 0
+    assert not g.open
+    assert g.stats.saved == 1.0
+
+
+def test_speech_passes_with_preroll_and_hangover():
+    g = gate(preroll_ms=100, hangover_ms=200)
+    audio = np.concatenate((quiet(20), tone(10), quiet(30)))
+    passed = g.process(audio)
+
+    preroll, hangover = 100 // FRAME_MS, 200 // FRAME_MS
+    assert len(passed) == (preroll + 10 + hangover) * FRAME
+    assert np.array_equal(passed[preroll * FRAME : (preroll + 10) * FRAME], tone(10))
+    assert not g.open
+    assert g.stats.speech_frames == 10
+
+
+def test_output_does_not_depend_on_chunking():
+    audio = np.concatenate((quiet(20), tone(10), quiet(30), tone(5), quiet(80)))
+    whole = gate().process(audio)
+
+    g = gate()
+    pieces = [g.process(audio[i : i + 137]) for i in range(0, len(audio), 137)]
+    assert np.array_equal(np.concatenate(pieces), whole)
+
+
+def test_quiet_audio_under_the_threshold_is_silence():
+    g = gate(energy_threshold_db=-20)
+    assert len(g.process(tone(10, amplitude=1000))) == 0
+
+
+def test_stats_count_seconds_in_and_passed():
+    g = gate(preroll_ms=0, hangover_ms=0)
+    g.process(np.concatenate((quiet(50), tone(50))))
+    assert g.stats.seconds_in == pytest.approx(2.0)
+    assert g.stats.seconds_passed == pytest.approx(1.0)
+    assert g.stats.saved == pytest.approx(0.5)
@@ -0,0 +1,252 @@
+"""Per-utterance latency spans, exported as Prometheus histograms.
+
+Each utterance gets a :class:`Trace` whose stages are marked as it moves
+through the pipeline:
+
+    audio_received   first audio frame of the utterance reached the server
+    resampled        that audio was resampled and handed to the recorder
+    vad_end          the VAD closed the utterance
+    transcribed      the final transcript is available
+    llm_sent         the LLM request left the queue
+    first_token      the first streamed token arrived
+    parsed           the response was complete and validated
+    sent             the response was written to the client's socket
+
+When the trace finishes, the time between consecutive stages is observed in
+``pipeline_stage_seconds{stage="<stage>"}`` (labelled by the stage it ends
+at) and the whole span in ``pipeline_total_seconds``. The trace ID is put in
+every JSON message about the utterance, so client logs line up with the
+server's.
+
+Other components export their gauges and counters through
+:meth:`Tracer.register`, so everything is scraped from one place.
+
+The metrics are served as Prometheus text (``start_http_server``) and/or
+written to an OpenMetrics file (``write``) that a node exporter can pick up.
+"""
+
+import bisect
+import http.server
+import os
+import secrets
+import threading
+import time
+from typing import Callable, Optional
+
+STAGES = (
+    "audio_received",
+    "resampled",
+    "vad_end",
+    "transcribed",
+    "llm_sent",
+    "first_token",
+    "parsed",
+    "sent",
+)
+# Seconds; spans range from sub-millisecond socket writes to multi-second
+# LLM answers.
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, safe to observe from any thread."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self) -> tuple[list[tuple[str, int]], int, float]:
+        """Cumulative ``(le, count)`` pairs, total count and sum."""
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        cumulative, running = [], 0
+        for bound, n in zip(self.buckets, counts):
+            running += n
+            cumulative.append((repr(bound), running))
+        cumulative.append(("+Inf", count))
+        return cumulative, count, total
+
+
+class Trace:
+    """Stage timestamps of one utterance."""
+
+    def __init__(self, tracer: "Tracer", trace_id: str, start: Optional[float] = None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.marks: dict[str, float] = {}
+        self.finished = False
+        if start is not None:
+            self.marks["audio_received"] = start
+
+    def mark(self, stage: str, at: Optional[float] = None) -> None:
+        """Record when ``stage`` was reached; only the first mark of a stage counts."""
+        if stage not in self.marks:
+            self.marks[stage] = time.monotonic() if at is None else at
+
+    def spans(self) -> dict[str, float]:
+        """Seconds spent reaching each marked stage from the previous marked one."""
+        spans = {}
+        previous = None
+        for stage in STAGES:
+            at = self.marks.get(stage)
+            if at is None:
+                continue
+            if previous is not None:
+                spans[stage] = max(at - previous, 0.0)
+            previous = at
+        return spans
+
+    def finish(self, outcome: str = "answered") -> None:
+        """Report the trace; ``outcome`` other than "answered" is only counted."""
+        if self.finished:
+            return
+        self.finished = True
+        self.tracer.record(self, outcome)
+
+
+class Tracer:
+    """Collects finished traces into histograms and renders them."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.stages = {stage: Histogram(buckets) for stage in STAGES[1:]}
+        self.total = Histogram(buckets)
+        self.outcomes: dict[str, int] = {}
+        # Metric name -> kind, help and collector; one family per name.
+        self.collectors: dict[str, tuple[str, str, Callable[[], dict[str, float]]]] = {}
+        self.histograms: dict[str, tuple[str, Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, at: Optional[float] = None) -> Trace:
+        """Open a trace, by default starting with an audio frame received now."""
+        return Trace(self, secrets.token_hex(8), time.monotonic() if at is None else at)
+
+    def register(
+        self, name: str, kind: str, help: str, collect: Callable[[], dict[str, float]]
+    ) -> None:
+        """
+        Export another metric alongside the traces. Registering a name again
+        replaces its collector, e.g. when a component is rebuilt, rather than
+        exporting the family twice.
+
+        Args:
+            name: Metric name, ending in ``_total`` for counters
+            kind: "gauge" or "counter"
+            help: One-line description
+            collect: Called at each scrape; returns values by label set,
+                e.g. ``{'kind="speech"': 1.5}``, or ``{"": value}`` unlabelled
+        """
+        with self._lock:
+            self.collectors[name] = (kind, help, collect)
+
+    def histogram(self, name: str, help: str) -> Histogram:
+        """A histogram exported as ``name``, created on first use."""
+        if name not in self.histograms:
+            self.histograms[name] = (help, Histogram(self.buckets))
+        return self.histograms[name][1]
+
+    def record(self, trace: Trace, outcome: str) -> None:
+        with self._lock:
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        if outcome != "answered":
+            return
+        for stage, seconds in trace.spans().items():
+            self.stages[stage].observe(seconds)
+        marks = trace.marks.values()
+        self.total.observe(max(marks) - min(marks))
+
+    def render(self, openmetrics: bool = False) -> str:
+        """The metrics in Prometheus text format, or OpenMetrics with ``openmetrics``."""
+        lines = [
+            "# HELP pipeline_stage_seconds Time to reach each pipeline stage from the previous one.",
+            "# TYPE pipeline_stage_seconds histogram",
+        ]
+        for stage, histogram in self.stages.items():
+            lines.extend(_histogram_lines("pipeline_stage_seconds", histogram, f'stage="{stage}"'))
+        lines += [
+            "# HELP pipeline_total_seconds Time from the first audio frame to the response.",
+            "# TYPE pipeline_total_seconds histogram",
+        ]
+        lines.extend(_histogram_lines("pipeline_total_seconds", self.total))
+        for metric, (help, histogram) in list(self.histograms.items()):
+            lines += [f"# HELP {metric} {help}", f"# TYPE {metric} histogram"]
+            lines.extend(_histogram_lines(metric, histogram))
+        name = "pipeline_traces" if openmetrics else "pipeline_traces_total"
+        lines += [
+            f"# HELP {name} Finished utterance traces by outcome.",
+            f"# TYPE {name} counter",
+        ]
+        with self._lock:
+            outcomes = dict(self.outcomes)
+        for outcome, count in sorted(outcomes.items()):
+            lines.append(f'pipeline_traces_total{{outcome="{outcome}"}} {count}')
+        with self._lock:
+            collectors = list(self.collectors.items())
+        for metric, (kind, help, collect) in collectors:
+            family = metric[: -len("_total")] if openmetrics and kind == "counter" else metric
+            lines += [f"# HELP {family} {help}", f"# TYPE {family} {kind}"]
+            try:
+                values = collect()
+            except Exception as e:
+                print(f"Could not collect {metric}: {e}")
+                continue
+            for labels, value in values.items():
+                lines.append(f"{metric}{{{labels}}} {value}" if labels else f"{metric} {value}")
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Atomically replace ``path`` with the metrics in OpenMetrics format."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render(openmetrics=True))
+        os.replace(tmp, path)
+
+    def start_http_server(self, port: int, host: str = "0.0.0.0") -> http.server.ThreadingHTTPServer:
+        """Serve the metrics at ``http://host:port/metrics`` from a daemon thread."""
+        tracer = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = tracer.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+def _histogram_lines(name: str, histogram: Histogram, labels: str = "") -> list[str]:
+    cumulative, count, total = histogram.snapshot()
+    prefix = f"{labels}," if labels else ""
+    lines = [f'{name}_bucket{{{prefix}le="{le}"}} {n}' for le, n in cumulative]
+    suffix = f"{{{labels}}}" if labels else ""
+    lines.append(f"{name}_count{suffix} {count}")
+    lines.append(f"{name}_sum{suffix} {total}")
+    return lines
+
+
+# Process-wide tracer, like a default metrics registry.
+tracer = Tracer()
@@ -0,0 +1,174 @@
+"""Incremental realtime transcripts.
+
+The recorder reports the stabilized realtime transcript of the utterance in
+progress many times a second, each time in full, and each report used to be
+one JSON message carrying the whole string. On a long utterance the text
+mostly grows at the end, so almost every byte sent was already on the
+client's screen.
+
+:class:`PartialTranscript` sends at most one message per ``window`` (the
+first update after a quiet period goes out at once, later ones are folded
+into the next message) and, for clients that ask for it (``partials=delta``
+when connecting), only what changed since the previous message::
+
+    {"type": "realtime_delta", "rev": 7, "keep": 42, "text": "ing fast"}
+
+The client keeps the first ``keep`` characters (Unicode code points) of its
+current text and appends ``text``. ``rev`` increases by one per message of
+the session; a client that sees a gap has missed a message and should wait
+for the next ``fullSentence``. Each utterance starts again from empty text,
+so its first delta has ``keep`` 0. Other clients keep getting
+``{"type": "realtime", "text": ...}`` with the whole text, just less often.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+# Time between two realtime messages of a session. Short enough that text
+# reaches the screen well within 100 ms of being recognized.
+DEFAULT_WINDOW = 0.05
+
+
+def diff(previous: str, current: str) -> tuple[int, str]:
+    """
+    Encode ``current`` against ``previous``.
+
+    Returns:
+        Length of the prefix of ``previous`` to keep, and the text to append
+    """
+    keep = len(os.path.commonprefix((previous, current)))
+    return keep, current[keep:]
+
+
+def apply(text: str, keep: int, suffix: str) -> str:
+    """Decode a delta made by :func:`diff`, as a client does."""
+    return text[:keep] + suffix
+
+
+@dataclass
+class PartialStats:
+    """Realtime transcript traffic, in updates, messages and characters."""
+
+    updates: int = 0
+    messages: int = 0
+    # Text the updates would have sent in full, one message each.
+    chars_full: int = 0
+    chars_sent: int = 0
+
+    def merge(self, other: "PartialStats") -> None:
+        self.updates += other.updates
+        self.messages += other.messages
+        self.chars_full += other.chars_full
+        self.chars_sent += other.chars_sent
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "updates": self.updates,
+            "messages": self.messages,
+            "chars_full": self.chars_full,
+            "chars_sent": self.chars_sent,
+            "message_ratio": self.updates / self.messages if self.messages else 0.0,
+            "chars_ratio": self.chars_full / self.chars_sent if self.chars_sent else 0.0,
+        }
+
+
+class PartialTranscript:
+    """The realtime transcript of one session, sent as coalesced (and diffed) messages.
+
+    :meth:`update` and :meth:`reset` may be called from any thread; messages
+    are built and handed to ``send`` on the event loop.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        send: Callable[[dict[str, Any]], None],
+        *,
+        incremental: bool = False,
+        window: float = DEFAULT_WINDOW,
+        stats: Optional[PartialStats] = None,
+    ):
+        """
+        Initialize the transcript.
+
+        Args:
+            loop: Event loop of the session
+            send: Called on the loop with each message, in order
+            incremental: Send ``realtime_delta`` messages rather than the
+                whole text
+            window: Minimum seconds between two messages
+            stats: Stats to add to
+        """
+        self.loop = loop
+        self.send = send
+        self.incremental = incremental
+        self.window = window
+        self.stats = stats if stats is not None else PartialStats()
+        self.revision = 0
+        # Text of the utterance as the client last received it.
+        self._sent = ""
+        self._latest: Optional[tuple[str, dict[str, Any]]] = None
+        self._scheduled = False
+        self._last_message = float("-inf")
+        self._lock = threading.Lock()
+
+    def update(self, text: str, fields: Optional[dict[str, Any]] = None) -> None:
+        """
+        Report the current realtime text of the utterance.
+
+        Args:
+            text: Whole stabilized transcript so far
+            fields: Extra message fields, e.g. the trace ID
+        """
+        with self._lock:
+            self._latest = (text, fields or {})
+            self.stats.updates += 1
+            self.stats.chars_full += len(text)
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.loop.call_soon_threadsafe(self._schedule)
+
+    def reset(self) -> None:
+        """End of the utterance: drop any pending update; the next starts from empty text."""
+        with self._lock:
+            self._latest = None
+            self._sent = ""
+
+    def _schedule(self) -> None:
+        delay = self._last_message + self.window - time.monotonic()
+        if delay > 0:
+            self.loop.call_later(delay, self._flush)
+        else:
+            self._flush()
+
+    def _flush(self) -> None:
+        with self._lock:
+            latest, self._latest = self._latest, None
+            self._scheduled = False
+            if latest is None:
+                return
+            message = self._message(*latest)
+            if message is not None:
+                # Under the lock, so a reset() cannot slip a final message in before it.
+                self._last_message = time.monotonic()
+                self.send(message)
+
+    def _message(self, text: str, fields: dict[str, Any]) -> Optional[dict[str, Any]]:
+        if text == self._sent:
+            return None
+        self._sent, previous = text, self._sent
+        self.revision += 1
+        self.stats.messages += 1
+        if not self.incremental:
+            self.stats.chars_sent += len(text)
+            return {"type": "realtime", "text": text, **fields}
+        keep, suffix = diff(previous, text)
+        self.stats.chars_sent += len(suffix)
+        return {
+            "type": "realtime_delta", "rev": self.revision, "keep": keep, "text": suffix, **fields
+        }
@@ -0,0 +1,205 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+# Whisper's encoder window; longer utterances cannot share a batch.
+MAX_BATCHED_SECONDS = 30
+
+
+@dataclass
+class _Request:
+    audio: np.ndarray
+    session_id: Any
+    future: Future
+    queued_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class EngineStats:
+    batches: int = 0
+    utterances: int = 0
+    audio_seconds: float = 0.0
+    busy_seconds: float = 0.0
+    queue_wait_seconds: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "batches": self.batches,
+            "utterances": self.utterances,
+            "mean_batch_size": self.utterances / self.batches if self.batches else 0.0,
+            "mean_queue_wait_ms": 1e3 * self.queue_wait_seconds / max(self.utterances, 1),
+            "real_time_factor": self.busy_seconds / self.audio_seconds if self.audio_seconds else 0.0,
+        }
+
+
+class TranscriptionEngine:
+    """One Whisper model shared by every session, fed in dynamic micro-batches.
+
+    Sessions submit finalized utterances and get a future back. A worker
+    thread takes the first pending utterance, waits at most ``max_wait``
+    seconds for others to join it (up to ``max_batch_size``), and runs them
+    through the encoder and decoder as one batch, which on CPU costs little
+    more than running the longest of them alone.
+    """
+
+    def __init__(
+        self,
+        model: Any = "small",
+        *,
+        language: Optional[str] = "en",
+        device: str = "cpu",
+        compute_type: str = "int8",
+        cpu_threads: int = 4,
+        max_batch_size: int = 8,
+        max_wait: float = 0.05,
+        beam_size: int = 1,
+    ):
+        """
+        Initialize the engine and load the model.
+
+        Args:
+            model: faster-whisper model size or path, or a loaded WhisperModel
+            language: Language code; if None, detected per batch from its first utterance
+            device: "cpu" or "cuda"
+            compute_type: CTranslate2 quantization, e.g. "int8" on CPU
+            cpu_threads: Threads CTranslate2 uses per batch
+            max_batch_size: Utterances transcribed together at most
+            max_wait: Seconds the first utterance of a batch waits for company
+            beam_size: Decoding beam width
+        """
+        if isinstance(model, str):
+            from faster_whisper import WhisperModel
+
+            model = WhisperModel(
+                model, device=device, compute_type=compute_type, cpu_threads=cpu_threads
+            )
+        self.model = model
+        self.language = language
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.beam_size = beam_size
+        self.stats = EngineStats()
+        self._requests: queue.Queue[Optional[_Request]] = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="transcription", daemon=True)
+        self._worker.start()
+
+    def transcribe(self, audio: np.ndarray, session_id: Any = None) -> Future:
+        """
+        Queue an utterance for transcription.
+
+        Args:
+            audio: Mono float32 samples in [-1, 1] at 16 kHz
+            session_id: Caller, for logging
+
+        Returns:
+            Future resolving to the transcribed text
+        """
+        future: Future = Future()
+        self._requests.put(_Request(np.asarray(audio, dtype=np.float32), session_id, future))
+        return future
+
+    async def transcribe_async(self, audio: np.ndarray, session_id: Any = None) -> str:
+        return await asyncio.wrap_future(self.transcribe(audio, session_id))
+
+    def shutdown(self) -> None:
+        self._requests.put(None)
+        self._worker.join(timeout=5)
+
+    def _next_batch(self) -> Optional[list[_Request]]:
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    request = self._requests.get(timeout=remaining)
+                else:
+                    request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._requests.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            start = time.monotonic()
+            for request in batch:
+                self.stats.queue_wait_seconds += start - request.queued_at
+            long = [r for r in batch if len(r.audio) > MAX_BATCHED_SECONDS * SAMPLE_RATE]
+            short = [r for r in batch if len(r.audio) <= MAX_BATCHED_SECONDS * SAMPLE_RATE]
+            try:
+                if short:
+                    texts = self._transcribe_batch([r.audio for r in short])
+                    for request, text in zip(short, texts):
+                        request.future.set_result(text)
+                for request in long:
+                    request.future.set_result(self._transcribe_long(request.audio))
+            except Exception as e:
+                print(f"Transcription batch of {len(batch)} failed: {e}")
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+
+            self.stats.batches += 1
+            self.stats.utterances += len(batch)
+            self.stats.audio_seconds += sum(len(r.audio) for r in batch) / SAMPLE_RATE
+            self.stats.busy_seconds += time.monotonic() - start
+
+    def _transcribe_batch(self, audios: list[np.ndarray]) -> list[str]:
+        """Encode and decode up to 30 s utterances as one batch."""
+        from faster_whisper.audio import pad_or_trim
+        from faster_whisper.tokenizer import Tokenizer
+
+        features = np.stack(
+            [pad_or_trim(self.model.feature_extractor(audio)[..., :-1]) for audio in audios]
+        )
+        encoder_output = self.model.encode(features)
+
+        language = self.language
+        if language is None:
+            language = self.model.model.detect_language(encoder_output)[0][0][0][2:-2]
+        tokenizer = Tokenizer(
+            self.model.hf_tokenizer,
+            self.model.model.is_multilingual,
+            task="transcribe",
+            language=language,
+        )
+        prompt = self.model.get_prompt(tokenizer, [], without_timestamps=True)
+        results = self.model.model.generate(
+            encoder_output,
+            [prompt] * len(audios),
+            beam_size=self.beam_size,
+            max_length=self.model.max_length,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+        )
+        return [
+            tokenizer.decode([t for t in result.sequences_ids[0] if t < tokenizer.eot]).strip()
+            for result in results
+        ]
+
+    def _transcribe_long(self, audio: np.ndarray) -> str:
+        segments, _ = self.model.transcribe(
+            audio, language=self.language, beam_size=self.beam_size, without_timestamps=True
+        )
+        return " ".join(segment.text.strip() for segment in segments)
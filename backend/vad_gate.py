@@ -0,0 +1,159 @@
+"""Cheap voice-activity gate in front of the recorders.
+
+Callers are often silent for long stretches, e.g. while performing CPR, and
+everything fed to a recorder is resampled and run through its VAD and
+realtime Whisper model. The gate looks at raw int16 frames before any of
+that: a vectorized energy check rejects quiet frames outright, and only the
+frames loud enough to be speech are confirmed with WebRTC VAD (when
+``webrtcvad``, a RealtimeSTT dependency, is installed and the rate is one it
+supports).
+
+Speech is passed through with ``preroll_ms`` of the audio before it, so
+onsets are not clipped, and followed by ``hangover_ms`` of whatever comes
+next, so the recorder still hears the pause that ends the utterance. The
+rest of the silence is dropped.
+"""
+
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:  # optional: the energy check alone is used
+    webrtcvad = None
+
+FRAME_MS = 20
+WEBRTC_RATES = (8000, 16000, 32000, 48000)
+
+
+@dataclass
+class GateStats:
+    """Audio seen and passed by a gate, in seconds."""
+
+    seconds_in: float = 0.0
+    seconds_passed: float = 0.0
+    speech_frames: int = 0
+    vad_checks: int = 0
+
+    @property
+    def saved(self) -> float:
+        """Fraction of the audio the recorder did not have to process."""
+        return 1 - self.seconds_passed / self.seconds_in if self.seconds_in else 0.0
+
+    def merge(self, other: "GateStats") -> None:
+        self.seconds_in += other.seconds_in
+        self.seconds_passed += other.seconds_passed
+        self.speech_frames += other.speech_frames
+        self.vad_checks += other.vad_checks
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "seconds_in": self.seconds_in,
+            "seconds_passed": self.seconds_passed,
+            "saved": self.saved,
+            "speech_frames": self.speech_frames,
+            "vad_checks": self.vad_checks,
+        }
+
+
+class VadGate:
+    """Per-stream gate dropping silence from raw int16 audio.
+
+    Keeps the stream's state (partial frame, pre-roll, hangover), so it must
+    not be shared between streams.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int,
+        *,
+        energy_threshold_db: float = -45.0,
+        aggressiveness: int = 2,
+        preroll_ms: int = 300,
+        hangover_ms: int = 1000,
+        use_webrtc: bool = True,
+        stats: Optional[GateStats] = None,
+    ):
+        """
+        Initialize the gate.
+
+        Args:
+            sample_rate: Rate of the audio the gate receives
+            energy_threshold_db: Frame RMS, in dB relative to full scale,
+                under which a frame is silence without asking WebRTC VAD
+            aggressiveness: WebRTC VAD mode, 0 (keeps most) to 3
+            preroll_ms: Audio kept before detected speech
+            hangover_ms: Audio passed after the last speech frame; must exceed
+                the recorder's post-speech silence so utterances still end
+            use_webrtc: Confirm loud frames with WebRTC VAD when available
+            stats: Stats to add to, e.g. kept across a change of sample rate
+        """
+        self.sample_rate = sample_rate
+        self.frame = sample_rate * FRAME_MS // 1000
+        # Compare mean squares rather than RMS to skip the square root.
+        self.threshold = (32768.0 * 10 ** (energy_threshold_db / 20)) ** 2
+        self.vad = None
+        if use_webrtc and webrtcvad is not None and sample_rate in WEBRTC_RATES:
+            self.vad = webrtcvad.Vad(aggressiveness)
+        self.preroll: deque[np.ndarray] = deque(maxlen=max(preroll_ms // FRAME_MS, 0))
+        self.hangover_frames = hangover_ms // FRAME_MS
+        self._hangover = 0
+        self._rest = np.zeros(0, dtype=np.int16)
+        self.stats = stats if stats is not None else GateStats()
+
+    @property
+    def open(self) -> bool:
+        return self._hangover > 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Gate the next chunk of the stream.
+
+        Returns:
+            The samples to pass on, possibly empty. Audio is delayed by at
+            most one partial frame.
+        """
+        self.stats.seconds_in += len(samples) / self.sample_rate
+        if len(self._rest):
+            samples = np.concatenate((self._rest, samples))
+        count = len(samples) // self.frame
+        self._rest = samples[count * self.frame :].copy()
+        if not count:
+            return samples[:0]
+
+        frames = samples[: count * self.frame].reshape(count, self.frame)
+        energy = np.einsum("ij,ij->i", frames, frames, dtype=np.float64) / self.frame
+        loud = energy >= self.threshold
+        if self.vad is not None:
+            for i in np.flatnonzero(loud):
+                self.stats.vad_checks += 1
+                loud[i] = self.vad.is_speech(frames[i].tobytes(), self.sample_rate)
+        self.stats.speech_frames += int(loud.sum())
+
+        out: list[np.ndarray] = []
+        for frame, speech in zip(frames, loud):
+            if speech:
+                if not self.open:
+                    out.extend(self.preroll)
+                    self.preroll.clear()
+                self._hangover = self.hangover_frames + 1
+            if self.open:
+                out.append(frame)
+                self._hangover -= 1
+            else:
+                self.preroll.append(frame)
+
+        if not out:
+            return samples[:0]
+        passed = out[0].copy() if len(out) == 1 else np.concatenate(out)
+        self.stats.seconds_passed += len(passed) / self.sample_rate
+        return passed
+
+    def reset(self) -> None:
+        self.preroll.clear()
+        self._hangover = 0
+        self._rest = np.zeros(0, dtype=np.int16)
+
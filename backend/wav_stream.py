@@ -0,0 +1,129 @@
+"""Incremental WAV decoding for audio that arrives in pieces.
+
+:class:`WavStreamParser` is fed the bytes of a WAV file as they come off the
+network and returns mono int16 samples as soon as whole sample frames are
+available. The header is parsed once; after it, only a partial sample frame
+is carried between calls, so memory use does not grow with the file.
+"""
+
+import struct
+from typing import Optional
+
+import numpy as np
+
+# Largest header (RIFF preamble plus the chunks before ``data``) accepted;
+# beyond it the input is not a WAV file we can stream.
+MAX_HEADER_BYTES = 64 * 1024
+# Data sizes written by encoders that do not know the length up front.
+UNKNOWN_SIZES = (0, 0xFFFFFFFF)
+
+
+class WavStreamParser:
+    """Decode a WAV byte stream into mono int16 samples, piece by piece.
+
+    Handles 16-bit PCM and 32-bit float files; multichannel audio is
+    averaged down.
+    """
+
+    def __init__(self):
+        self.sample_rate: Optional[int] = None
+        self.channels = 0
+        self.float32 = False
+        self.frames = 0
+        self._header = bytearray()
+        self._rest = b""
+        self._remaining: Optional[int] = None
+        self._block = 0
+
+    @property
+    def seconds(self) -> float:
+        """Audio decoded so far."""
+        return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+    @property
+    def done(self) -> bool:
+        """True once the whole ``data`` chunk has been decoded."""
+        return self._remaining == 0
+
+    def feed(self, data: bytes) -> np.ndarray:
+        """
+        Decode the next bytes of the file.
+
+        Returns:
+            The samples completed by ``data``, possibly none
+
+        Raises:
+            ValueError: If the input is not a WAV file in a supported format
+        """
+        if self.sample_rate is None:
+            self._header += data
+            data = self._parse_header()
+            if data is None:
+                return np.zeros(0, dtype=np.int16)
+        if self._remaining is not None:
+            data = data[: self._remaining]
+            self._remaining -= len(data)
+        if self._rest:
+            data = self._rest + data
+        usable = len(data) // self._block * self._block
+        self._rest = bytes(data[usable:])
+        if not usable:
+            return np.zeros(0, dtype=np.int16)
+        return self._decode(memoryview(data)[:usable])
+
+    def _parse_header(self) -> Optional[bytes]:
+        """Parse the header if it is complete; return the data bytes after it."""
+        header = self._header
+        if len(header) < 12:
+            return None
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError("Not a WAV file")
+        fmt = None
+        offset = 12
+        while offset + 8 <= len(header):
+            chunk_id, size = struct.unpack_from("<4sI", header, offset)
+            if chunk_id == b"data":
+                if fmt is None:
+                    raise ValueError("WAV file has no fmt chunk")
+                self._start(fmt, size)
+                data = bytes(header[offset + 8 :])
+                self._header = bytearray()
+                return data
+            if offset + 8 + size > len(header):
+                break
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack_from("<HHIIHH", header, offset + 8)
+            offset += 8 + size + (size & 1)
+        if len(header) > MAX_HEADER_BYTES:
+            raise ValueError(f"No data chunk in the first {MAX_HEADER_BYTES} bytes")
+        return None
+
+    def _start(self, fmt: tuple[int, ...], size: int) -> None:
+        format_tag, channels, rate, _, _, bits = fmt
+        if format_tag == 1 and bits == 16:
+            self.float32 = False
+        elif format_tag == 3 and bits == 32:
+            self.float32 = True
+        else:
+            raise ValueError(f"Unsupported WAV format {format_tag}/{bits} bits")
+        if not channels or not rate:
+            raise ValueError("Invalid WAV fmt chunk")
+        self.channels = channels
+        self.sample_rate = rate
+        self._block = channels * bits // 8
+        self._remaining = None if size in UNKNOWN_SIZES else size
+
+    def _decode(self, data: memoryview) -> np.ndarray:
+        if self.float32:
+            samples = np.frombuffer(data, dtype="<f4")
+        else:
+            samples = np.frombuffer(data, dtype="<i2")
+        if self.channels > 1:
+            samples = samples.reshape(-1, self.channels).mean(axis=1)
+        self.frames += len(samples)
+        if self.float32:
+            return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+        if self.channels > 1:
+            return samples.astype(np.int16)
+        # The buffer belongs to the caller's chunk; keep our own copy.
+        return samples.copy()
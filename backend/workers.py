@@ -0,0 +1,312 @@
+"""STT and LLM workers consuming the gateways' work queues (see workqueue.py).
+
+An STT worker transcribes the utterances of the ``stt`` queue with a shared
+:class:`TranscriptionEngine`, which batches the utterances of concurrent jobs,
+sends each sentence back to its session and queues it for the LLM workers.
+An LLM worker answers the sentences of the ``llm`` queue. Conversations are
+kept in memory by session token (a session's jobs always reach the same
+worker, see :meth:`WorkQueue.owned`) and checked against the history store,
+so a conversation that moved between workers is reloaded rather than forked.
+
+Usage:
+    python workers.py stt [--index 0 --count 2]
+    python workers.py llm [--index 0 --count 4] [--fake-llm 0.8]
+    python workers.py check
+
+Worker ``--index`` of ``--count`` owns its share of the queue's partitions;
+run one process per index. A restarted worker must keep its ``--name``
+(default: the index) to replay the jobs it had not finished. Workers use the
+Redis of ``REDIS_URL`` (see redis_store.py) and export their metrics on
+``--metrics-port`` and/or to ``METRICS_FILE``, like the server.
+
+``check`` runs a gateway and an LLM worker in one process on the in-memory
+stand-in of Redis, sends a sentence from a session through the ``llm``
+queue and fails unless the answer comes back to the session.
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+import numpy as np
+from pydantic import BaseModel
+
+from llm import LLMAssistant, LLMRequestQueue
+from redis_store import MEMORY_URL, REDIS_URL, HistoryStore, connect
+from tracing import tracer
+from transcription import TranscriptionEngine
+from workqueue import DEFAULT_PARTITIONS, Job, Replies, WorkQueue
+
+
+class STTWorker:
+    """Transcribes queued utterances and passes the sentences on to the LLM queue."""
+
+    def __init__(
+        self, engine: TranscriptionEngine, queue: WorkQueue, llm_queue: WorkQueue, replies: Replies
+    ):
+        self.engine = engine
+        self.queue = queue
+        self.llm_queue = llm_queue
+        self.replies = replies
+
+    async def handle(self, job: Job) -> None:
+        # 16 kHz mono int16, as cut by the gateway.
+        audio = np.frombuffer(base64.b64decode(job.fields["audio"]), dtype="<i2")
+        text = await self.engine.transcribe_async(audio.astype(np.float32) / 32768.0, job.key)
+        text = text.strip()
+        trace_id = job.fields.get("trace_id", "")
+        if not text:
+            # Not shown to the client, but the gateway stops waiting for it.
+            await self.replies.send(job, {"type": "transcribed", "text": "", "trace_id": trace_id})
+            return
+        print(f"\rSession {job.key} sentence: {text}")
+        await self.replies.send(job, {"type": "fullSentence", "text": text, "trace_id": trace_id})
+        # Redelivered jobs queue the sentence again; the LLM worker skips it by origin.
+        await self.llm_queue.put(job.key, {**job.route(), "origin": job.origin, "text": text})
+
+
+class LLMWorker:
+    """Answers queued sentences, keeping each session's conversation in memory."""
+
+    def __init__(
+        self,
+        llm_factory: Callable[[], LLMAssistant],
+        queue: WorkQueue,
+        replies: Replies,
+        *,
+        store: Optional[HistoryStore] = None,
+        llm_queue: Optional[LLMRequestQueue] = None,
+        max_conversations: int = 1024,
+    ):
+        """
+        Initialize the worker.
+
+        Args:
+            llm_factory: Builds a session's assistant (see
+                ``SessionManager.shared_llm_factory``)
+            queue: The ``llm`` queue
+            replies: Where answers are sent
+            store: Persists and restores conversations by token. If None,
+                conversations live in this worker only
+            llm_queue: Limits concurrent LLM requests; defaults to a
+                :class:`LLMRequestQueue`
+            max_conversations: Conversations kept in memory
+        """
+        self.llm_factory = llm_factory
+        self.queue = queue
+        self.replies = replies
+        self.store = store
+        self.llm_queue = llm_queue or LLMRequestQueue()
+        self.max_conversations = max_conversations
+        # Key -> assistant and the stored history length it reflects.
+        self._conversations: OrderedDict[str, tuple[LLMAssistant, int]] = OrderedDict()
+        self._answered: OrderedDict[str, None] = OrderedDict()
+
+    async def _assistant(self, key: str, token: Optional[str]) -> tuple[LLMAssistant, int]:
+        cached = self._conversations.get(key)
+        if self.store is None or not token:
+            return cached or (self.llm_factory(), 0)
+        record = await self.store.load_session(token)
+        next_index = record.next_index if record is not None else 0
+        if cached is not None and cached[1] == next_index:
+            return cached
+        # New here, or answered elsewhere since: start over from the store.
+        llm = self.llm_factory()
+        if record is not None:
+            for message in await self.store.load_history(token):
+                llm.history.append(message["role"], message["content"])
+        return llm, next_index
+
+    def _remember(self, key: str, llm: LLMAssistant, next_index: int) -> None:
+        self._conversations[key] = (llm, next_index)
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+
+    async def handle(self, job: Job) -> None:
+        if job.origin in self._answered:
+            return
+        token = job.fields.get("token") or None
+        prompt = job.fields["text"]
+        trace_id = job.fields.get("trace_id", "")
+        llm, next_index = await self._assistant(job.key, token)
+
+        async def on_delta(delta: str) -> None:
+            await self.replies.send(
+                job, {"type": "response_delta", "text": delta, "trace_id": trace_id}
+            )
+
+        try:
+            response = await self.llm_queue.run(llm.chat_async(prompt, on_delta=on_delta))
+        except Exception as e:
+            print(f"Session {job.key}: LLM request failed: {e}")
+            await self.replies.send(job, {"type": "error", "text": str(e), "trace_id": trace_id})
+            return
+
+        text = response.model_dump_json() if isinstance(response, BaseModel) else str(response)
+        if isinstance(response, BaseModel):
+            response = response.model_dump()
+        await self.replies.send(job, {"type": "response", "text": response, "trace_id": trace_id})
+        self._answered[job.origin] = None
+        if len(self._answered) > self.max_conversations:
+            self._answered.popitem(last=False)
+        if self.store is not None and token:
+            try:
+                await self.store.save_messages(
+                    token,
+                    [{"role": "user", "content": prompt}, {"role": "assistant", "content": text}],
+                )
+                next_index += 2
+            except Exception as e:
+                # Persistence only matters for resuming; never fail the answer over it.
+                print(f"Session {job.key}: could not persist the exchange: {e}")
+        self._remember(job.key, llm, next_index)
+
+
+async def write_metrics(path: str, interval: float = 15.0) -> None:
+    """Rewrite ``path`` with the metrics every ``interval`` seconds, as the server does."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            tracer.write(path)
+        except OSError as e:
+            print(f"Could not write metrics to {path}: {e}")
+
+
+class _Inbox:
+    """Stand-in socket keeping what a session sends."""
+
+    def __init__(self):
+        self.messages: list[dict[str, Any]] = []
+
+    async def send_message(self, message: dict[str, Any]) -> None:
+        self.messages.append(message)
+
+
+async def check(args: argparse.Namespace, timeout: float = 10.0) -> None:
+    """
+    Send a sentence from a gateway session through the ``llm`` queue, an LLM
+    worker and the reply stream, all in this process on a MemoryBackend.
+
+    Raises:
+        RuntimeError: If the answer does not reach the session, or the
+            exchange is not stored
+    """
+    from loadtest import FakeMistral
+    from server.gateway import Gateway
+    from sessions import SessionManager
+
+    client = connect(MEMORY_URL)
+    store = HistoryStore(client)
+    gateway = Gateway(client, store=store, gateway_id="check", partitions=args.partitions)
+    queue = WorkQueue(client, "llm", partitions=args.partitions)
+    llm_factory = SessionManager.shared_llm_factory(FakeMistral(latency=args.fake_llm or 0.05))
+    worker = LLMWorker(llm_factory, queue, Replies(client), store=store)
+    consumer = asyncio.create_task(queue.consume("check", queue.owned(0, 1), worker.handle))
+    await gateway.start()
+    try:
+        inbox = _Inbox()
+        session = await gateway.open(inbox)
+        session.respond("my son is bleeding a lot from his arm")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while session.busy and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        kinds = [message["type"] for message in inbox.messages]
+        if "response" not in kinds:
+            raise RuntimeError(f"No answer within {timeout}s; the session got {kinds}")
+        record = await store.load_session(session.token)
+        if record is None or record.next_index != 2:
+            raise RuntimeError("The exchange was not stored under the session token")
+        print(f"Check passed: the session got {kinds}, stats {queue.stats.as_dict()}")
+    finally:
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        await gateway.stop()
+
+
+async def run(args: argparse.Namespace) -> None:
+    if args.role == "check":
+        await check(args)
+        return
+    client = connect(args.redis_url)
+    stt = WorkQueue(client, "stt", partitions=args.partitions)
+    llm = WorkQueue(client, "llm", partitions=args.partitions)
+    replies = Replies(client)
+    worker: Any
+    if args.role == "stt":
+        from model_registry import ModelRegistry
+
+        loop = asyncio.get_running_loop()
+        model = await loop.run_in_executor(
+            None, lambda: ModelRegistry().whisper(args.model, cpu_threads=args.cpu_threads)
+        )
+        worker = STTWorker(TranscriptionEngine(model, language="en"), stt, llm, replies)
+    else:
+        from sessions import SessionManager
+
+        client_llm = None
+        if args.fake_llm is not None:
+            from loadtest import FakeMistral
+
+            client_llm = FakeMistral(latency=args.fake_llm)
+        worker = LLMWorker(
+            SessionManager.shared_llm_factory(client_llm), llm, replies, store=HistoryStore(client)
+        )
+
+    if args.metrics_port:
+        tracer.start_http_server(args.metrics_port)
+    writer = asyncio.create_task(write_metrics(args.metrics_file)) if args.metrics_file else None
+
+    partitions = worker.queue.owned(args.index, args.count)
+    name = args.name or f"{args.role}-{args.index}"
+    print(f"{args.role.upper()} worker {name} consuming partitions {partitions}")
+    try:
+        await worker.queue.consume(name, partitions, worker.handle, concurrency=args.concurrency)
+    finally:
+        if writer is not None:
+            writer.cancel()
+        if args.role == "stt":
+            worker.engine.shutdown()
+        await client.aclose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="STT or LLM worker for the gateway work queues")
+    parser.add_argument("role", choices=("stt", "llm", "check"))
+    parser.add_argument("--index", type=int, default=0, help="Index of this worker")
+    parser.add_argument("--count", type=int, default=1, help="Number of workers of this role")
+    parser.add_argument("--name", default=None, help="Consumer name, stable across restarts")
+    parser.add_argument(
+        "--partitions", type=int, default=int(os.getenv("QUEUE_PARTITIONS", DEFAULT_PARTITIONS))
+    )
+    parser.add_argument("--concurrency", type=int, default=16, help="Jobs handled at once")
+    parser.add_argument("--redis-url", default=REDIS_URL, help="Redis shared with the gateways")
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.getenv("METRICS_PORT", 0)),
+        help="Serve the metrics on this port (0: off)",
+    )
+    parser.add_argument("--metrics-file", default=os.getenv("METRICS_FILE") or None)
+    parser.add_argument("--model", default=os.getenv("WHISPER_MODEL", "small"))
+    parser.add_argument(
+        "--cpu-threads", type=int, default=int(os.getenv("WHISPER_CPU_THREADS", 4))
+    )
+    parser.add_argument(
+        "--fake-llm", type=float, metavar="SECONDS", help="Answer with a local fake LLM of this latency"
+    )
+    args = parser.parse_args()
+    if args.role != "check" and args.redis_url == MEMORY_URL:
+        parser.error(f"{MEMORY_URL} is not shared with the gateways; use the check role")
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Worker stopped by user")
+
+
+if __name__ == "__main__":
+    main()
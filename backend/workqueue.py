@@ -0,0 +1,403 @@
+"""Redis Streams work queues between socket gateways and STT/LLM workers.
+
+A gateway (``python -m server --gateway``) only holds client connections and
+cuts their audio into utterances; each utterance is a job on the ``stt``
+queue, each transcribed sentence a job on the ``llm`` queue, and the workers
+of workers.py consume them. Gateways, STT workers and LLM workers therefore
+scale independently.
+
+- **Affinity.** A queue is ``partitions`` streams and a job goes to the one
+  picked by a hash of its key, the session token. Worker ``i`` of ``n`` owns
+  the partitions ``p % n == i`` (:meth:`WorkQueue.owned`), so a session's jobs
+  reach the same worker, in order; LLM workers keep the conversation in memory
+  between turns.
+- **At-least-once delivery.** Workers read through a consumer group and ack a
+  job once its handler returns. A restarted worker first replays its own
+  unacked jobs; jobs left idle for ``claim_idle`` seconds by a worker that is
+  gone are claimed by any other (``XAUTOCLAIM``). A job whose handler raises is
+  acked anyway, so one bad job cannot wedge its partition.
+- **Fan-back.** A job names the gateway and session that sent it; results go
+  to that gateway's ``replies:{gateway}`` stream (:class:`Replies`), which it
+  reads and dispatches to the session's socket. Redelivery can repeat a result:
+  gateways drop repeated final messages by origin, the ID of the utterance or
+  text message that started the work.
+
+:class:`redis_store.MemoryBackend` implements the stream commands used here,
+so gateway and workers can run in one process without Redis.
+"""
+
+import asyncio
+import json
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from tracing import Histogram, Tracer, tracer as default_tracer
+
+DEFAULT_PARTITIONS = 8
+# Jobs kept per partition stream, acked or not; older ones are trimmed.
+MAX_STREAM_LENGTH = 10_000
+# A job pending this long is assumed lost with its worker and handed to another.
+CLAIM_IDLE_SECONDS = 60.0
+# Reply streams of gateways that went away expire after this.
+REPLIES_TTL = 3600
+# Messages that end a piece of work; repeats of these are dropped by Replies.
+FINAL_TYPES = ("fullSentence", "transcribed", "response", "error")
+
+
+@dataclass
+class Job:
+    """One entry of a queue, as handed to a consumer's handler."""
+
+    id: str
+    stream: str
+    fields: dict[str, str]
+
+    @property
+    def key(self) -> str:
+        return self.fields.get("key", "")
+
+    @property
+    def origin(self) -> str:
+        """ID of the utterance or message this job descends from."""
+        return self.fields.get("origin") or self.id
+
+    def route(self) -> dict[str, str]:
+        """Fields telling where the results of this job and of the jobs it spawns go."""
+        return {
+            name: self.fields[name]
+            for name in ("key", "gateway", "session", "token", "origin", "trace_id")
+            if name in self.fields
+        }
+
+
+@dataclass
+class WorkStats:
+    handled: int = 0
+    failed: int = 0
+    claimed: int = 0
+    wait_seconds: float = 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        done = self.handled + self.failed
+        return {
+            "handled": self.handled,
+            "failed": self.failed,
+            "claimed": self.claimed,
+            "mean_wait_ms": 1e3 * self.wait_seconds / done if done else 0.0,
+        }
+
+
+class WorkQueue:
+    """A partitioned job queue on Redis Streams, consumed through one consumer group."""
+
+    def __init__(
+        self,
+        client: Any,
+        name: str,
+        *,
+        partitions: int = DEFAULT_PARTITIONS,
+        group: Optional[str] = None,
+        maxlen: int = MAX_STREAM_LENGTH,
+        claim_idle: float = CLAIM_IDLE_SECONDS,
+    ):
+        """
+        Initialize the queue.
+
+        Args:
+            client: ``redis.asyncio.Redis`` (with ``decode_responses=True``) or
+                :class:`redis_store.MemoryBackend`
+            name: Queue name; its streams are ``queue:{name}:{partition}``
+            partitions: Number of streams; every producer and consumer of the
+                queue must use the same number
+            group: Consumer group; defaults to ``{name}-workers``
+            maxlen: Entries kept per stream
+            claim_idle: Seconds a job may stay unacked before another worker
+                takes it over
+        """
+        self.client = client
+        self.name = name
+        self.partitions = partitions
+        self.group = group or f"{name}-workers"
+        self.maxlen = maxlen
+        self.claim_idle = claim_idle
+        self.stats = WorkStats()
+        self.wait_time: Optional[Histogram] = None
+        self._groups_ready: set[int] = set()
+
+    def partition(self, key: str) -> int:
+        return zlib.crc32(key.encode("utf-8")) % self.partitions
+
+    def stream(self, partition: int) -> str:
+        return f"queue:{self.name}:{partition}"
+
+    def owned(self, index: int, count: int) -> list[int]:
+        """Partitions owned by worker ``index`` of ``count``."""
+        if not 0 <= index < count:
+            raise ValueError(f"Worker index {index} out of range for {count} workers")
+        return [p for p in range(self.partitions) if p % count == index]
+
+    async def ensure_groups(self, partitions: Optional[Iterable[int]] = None) -> None:
+        """Create the consumer group of each partition, if not there yet."""
+        for partition in range(self.partitions) if partitions is None else partitions:
+            if partition in self._groups_ready:
+                continue
+            try:
+                await self.client.xgroup_create(
+                    self.stream(partition), self.group, id="0", mkstream=True
+                )
+            except Exception as e:
+                if not str(e).startswith("BUSYGROUP"):
+                    raise
+            self._groups_ready.add(partition)
+
+    async def put(self, key: str, fields: dict[str, Any]) -> str:
+        """
+        Queue a job on the partition of ``key``.
+
+        Returns:
+            The job ID
+        """
+        fields = {**fields, "key": key, "queued_at": repr(time.time())}
+        return await self.client.xadd(
+            self.stream(self.partition(key)), fields, maxlen=self.maxlen, approximate=True
+        )
+
+    async def pending(self) -> int:
+        """Jobs delivered to a worker and not acked yet, over all partitions."""
+        await self.ensure_groups()
+        total = 0
+        for partition in range(self.partitions):
+            total += (await self.client.xpending(self.stream(partition), self.group))["pending"]
+        return total
+
+    def register_metrics(self, tracer: Optional[Tracer] = None) -> None:
+        tracer = tracer or default_tracer
+        tracer.register(
+            "workqueue_jobs_total",
+            "counter",
+            "Jobs handled by this worker, by queue and result.",
+            lambda: {
+                f'queue="{self.name}",result="{result}"': value
+                for result, value in self.stats.as_dict().items()
+                if result in ("handled", "failed", "claimed")
+            },
+        )
+        self.wait_time = tracer.histogram(
+            "workqueue_wait_seconds", "Time from a job being queued to its handler starting."
+        )
+
+    async def consume(
+        self,
+        consumer: str,
+        partitions: Iterable[int],
+        handler: Callable[[Job], Awaitable[None]],
+        *,
+        concurrency: int = 16,
+        block: float = 1.0,
+    ) -> None:
+        """
+        Handle the jobs of ``partitions`` until cancelled.
+
+        Jobs run concurrently up to ``concurrency``, except that jobs with the
+        same key run one after the other, in queue order. A job is acked once
+        ``handler`` returns or raises; jobs still running when this is
+        cancelled stay pending and are delivered again.
+
+        Args:
+            consumer: Name of this worker in the consumer group; a worker
+                restarted under the same name replays its unacked jobs
+            partitions: Partitions owned by this worker (see :meth:`owned`)
+            handler: Called with each job
+            concurrency: Jobs handled at once
+            block: Seconds each read waits for new jobs
+        """
+        partitions = list(partitions)
+        await self.ensure_groups()
+        if self.wait_time is None:
+            self.register_metrics()
+        running: dict[str, asyncio.Task] = {}
+        # Last job of each key, which the next job of that key waits for.
+        tails: dict[str, asyncio.Task] = {}
+
+        def dispatch(stream: str, entries: list) -> None:
+            for entry_id, fields in entries:
+                if entry_id in running or not fields:
+                    continue
+                job = Job(entry_id, stream, fields)
+                task = asyncio.create_task(self._handle(job, handler, tails.get(job.key)))
+                running[entry_id] = tails[job.key] = task
+                task.add_done_callback(lambda t, job=job: self._done(job, t, running, tails))
+
+        try:
+            # Jobs this consumer was given before a restart come first.
+            for partition in partitions:
+                reply = await self.client.xreadgroup(
+                    self.group, consumer, {self.stream(partition): "0"}, count=concurrency
+                )
+                for stream, entries in reply:
+                    dispatch(stream, entries)
+
+            streams = {self.stream(p): ">" for p in partitions}
+            next_claim = time.monotonic() + self.claim_idle / 2
+            while True:
+                if len(running) >= concurrency:
+                    await asyncio.wait(list(running.values()), return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                if time.monotonic() >= next_claim:
+                    next_claim = time.monotonic() + self.claim_idle / 2
+                    for stream, entries in await self._claim(consumer, concurrency - len(running)):
+                        dispatch(stream, entries)
+                # Wake up in time for the next claim.
+                wait = min(block, max(next_claim - time.monotonic(), 0.001))
+                reply = await self.client.xreadgroup(
+                    self.group,
+                    consumer,
+                    streams,
+                    count=concurrency - len(running),
+                    block=int(wait * 1000) or 1,
+                )
+                for stream, entries in reply or []:
+                    dispatch(stream, entries)
+        finally:
+            for task in list(running.values()):
+                task.cancel()
+
+    async def _claim(self, consumer: str, count: int) -> list[tuple[str, list]]:
+        """Take over jobs left unacked for ``claim_idle`` by workers that are gone."""
+        claimed = []
+        # Any partition: the owner of a partition may be the worker that died.
+        for partition in range(self.partitions):
+            stream = self.stream(partition)
+            reply = await self.client.xautoclaim(
+                stream, self.group, consumer, int(self.claim_idle * 1000), count=count
+            )
+            entries = reply[1]
+            if entries:
+                self.stats.claimed += len(entries)
+                print(f"Queue {self.name}: claimed {len(entries)} stale jobs of {stream}")
+                claimed.append((stream, entries))
+        return claimed
+
+    async def _handle(
+        self, job: Job, handler: Callable[[Job], Awaitable[None]], previous: Optional[asyncio.Task]
+    ) -> None:
+        if previous is not None:
+            # Same key: keep queue order. The previous job's result does not matter.
+            await asyncio.wait([previous])
+        queued_at = float(job.fields.get("queued_at", time.time()))
+        wait = max(time.time() - queued_at, 0.0)
+        if self.wait_time is not None:
+            self.wait_time.observe(wait)
+        self.stats.wait_seconds += wait
+        try:
+            await handler(job)
+            self.stats.handled += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.stats.failed += 1
+            print(f"Queue {self.name}: job {job.id} failed: {e}")
+        await self.client.xack(job.stream, self.group, job.id)
+
+    @staticmethod
+    def _done(
+        job: Job,
+        task: asyncio.Task,
+        running: dict[str, asyncio.Task],
+        tails: dict[str, asyncio.Task],
+    ) -> None:
+        running.pop(job.id, None)
+        if tails.get(job.key) is task:
+            del tails[job.key]
+        if not task.cancelled() and task.exception() is not None:
+            # Only the ack itself can fail here; the job will be redelivered.
+            print(f"Queue {job.stream}: could not ack job {job.id}: {task.exception()}")
+
+
+class Replies:
+    """Per-gateway result streams, carrying worker results back to the right socket."""
+
+    def __init__(self, client: Any, *, maxlen: int = MAX_STREAM_LENGTH, seen: int = 4096):
+        """
+        Initialize the reply streams.
+
+        Args:
+            client: ``redis.asyncio.Redis`` or :class:`redis_store.MemoryBackend`
+            maxlen: Entries kept per gateway stream
+            seen: Final messages remembered to drop repeats of
+        """
+        self.client = client
+        self.maxlen = maxlen
+        self.duplicates = 0
+        self._seen: OrderedDict[tuple[str, str, str], None] = OrderedDict()
+        self._seen_max = seen
+
+    @staticmethod
+    def stream(gateway: str) -> str:
+        return f"replies:{gateway}"
+
+    async def send(self, job: Job, message: dict[str, Any]) -> None:
+        """Send ``message`` to the session that ``job`` came from."""
+        stream = self.stream(job.fields["gateway"])
+        pipe = self.client.pipeline(transaction=False)
+        pipe.xadd(
+            stream,
+            {
+                "session": job.fields.get("session", ""),
+                "origin": job.origin,
+                "message": json.dumps(message, ensure_ascii=False),
+            },
+            maxlen=self.maxlen,
+            approximate=True,
+        )
+        pipe.expire(stream, REPLIES_TTL)
+        await pipe.execute()
+
+    async def listen(
+        self,
+        gateway: str,
+        deliver: Callable[[str, str, dict[str, Any]], Awaitable[None]],
+        *,
+        block: float = 1.0,
+    ) -> None:
+        """
+        Call ``deliver(session, origin, message)`` for each result sent to
+        ``gateway`` from now on, until cancelled. Repeated final messages
+        (see ``FINAL_TYPES``) are dropped. Messages are delivered one at a
+        time, so ``deliver`` should hand them off (see
+        :meth:`server.gateway.Gateway._deliver`) rather than wait on a socket.
+        """
+        stream = self.stream(gateway)
+        last = "$"
+        while True:
+            try:
+                reply = await self.client.xread({stream: last}, count=100, block=int(block * 1000))
+            except Exception as e:
+                print(f"Replies of {gateway}: read failed: {e}")
+                await asyncio.sleep(block)
+                continue
+            for _, entries in reply or []:
+                for entry_id, fields in entries:
+                    last = entry_id
+                    message = json.loads(fields["message"])
+                    if self._repeated(fields["session"], fields["origin"], message.get("type", "")):
+                        continue
+                    try:
+                        await deliver(fields["session"], fields["origin"], message)
+                    except Exception as e:
+                        print(f"Replies of {gateway}: could not deliver {entry_id}: {e}")
+
+    def _repeated(self, session: str, origin: str, kind: str) -> bool:
+        if kind not in FINAL_TYPES:
+            return False
+        key = (session, origin, kind)
+        if key in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen[key] = None
+        if len(self._seen) > self._seen_max:
+            self._seen.popitem(last=False)
+        return False